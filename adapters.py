@@ -0,0 +1,401 @@
+"""
+Input adapters that read records from different dataset formats.
+
+Every adapter lists the keys of its records lazily, returns a lightweight summary of a record
+(atomic numbers, total charge, spin multiplicity) for queue setup and dataset statistics, and
+loads the full record as a DataPointFromHDF5 when a worker runs it. Records are only read when
+they are requested, so large inputs are never loaded into memory as a whole.
+
+Supported formats (the dataset_format of a campaign):
+
+- "modelforge_hdf5": a modelforge HDF5 file with one group per record; the names of the datasets
+  can be changed with the "properties" option for datasets that do not use the tmQM layout.
+- "xyz": a directory of XYZ or extended XYZ files, one record per file; each frame is a configuration.
+- "ase_db": an ASE database, one record per row.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
+
+adapter_names = ["modelforge_hdf5", "xyz", "ase_db"]
+
+
+@dataclass
+class RecordSummary:
+    """
+    dataclass for storing the fields of a record needed to set up a campaign (no geometry)
+    """
+
+    atomic_numbers: np.ndarray
+    total_charge: float
+    spin_multiplicity: int
+    n_configs: int = 1  # number of starting conformers
+
+
+def _datapoint(key, atomic_numbers, geometry_angstrom, total_charge, spin_multiplicity, stoichiometry=None):
+    """
+    Build a DataPointFromHDF5 from plain arrays, with the shapes used by the modelforge files.
+    """
+    from openff.units import unit
+    from xtb_config_gen import DataPointFromHDF5
+
+    geometry = np.asarray(geometry_angstrom, dtype=np.float64)
+    n_configs = geometry.shape[0]
+    atomic_numbers = np.asarray(atomic_numbers).reshape(-1, 1)
+    if stoichiometry is None:
+        from ase import Atoms
+
+        stoichiometry = Atoms(numbers=atomic_numbers.reshape(-1)).get_chemical_formula()
+
+    return DataPointFromHDF5(
+        name=key,
+        n_configs=n_configs,
+        spin_multiplicity=np.full((n_configs, 1), int(spin_multiplicity)),
+        stoichiometry=stoichiometry,
+        atomic_numbers=atomic_numbers,
+        geometry=geometry * unit.angstrom,
+        total_charge=np.full((n_configs, 1), float(total_charge)) * unit.elementary_charge,
+    )
+
+
+class InputAdapter(ABC):
+    """
+    Common interface of the input adapters.
+
+    Adapters are created from the dataset path and plain options, so they can be recreated in
+    child processes; open files are created on first use.
+    """
+
+    @abstractmethod
+    def keys(self):
+        """
+        Iterate over the keys of the records.
+        """
+
+    @abstractmethod
+    def summary(self, key: str) -> RecordSummary:
+        """
+        Atomic numbers, total charge and spin multiplicity of a record.
+        """
+
+    @abstractmethod
+    def load(self, key: str):
+        """
+        Load a record as a DataPointFromHDF5.
+        """
+
+    def geometry(self, key: str):
+        """
+        Starting geometries of a record in angstrom, shape (n_configs, n_atoms, 3).
+
+        Used to hash the conformers of every record (see dataset_stats.py); adapters read only the
+        positions rather than loading the whole record where they can.
+        """
+        return self.load(key).geometry.m_as("angstrom")
+
+    def first_key(self):
+        return next(iter(self.keys()))
+
+    def signature(self):
+        """
+        Size and modification time of the input, used to invalidate cached statistics.
+        """
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ModelforgeHDF5Adapter(InputAdapter):
+    """
+    Reads a modelforge HDF5 file with one group per record.
+
+    Parameters
+    ----------
+    path: str, required
+        Path to the HDF5 file.
+    properties: dict, optional, default=None
+        Names of the datasets in each group, for the entries "atomic_numbers", "geometry",
+        "total_charge" and "spin_multiplicity"; the tmQM names are used for entries not given.
+        Records without a total charge or spin multiplicity dataset are treated as neutral singlets.
+    """
+
+    default_properties = {
+        "atomic_numbers": "atomic_numbers",
+        "geometry": "geometry",
+        "total_charge": "total_charge",
+        "spin_multiplicity": "spin_multiplicity",
+    }
+
+    def __init__(self, path: str, properties: dict = None):
+        self.path = path
+        self.properties = dict(self.default_properties)
+        self.properties.update(properties or {})
+        self._file = None
+
+    @property
+    def file(self):
+        if self._file is None:
+            import h5py
+
+            self._file = h5py.File(self.path, "r")
+        return self._file
+
+    def keys(self):
+        return iter(self.file.keys())
+
+    def _scalar(self, record, name, default):
+        name = self.properties[name]
+        if name not in record:
+            return default
+        return np.asarray(record[name][()]).reshape(-1)[0]
+
+    def summary(self, key):
+        record = self.file[key]
+        geometry = record[self.properties["geometry"]]
+        return RecordSummary(
+            atomic_numbers=record[self.properties["atomic_numbers"]][()].reshape(-1),
+            total_charge=float(self._scalar(record, "total_charge", 0.0)),
+            spin_multiplicity=int(self._scalar(record, "spin_multiplicity", 1)),
+            n_configs=geometry.shape[0] if geometry.ndim == 3 else 1,
+        )
+
+    def geometry(self, key):
+        from openff.units import unit
+
+        geometry = self.file[key][self.properties["geometry"]]
+        # converted as the loaded record is, so the conformer hashes are the same
+        return (geometry[()] * unit.Unit(geometry.attrs.get("u", "angstrom"))).m_as(
+            "angstrom"
+        )
+
+    def load(self, key):
+        if self.properties == self.default_properties:
+            from xtb_config_gen import load_config
+
+            return load_config(self.file, key)
+
+        from openff.units import unit
+
+        record = self.file[key]
+        summary = self.summary(key)
+        geometry = record[self.properties["geometry"]]
+        geometry_angstrom = (
+            (geometry[()] * unit.Unit(geometry.attrs.get("u", "angstrom")))
+            .to("angstrom")
+            .magnitude.reshape(-1, summary.atomic_numbers.size, 3)
+        )
+        return _datapoint(
+            key,
+            summary.atomic_numbers,
+            geometry_angstrom,
+            summary.total_charge,
+            summary.spin_multiplicity,
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _info_value(info: dict, names, default):
+    for name in names:
+        if name in info:
+            return info[name]
+    return default
+
+
+_charge_names = ["total_charge", "charge"]
+_compression_extensions = [".gz", ".bz2", ".xz"]
+_multiplicity_names = ["spin_multiplicity", "multiplicity"]
+
+
+class XYZDirectoryAdapter(InputAdapter):
+    """
+    Reads a directory of XYZ or extended XYZ files, one record per file, keyed by the file name without extension
+    (and without a compression extension, e.g., "mol_1" for "mol_1.xyz.gz").
+
+    All frames of a file are configurations of the same record. The total charge and spin multiplicity
+    are read from the comment line of extended XYZ files ("charge"/"total_charge", "multiplicity"/"spin_multiplicity");
+    otherwise the record is treated as a neutral singlet.
+
+    Parameters
+    ----------
+    path: str, required
+        Path to the directory.
+    pattern: str, optional, default="*.xyz"
+        Glob pattern of the files to read (e.g., "*.extxyz").
+    """
+
+    def __init__(self, path: str, pattern: str = "*.xyz"):
+        self.path = path
+        self.pattern = pattern
+        self._paths = None
+
+    def _files(self):
+        # path of each file matching the pattern, keyed by record; found once per adapter
+        import glob
+
+        if self._paths is None:
+            paths = {}
+            for file_path in sorted(glob.iglob(os.path.join(self.path, self.pattern))):
+                name, extension = os.path.splitext(os.path.basename(file_path))
+                if extension in _compression_extensions:
+                    name = os.path.splitext(name)[0]
+                if name in paths:
+                    raise ValueError(
+                        f"{paths[name]} and {file_path} would both be read as record {name}"
+                    )
+                paths[name] = file_path
+            self._paths = paths
+        return self._paths
+
+    def _file_path(self, key):
+        return self._files()[key]
+
+    def keys(self):
+        return iter(self._files())
+
+    def summary(self, key):
+        from ase.io import iread
+
+        frames = iread(self._file_path(key), index=":")
+        atoms = next(frames)
+        return RecordSummary(
+            atomic_numbers=atoms.get_atomic_numbers(),
+            total_charge=float(_info_value(atoms.info, _charge_names, 0.0)),
+            spin_multiplicity=int(_info_value(atoms.info, _multiplicity_names, 1)),
+            n_configs=1 + sum(1 for _ in frames),
+        )
+
+    def geometry(self, key):
+        from ase.io import iread
+
+        return np.array(
+            [atoms.get_positions() for atoms in iread(self._file_path(key), index=":")]
+        )
+
+    def load(self, key):
+        from ase.io import iread
+
+        frames = iread(self._file_path(key), index=":")
+        first = next(frames)
+        geometry = [first.get_positions()] + [atoms.get_positions() for atoms in frames]
+        return _datapoint(
+            key,
+            first.get_atomic_numbers(),
+            geometry,
+            _info_value(first.info, _charge_names, 0.0),
+            _info_value(first.info, _multiplicity_names, 1),
+            stoichiometry=first.get_chemical_formula(),
+        )
+
+    def signature(self):
+        sizes, mtimes = 0, 0
+        for file_path in self._files().values():
+            stat = os.stat(file_path)
+            sizes += stat.st_size
+            mtimes = max(mtimes, stat.st_mtime_ns)
+        return np.array([sizes, mtimes], dtype=np.int64)
+
+
+class ASEDatabaseAdapter(InputAdapter):
+    """
+    Reads an ASE database, one record per row, keyed by the row id (or by a key-value pair given as key_name).
+
+    The total charge and spin multiplicity are read from the key-value pairs of each row
+    ("charge"/"total_charge", "multiplicity"/"spin_multiplicity"); otherwise the record is treated as a neutral singlet.
+
+    Parameters
+    ----------
+    path: str, required
+        Path to the database.
+    key_name: str, optional, default=None
+        Key-value pair used as the key of a record; must be unique. If None, the row id is used.
+    """
+
+    def __init__(self, path: str, key_name: str = None):
+        self.path = path
+        self.key_name = key_name
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            from ase.db import connect
+
+            self._db = connect(self.path)
+        return self._db
+
+    def keys(self):
+        if self.key_name is None:
+            return (str(row.id) for row in self.db.select(include_data=False))
+        return (
+            str(row.key_value_pairs[self.key_name])
+            for row in self.db.select(self.key_name, include_data=False)
+        )
+
+    def _row(self, key):
+        if self.key_name is None:
+            return self.db.get(id=int(key))
+        return self.db.get(**{self.key_name: key})
+
+    def summary(self, key):
+        row = self._row(key)
+        return RecordSummary(
+            atomic_numbers=np.asarray(row.numbers),
+            total_charge=float(_info_value(row.key_value_pairs, _charge_names, 0.0)),
+            spin_multiplicity=int(
+                _info_value(row.key_value_pairs, _multiplicity_names, 1)
+            ),
+        )
+
+    def geometry(self, key):
+        return np.asarray(self._row(key).positions)[np.newaxis]
+
+    def load(self, key):
+        row = self._row(key)
+        return _datapoint(
+            key,
+            row.numbers,
+            np.asarray(row.positions)[np.newaxis],
+            _info_value(row.key_value_pairs, _charge_names, 0.0),
+            _info_value(row.key_value_pairs, _multiplicity_names, 1),
+            stoichiometry=row.formula,
+        )
+
+
+def open_adapter(dataset_format: str, path: str, options: dict = None):
+    """
+    Create the input adapter for a dataset.
+
+    Parameters
+    ----------
+    dataset_format: str, required
+        One of adapter_names.
+    path: str, required
+        Path to the dataset (a file, or a directory for "xyz").
+    options: dict, optional, default=None
+        Keyword arguments of the adapter (e.g., properties for "modelforge_hdf5", pattern for "xyz").
+    """
+    options = options or {}
+    if dataset_format == "modelforge_hdf5":
+        return ModelforgeHDF5Adapter(path, **options)
+    if dataset_format == "xyz":
+        return XYZDirectoryAdapter(path, **options)
+    if dataset_format == "ase_db":
+        return ASEDatabaseAdapter(path, **options)
+    raise ValueError(
+        f"dataset_format {dataset_format} not supported; options are {adapter_names}"
+    )
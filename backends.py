@@ -0,0 +1,340 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
+from ase.calculators.calculator import Calculator, all_changes
+
+backend_names = ["ase", "tblite"]
+
+
+@dataclass
+class XTBResult:
+    """
+    dataclass for storing the result of a single point calculation, in ASE units
+    """
+
+    energy: float  # eV
+    forces: np.ndarray  # eV/angstrom
+    charges: np.ndarray  # e
+    dipole: np.ndarray  # e*angstrom
+
+
+class XTBBackend(ABC):
+    """
+    Common interface of the backends used to evaluate xtb energetics for a single molecule.
+
+    A backend is created for one molecule (atomic numbers, charge, multiplicity) and one set of settings
+    (method, accuracy); compute can then be called repeatedly with new positions.
+
+    Parameters
+    ----------
+    numbers: np.ndarray, required
+        Atomic numbers.
+    positions: np.ndarray, required
+        Initial positions in angstrom.
+    charge: float, required
+        Total charge.
+    multiplicity: int, optional, default=None
+        Spin multiplicity; if None, tblite treats the system as closed shell.
+    method: str, optional, default="GFN2-xTB"
+        xtb method.
+    accuracy: float, optional, default=1.0
+        tblite numerical accuracy.
+    max_iterations: int, optional, default=250
+        Maximum number of SCF iterations.
+    """
+
+    def __init__(
+        self,
+        numbers: np.ndarray,
+        positions: np.ndarray,
+        charge: float,
+        multiplicity: int = None,
+        method: str = "GFN2-xTB",
+        accuracy: float = 1.0,
+        max_iterations: int = 250,
+    ):
+        self.numbers = np.asarray(numbers).reshape(-1)
+        self.parameters = {
+            "method": method,
+            "charge": charge,
+            "multiplicity": multiplicity,
+            "accuracy": accuracy,
+            "max_iterations": max_iterations,
+        }
+
+    @abstractmethod
+    def compute(self, positions: np.ndarray) -> XTBResult:
+        """
+        Evaluate energy, forces, charges and dipole moment at the given positions (angstrom).
+        """
+
+    def energy_and_forces(self, positions: np.ndarray):
+        """
+        Evaluate energy (eV) and forces (eV/angstrom); used as the force function of BAOABLangevin.
+        """
+        result = self.compute(positions)
+        return result.energy, result.forces
+
+    def ase_calculator(self):
+        """
+        ASE calculator evaluating this backend, e.g., to drive ase.md.Langevin.
+        """
+        return BackendCalculator(self)
+
+    @abstractmethod
+    def reset_guess(self):
+        """
+        Discard the wavefunction of the previous evaluation, so the next SCF starts from the default guess.
+        """
+
+
+class ASEBackend(XTBBackend):
+    """
+    Backend that evaluates properties through the tblite ASE calculator.
+
+    An existing TBLite calculator with the same settings can be passed as calc to be reused;
+    it is reset before being attached to the molecule.
+    """
+
+    def __init__(self, numbers, positions, charge, multiplicity=None, calc=None, **kwargs):
+        super().__init__(numbers, positions, charge, multiplicity, **kwargs)
+        from ase import Atoms
+
+        if calc is None:
+            calc = self._create_calculator()
+        else:
+            calc.reset()
+        self.calc = calc
+        self._atoms = Atoms(numbers=self.numbers, positions=positions)
+        self._atoms.calc = self.calc
+
+    def _create_calculator(self):
+        from tblite.ase import TBLite
+
+        return TBLite(
+            method=self.parameters["method"],
+            max_iterations=self.parameters["max_iterations"],
+            charge=self.parameters["charge"],
+            accuracy=self.parameters["accuracy"],
+            verbosity=0,
+            multiplicity=self.parameters["multiplicity"],
+        )
+
+    def ase_calculator(self):
+        return self.calc
+
+    def reset_guess(self):
+        # reset keeps the previous result (the restart guess) while cache_api is set, so it is
+        # turned off for one reset; the same calculator stays attached
+        self.calc.set(cache_api=False)
+        self.calc.set(cache_api=True)
+
+    def compute(self, positions):
+        self._atoms.set_positions(positions)
+        return XTBResult(
+            energy=self._atoms.get_potential_energy(),
+            forces=self._atoms.get_forces(),
+            charges=self._atoms.get_charges(),
+            dipole=self._atoms.get_dipole_moment(),
+        )
+
+
+class TBLiteBackend(XTBBackend):
+    """
+    Backend that drives tblite.interface.Calculator directly, bypassing the ASE calculator layer.
+
+    The tblite calculator is constructed once, positions are updated in place, and energy, gradient,
+    charges and dipole are read from the same evaluation. The previous result is passed back to
+    tblite so its wavefunction is used as the initial guess, as the ASE calculator does.
+    """
+
+    def __init__(self, numbers, positions, charge, multiplicity=None, **kwargs):
+        super().__init__(numbers, positions, charge, multiplicity, **kwargs)
+        from tblite.interface import Calculator
+        from ase.units import Bohr, Hartree, kB
+
+        self._bohr = Bohr
+        self._hartree = Hartree
+        uhf = None if multiplicity is None else int(multiplicity) - 1
+        self._calc = Calculator(
+            self.parameters["method"],
+            self.numbers,
+            np.asarray(positions, dtype=np.float64) / Bohr,
+            charge,
+            uhf,
+        )
+        self._calc.set("accuracy", self.parameters["accuracy"])
+        self._calc.set("max-iter", self.parameters["max_iterations"])
+        # same electronic temperature as the default of the ASE calculator
+        self._calc.set("temperature", 300.0 * kB / Hartree)
+        self._calc.set("verbosity", 0)
+        self._result = None
+
+    def reset_guess(self):
+        self._result = None
+
+    def compute(self, positions):
+        self._calc.update(np.asarray(positions, dtype=np.float64) / self._bohr)
+        self._result = self._calc.singlepoint(self._result)
+        return XTBResult(
+            energy=float(self._result["energy"]) * self._hartree,
+            forces=self._result["gradient"] * (-self._hartree / self._bohr),
+            charges=self._result["charges"].copy(),
+            dipole=self._result["dipole"] * self._bohr,
+        )
+
+
+def create_backend(name: str, numbers, positions, charge, multiplicity=None, **kwargs):
+    """
+    Create a backend by name ("ase" or "tblite").
+    """
+    if name == "ase":
+        return ASEBackend(numbers, positions, charge, multiplicity, **kwargs)
+    if name == "tblite":
+        return TBLiteBackend(numbers, positions, charge, multiplicity, **kwargs)
+    raise ValueError(f"backend {name} not supported; options are {backend_names}")
+
+
+def unpaired_electrons(numbers, charge: float, multiplicity: int):
+    """
+    Number of unpaired electrons (uhf) for a spin multiplicity, checked against the number of electrons.
+
+    Raises
+    ------
+    ValueError
+        If the multiplicity is not possible for the number of electrons of the molecule.
+    """
+    uhf = int(multiplicity) - 1
+    n_electrons = int(np.sum(numbers)) - int(round(charge))
+    if uhf < 0 or (n_electrons - uhf) % 2 != 0:
+        raise ValueError(
+            f"spin multiplicity {multiplicity} is not possible with {n_electrons} electrons"
+        )
+    return uhf
+
+
+class CalculatorFactory:
+    """
+    Creates the backends of each record with the charge and spin multiplicity of the record,
+    reusing the calculators created for earlier records.
+
+    One calculator is kept per (method, accuracy, charge, multiplicity): a backend for the same
+    molecule is reused as is (only the positions change, e.g., between the calibration run and the MD
+    of a record), and for a new molecule the cached ASE calculator is reset and reattached rather than
+    constructed again. Runs reset the SCF guess of the calculators they use (see XTBBackend.reset_guess),
+    so the wavefunction of a previous run is never reused.
+    The factory is meant to live as long as the worker process, see get_calculator_factory.
+
+    Parameters
+    ----------
+    backend: str, optional, default="ase"
+        Backend to create, "ase" or "tblite".
+    method: str, optional, default="GFN2-xTB"
+        xtb method.
+    max_iterations: int, optional, default=250
+        Maximum number of SCF iterations.
+    """
+
+    def __init__(self, backend: str = "ase", method: str = "GFN2-xTB", max_iterations: int = 250):
+        if backend not in backend_names:
+            raise ValueError(f"backend {backend} not supported; options are {backend_names}")
+        self.backend = backend
+        self.method = method
+        self.max_iterations = max_iterations
+        self._backends = {}
+
+    def settings(self, numbers, charge: float, multiplicity: int, accuracy: float):
+        """
+        Settings used for a record, as recorded with its results.
+        """
+        return {
+            "backend": self.backend,
+            "method": self.method,
+            "accuracy": float(accuracy),
+            "charge": float(charge),
+            "multiplicity": None if multiplicity is None else int(multiplicity),
+            "uhf": None
+            if multiplicity is None
+            else unpaired_electrons(numbers, charge, multiplicity),
+        }
+
+    def create(self, numbers, positions, charge: float, multiplicity: int, accuracy: float):
+        """
+        Return a backend for the molecule with the given settings.
+
+        Parameters
+        ----------
+        numbers: np.ndarray, required
+            Atomic numbers.
+        positions: np.ndarray, required
+            Positions in angstrom.
+        charge: float, required
+            Total charge.
+        multiplicity: int, required
+            Spin multiplicity; if None, the molecule is treated as closed shell.
+        accuracy: float, required
+            tblite numerical accuracy.
+        """
+        numbers = np.asarray(numbers).reshape(-1)
+        if multiplicity is not None:
+            multiplicity = int(round(multiplicity))
+            unpaired_electrons(numbers, charge, multiplicity)
+        key = (self.method, float(accuracy), float(charge), multiplicity)
+
+        cached = self._backends.get(key)
+        if cached is not None and np.array_equal(cached.numbers, numbers):
+            return cached
+
+        kwargs = dict(
+            method=self.method, accuracy=accuracy, max_iterations=self.max_iterations
+        )
+        if self.backend == "ase" and cached is not None:
+            kwargs["calc"] = cached.calc
+        backend = create_backend(
+            self.backend, numbers, positions, charge, multiplicity, **kwargs
+        )
+        self._backends[key] = backend
+        return backend
+
+
+# factories of this process, see get_calculator_factory
+_calculator_factories = {}
+
+
+def get_calculator_factory(backend: str = "ase", method: str = "GFN2-xTB"):
+    """
+    Return the CalculatorFactory of this process for a backend and method, creating it on first use,
+    so a worker that runs many records keeps its calculators between them.
+    """
+    key = (backend, method)
+    if key not in _calculator_factories:
+        _calculator_factories[key] = CalculatorFactory(backend, method)
+    return _calculator_factories[key]
+
+
+class BackendCalculator(Calculator):
+    """
+    Minimal ASE calculator wrapping a backend, so ase.md.Langevin can be driven by it.
+
+    Parameters
+    ----------
+    backend: XTBBackend, required
+        Backend used to evaluate the properties.
+    """
+
+    implemented_properties = ["energy", "free_energy", "forces", "charges", "dipole"]
+
+    def __init__(self, backend: XTBBackend):
+        Calculator.__init__(self)
+        self.backend = backend
+        self.parameters.update(backend.parameters)
+
+    def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+        result = self.backend.compute(self.atoms.positions)
+        self.results["energy"] = result.energy
+        self.results["free_energy"] = result.energy
+        self.results["forces"] = result.forces
+        self.results["charges"] = result.charges
+        self.results["dipole"] = result.dipole
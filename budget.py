@@ -0,0 +1,184 @@
+from sqlitedict import SqliteDict
+
+from utils import lock_with_retries
+
+
+def choose_sampling(
+    step_cost: float,
+    single_point_cost: float,
+    budget_seconds: float,
+    target_steps: int,
+    target_repeats: int,
+    min_steps: int = 10,
+    min_repeats: int = 1,
+):
+    """
+    Choose the number of MD steps and repeats that fit in the budget.
+
+    The cost of a run is estimated as repeats * steps * step_cost + (repeats + 1) * single_point_cost.
+    The number of steps between snapshots is kept at the target where possible, since it sets
+    how decorrelated the snapshots are; the number of repeats is reduced first, and only if even
+    min_repeats does not fit are the steps reduced (down to min_steps).
+    The sampling never exceeds the target.
+
+    Parameters
+    ----------
+    step_cost: float, required
+        Measured seconds per MD step.
+    single_point_cost: float, required
+        Measured seconds per single point calculation used for the stored properties.
+    budget_seconds: float, required
+        Walltime available for the run.
+    target_steps: int, required
+        Number of MD steps between snapshots requested by the campaign.
+    target_repeats: int, required
+        Number of snapshots requested by the campaign.
+    min_steps: int, optional, default=10
+        Lower bound on the number of steps between snapshots.
+    min_repeats: int, optional, default=1
+        Lower bound on the number of snapshots.
+
+    Returns
+    -------
+    tuple of int
+        (number_of_steps, number_of_repeats)
+    """
+
+    def cost_per_repeat(steps):
+        return steps * step_cost + single_point_cost
+
+    # the initial point is always evaluated
+    available = budget_seconds - single_point_cost
+
+    steps = target_steps
+    repeats = int(available // cost_per_repeat(steps)) if available > 0 else 0
+    if repeats >= min_repeats:
+        return steps, min(repeats, target_repeats)
+
+    repeats = min_repeats
+    steps = int((available / repeats - single_point_cost) // step_cost)
+    steps = max(min(steps, target_steps), min_steps)
+    return steps, repeats
+
+
+def estimate_run_cost(
+    step_cost: float, single_point_cost: float, number_of_steps: int, number_of_repeats: int
+):
+    """
+    Estimated seconds for a run_xtb_calc call with the given sampling.
+    """
+    return (
+        number_of_repeats * number_of_steps * step_cost
+        + (number_of_repeats + 1) * single_point_cost
+    )
+
+
+def prior_step_cost(n_atoms: int):
+    """
+    Rough prior for the seconds per MD step of a record with n_atoms atoms (single thread, accuracy 2),
+    used to size batches before any timings are available.
+    """
+    return 1.0e-5 * n_atoms**2
+
+
+def estimate_job_seconds(n_atoms: int, number_of_steps: int, number_of_repeats: int):
+    """
+    Prior estimate of the walltime of a run_xtb_calc call, with single points costing twice an MD step.
+    """
+    step_cost = prior_step_cost(n_atoms)
+    return estimate_run_cost(step_cost, 2.0 * step_cost, number_of_steps, number_of_repeats)
+
+
+def estimate_memory_mb(n_atoms: int):
+    """
+    Rough estimate of the peak resident memory (MB) of a worker running a record with n_atoms atoms:
+    a fixed cost for the interpreter and libraries plus the dense matrices of tblite, which grow with n_atoms**2.
+    The measured peak of each job is stored in its metadata ("peak_rss_mb") and can be used to refine this.
+    """
+    return 150.0 + 0.01 * n_atoms**2
+
+
+class CampaignBudget:
+    """
+    Tracks a total CPU-hour budget shared by all workers of a campaign.
+
+    Each job is allocated an equal share of the unallocated budget when it starts, shared with the
+    jobs left in the queue and the jobs claimed by workers (e.g., in batches) that have not been
+    allocated yet; once it finishes, the difference between the allocation and the time actually used is
+    returned to (or taken from) the pool, so later jobs absorb any over- or underspend.
+    The state is kept in the "budget" table of the campaign database, and the allocation of each job
+    in the "budget_allocations" table.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    total_cpu_hours: float, required
+        Total budget of the campaign, in CPU hours; a job with several threads is charged its walltime
+        times its number of threads (see campaign.compute_job).
+    """
+
+    def __init__(self, database_path: str, lockfile_path: str, total_cpu_hours: float):
+        self._database_path = database_path
+        self._lockfile_path = lockfile_path
+        self.total_seconds = total_cpu_hours * 3600.0
+
+    def allocate(self, key: str = None):
+        """
+        Reserve the budget for a job that is about to start.
+
+        Parameters
+        ----------
+        key: str, optional, default=None
+            Key of the job, which has already been claimed; recorded so other claimed jobs that are
+            still waiting for their allocation can be counted.
+
+        Returns
+        -------
+        float
+            Seconds allocated to the job.
+        """
+        with lock_with_retries(self._lockfile_path):
+            remaining_jobs = 0
+            claimed = set()
+            with SqliteDict(
+                self._database_path, tablename="status", autocommit=True
+            ) as status_db:
+                for job, status in status_db.items():
+                    if status in ["not_submitted", "deferred"]:
+                        remaining_jobs += 1
+                    elif status == "submitted":
+                        claimed.add(job)
+            with SqliteDict(
+                self._database_path, tablename="budget_allocations", autocommit=True
+            ) as allocations_db:
+                # claimed jobs allocated earlier (running, or completed but not yet written)
+                allocated_jobs = {job for job in allocations_db.keys() if job in claimed}
+                # at least 1, as the job requesting the allocation has already been claimed
+                unallocated_jobs = max(len(claimed - allocated_jobs - {key}) + 1, 1)
+                with SqliteDict(
+                    self._database_path, tablename="budget", autocommit=True
+                ) as budget_db:
+                    allocated = budget_db.get("allocated", 0.0)
+                    share = max(self.total_seconds - allocated, 0.0) / (
+                        remaining_jobs + unallocated_jobs
+                    )
+                    budget_db["allocated"] = allocated + share
+                if key is not None:
+                    allocations_db[key] = share
+        return share
+
+    def settle(self, allocated_seconds: float, used_seconds: float):
+        """
+        Record the time a job actually used against its allocation.
+        """
+        with lock_with_retries(self._lockfile_path):
+            with SqliteDict(
+                self._database_path, tablename="budget", autocommit=True
+            ) as budget_db:
+                budget_db["allocated"] = (
+                    budget_db.get("allocated", 0.0) - allocated_seconds + used_seconds
+                )
+                budget_db["used"] = budget_db.get("used", 0.0) + used_seconds
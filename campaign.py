@@ -0,0 +1,1196 @@
+"""
+Command line interface for running a campaign defined in a single TOML or YAML file.
+
+Usage
+-----
+python campaign.py setup campaigns/tmqm_T400.toml
+python campaign.py run campaigns/tmqm_T400.toml --n-jobs 10
+python campaign.py single campaigns/tmqm_T400.toml --key <key>
+python campaign.py export campaigns/tmqm_T400.toml
+"""
+
+import os
+from dataclasses import dataclass, fields
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+
+output_backends = ["hdf5"]
+worker_modes = ["serial", "pipelined", "forkserver"]
+export_modes = ["full", "incremental"]
+samplers = ["md", "normal_modes"]
+
+
+@dataclass
+class CampaignConfig:
+    """
+    dataclass for storing the settings of a campaign
+
+    Relative paths are interpreted relative to the directory of the configuration file.
+    """
+
+    name: str
+    dataset_path: str
+    database_path: str
+    # format of the dataset and options of its input adapter (see adapters.py)
+    dataset_format: str = "modelforge_hdf5"
+    dataset_options: Optional[dict] = None
+    # run each starting conformer of a record as a separate job; the results are merged on export
+    fan_out_conformers: bool = False
+    lockfile_path: str = "status.lockfile"
+    output_path: Optional[str] = None
+    output_backend: str = "hdf5"
+    # "full" rewrites the output file on every export; "incremental" appends only new completions
+    export_mode: str = "full"
+    # thresholds of the quality checks of the exported dataset, passed to dataset_qa.qa_mask
+    qa_options: Optional[dict] = None
+    # settings of the near-duplicate detection, passed to dataset_dedup.deduplicate
+    dedup_options: Optional[dict] = None
+    elements: Optional[List[int]] = None
+    # databases of earlier campaigns whose completed results are reused on setup if the input and
+    # the result-affecting settings of a job are unchanged (see provenance.py)
+    reuse_databases: Optional[List[str]] = None
+    temperature: float = 400.0  # K
+    friction: float = 0.01  # 1/fs
+    timestep: float = 1.0  # fs
+    number_of_steps: int = 100
+    number_of_repeats: int = 10
+    method: str = "GFN2-xTB"
+    md_accuracy: float = 2.0
+    property_accuracy: float = 1.0
+    cache_path: Optional[str] = None
+    cache_max_size_bytes: int = 1_000_000_000
+    output_trajectory: bool = False
+    output_log: bool = False
+    integrator: str = "ase"  # "ase" or "baoab"
+    log_interval: int = 1
+    backend: str = "ase"  # "ase" or "tblite"
+    # check the MD for fragmentation and unphysical states every md_check_interval steps and stop it
+    # early when a check fails (see md_checks.py); md_check_options are passed to md_checks.MDCheck
+    md_check_interval: Optional[int] = None
+    md_check_options: Optional[dict] = None
+    # "md" samples configurations with Langevin MD; "normal_modes" draws number_of_repeats thermal
+    # displacements along the normal modes of one Hessian (see normal_modes.py), with
+    # normal_mode_options passed to normal_modes.run_normal_mode_sampling (e.g., optimize, processes)
+    sampler: str = "md"
+    normal_mode_options: Optional[dict] = None
+    # seed of the campaign; each job is seeded from it and its key (see utils.job_seed)
+    seed: int = 0
+    # budget-driven sampling; if either budget is set, number_of_steps and number_of_repeats
+    # are the targets and are reduced to fit the budget based on a short calibration run
+    budget_cpu_hours_per_job: Optional[float] = None
+    budget_cpu_hours_total: Optional[float] = None
+    calibration_steps: int = 5
+    min_steps: int = 10
+    min_repeats: int = 1
+    # once the cost model (see cost_model.py) is fitted on at least cost_model_min_samples records,
+    # use its predictions instead of the calibration run to choose the sampling
+    cost_model_calibration: bool = False
+    cost_model_min_samples: int = 20
+    # "serial" runs claim, load, compute and write one after the other;
+    # "pipelined" overlaps the I/O of neighbouring jobs with the xtb calculation (see orchestrator.py);
+    # "forkserver" runs each job in a child forked from a pre-warmed parent (see forkserver.py)
+    worker_mode: str = "serial"
+    # seconds a worker waits for a lock file (e.g., status.lockfile) before giving up with
+    # utils.LockTimeout (queue updates try again a few times, see utils.lock_with_retries);
+    # None waits indefinitely. See "python campaign.py locks" for the waits measured
+    lock_timeout_seconds: Optional[float] = None
+    # forkserver mode: number of records run by each child, and number of failed attempts
+    # (child crashes or errors) after which a record is marked "failed" instead of requeued
+    forkserver_jobs_per_child: int = 1
+    max_job_attempts: int = 2
+    # number of records claimed from the queue at a time, and written back at a time;
+    # if batch_max_seconds is set, batches are also limited by the estimated walltime of the records
+    batch_size: int = 1
+    batch_max_seconds: Optional[float] = None
+    # records whose estimated memory exceeds big_memory_threshold_mb are limited to
+    # max_big_memory_jobs running at once per node (coordinated with lock files in node_local_dir)
+    big_memory_threshold_mb: Optional[float] = None
+    max_big_memory_jobs: int = 1
+    node_local_dir: str = "/tmp/xtb_config_gen"
+    # pairs [min_atoms, threads]: records with at least min_atoms atoms run tblite with that many threads
+    # (see threads.py); with cores_per_node, a job takes one core slot of the node per thread,
+    # so the number of busy cores stays at cores_per_node
+    thread_thresholds: Optional[List[List[int]]] = None
+    cores_per_node: Optional[int] = None
+    # straggler watchdog (see watchdog.py): jobs running longer than straggler_timeout_factor times their
+    # predicted walltime (but at least straggler_min_seconds) are aborted and deferred, to be rerun with
+    # the straggler_fallback settings (campaign fields, e.g., {"md_accuracy": 3.0, "number_of_steps": 50})
+    # once other records are done; after max_job_timeouts timeouts they are marked "timed_out"
+    straggler_timeout_factor: Optional[float] = None
+    straggler_min_seconds: float = 60.0
+    straggler_fallback: Optional[dict] = None
+    max_job_timeouts: int = 1
+
+    def __post_init__(self):
+        from adapters import adapter_names
+
+        if self.dataset_format not in adapter_names:
+            raise ValueError(
+                f"dataset_format {self.dataset_format} not supported; options are {adapter_names}"
+            )
+        if self.output_backend not in output_backends:
+            raise ValueError(
+                f"output_backend {self.output_backend} not supported; options are {output_backends}"
+            )
+        if self.export_mode not in export_modes:
+            raise ValueError(
+                f"export_mode {self.export_mode} not supported; options are {export_modes}"
+            )
+        if self.worker_mode not in worker_modes:
+            raise ValueError(
+                f"worker_mode {self.worker_mode} not supported; options are {worker_modes}"
+            )
+        if self.sampler not in samplers:
+            raise ValueError(
+                f"sampler {self.sampler} not supported; options are {samplers}"
+            )
+        if self.output_path is None:
+            self.output_path = f"{self.name}.hdf5"
+        if (
+            self.budget_cpu_hours_per_job is not None
+            and self.budget_cpu_hours_total is not None
+        ):
+            raise ValueError(
+                "Only one of budget_cpu_hours_per_job and budget_cpu_hours_total can be set"
+            )
+        if self.adaptive and self.sampler != "md":
+            raise ValueError("Budget-driven sampling is only supported with sampler md")
+        if self.thread_thresholds is not None:
+            from importlib.util import find_spec
+
+            if find_spec("threadpoolctl") is None:
+                raise ValueError("thread_thresholds requires threadpoolctl to be installed")
+
+    @property
+    def adaptive(self):
+        return (
+            self.budget_cpu_hours_per_job is not None
+            or self.budget_cpu_hours_total is not None
+        )
+
+    def run_kwargs(self):
+        """
+        Keyword arguments for run_xtb_calc derived from this campaign.
+        """
+        from openff.units import unit
+
+        return dict(
+            number_of_steps=self.number_of_steps,
+            number_of_repeats=self.number_of_repeats,
+            temperature=unit.Quantity(self.temperature, "K"),
+            friction=unit.Quantity(self.friction, "1/fs"),
+            timestep=unit.Quantity(self.timestep, "fs"),
+            output_trajectory=self.output_trajectory,
+            output_log=self.output_log,
+            method=self.method,
+            md_accuracy=self.md_accuracy,
+            property_accuracy=self.property_accuracy,
+            integrator=self.integrator,
+            log_interval=self.log_interval,
+            backend=self.backend,
+            md_check_interval=self.md_check_interval,
+            md_check_options=self.md_check_options,
+        )
+
+
+_path_fields = [
+    "dataset_path",
+    "database_path",
+    "lockfile_path",
+    "output_path",
+    "cache_path",
+]
+
+
+def load_campaign_config(file_path: str):
+    """
+    Load a campaign from a TOML (.toml) or YAML (.yaml, .yml) file.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path to the configuration file.
+
+    Returns
+    -------
+    CampaignConfig
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            import tomli as tomllib
+
+        with open(file_path, "rb") as f:
+            settings = tomllib.load(f)
+    elif extension in [".yaml", ".yml"]:
+        import yaml
+
+        with open(file_path, "r") as f:
+            settings = yaml.safe_load(f)
+    else:
+        raise ValueError(f"Unsupported campaign file format: {extension}")
+
+    known = {f.name for f in fields(CampaignConfig)}
+    unknown = set(settings) - known
+    if unknown:
+        raise ValueError(f"Unknown campaign settings: {sorted(unknown)}")
+
+    config = CampaignConfig(**settings)
+
+    base_dir = os.path.dirname(os.path.abspath(file_path))
+    for name in _path_fields:
+        value = getattr(config, name)
+        if value is not None:
+            setattr(
+                config,
+                name,
+                os.path.join(base_dir, os.path.expanduser(value)),
+            )
+    if config.reuse_databases is not None:
+        config.reuse_databases = [
+            os.path.join(base_dir, os.path.expanduser(value))
+            for value in config.reuse_databases
+        ]
+    return config
+
+
+def setup_campaign(config: CampaignConfig):
+    """
+    Create the status table for all records of the dataset, applying the element filter.
+
+    The records are summarized in parallel through the input adapter, and the per-record fields
+    (also used by the cost model) are cached next to the campaign database.
+    If config.fan_out_conformers is set, each conformer of a record with several starting conformers
+    is queued as a separate job (see job_queue.conformer_key); otherwise such records cannot be run
+    and are marked "failed".
+
+    Completed jobs of the campaign database (if it already exists) and of config.reuse_databases are
+    kept if their input and the result-affecting settings are unchanged; only the other jobs are queued
+    (see provenance.py).
+
+    Returns
+    -------
+    int
+        Number of jobs queued.
+    """
+    from job_queue import (
+        conformer_key,
+        fail_jobs,
+        setup_status_db,
+        split_conformer_key,
+    )
+    from provenance import (
+        find_reusable,
+        input_hash,
+        load_conformer_hashes,
+        parameters_hash,
+        provenance_hash,
+        reuse_results,
+    )
+
+    record_fields = _load_record_fields(config)
+    keys = record_fields["keys"].tolist()
+    # conformer hashes of each record, for the provenance hash of its jobs
+    record_hashes = load_conformer_hashes(
+        config.dataset_path,
+        keys,
+        sidecar_path=f"{config.database_path}.hashes.npz",
+        dataset_format=config.dataset_format,
+        dataset_options=config.dataset_options,
+    )
+    # only the composition is needed for the element filter and atom counts
+    atomic_numbers = dict(
+        zip(
+            keys,
+            (
+                np.repeat(record_fields["elements"], counts)
+                for counts in record_fields["element_counts"]
+            ),
+        )
+    )
+    unsupported = {}
+    if config.fan_out_conformers:
+        keys = [
+            conformer_key(key, index) if n_configs > 1 else key
+            for key, n_configs in zip(keys, record_fields["n_configs"].tolist())
+            for index in range(n_configs)
+        ]
+    else:
+        # a job runs a single starting conformer
+        unsupported = {
+            key: f"record has {n_configs} starting conformers; set fan_out_conformers to run them"
+            for key, n_configs in zip(keys, record_fields["n_configs"].tolist())
+            if n_configs > 1
+        }
+
+    run_hash = parameters_hash(config)
+    expected = {}
+    for key in keys:
+        parent, index = split_conformer_key(key)
+        conformers = record_hashes[parent]
+        if index is not None:
+            conformers = conformers[index : index + 1]
+        expected[key] = provenance_hash(input_hash(conformers), run_hash)
+    # the campaign database is read before setup_status_db resets its status table
+    reusable = find_reusable(
+        expected, [config.database_path] + (config.reuse_databases or [])
+    )
+
+    total = setup_status_db(
+        config.database_path,
+        keys,
+        atomic_numbers_lookup=lambda key: atomic_numbers[split_conformer_key(key)[0]],
+        elements_to_include=config.elements,
+    )
+    total -= fail_jobs(config.database_path, unsupported)
+    n_reused = reuse_results(config.database_path, reusable)
+    logger.info(f"Reused {n_reused} completed jobs; {total - n_reused} jobs queued")
+    return total - n_reused
+
+
+def _load_record_fields(config: CampaignConfig, processes: int = None):
+    from dataset_stats import load_record_fields
+
+    return load_record_fields(
+        config.dataset_path,
+        sidecar_path=f"{config.database_path}.stats.npz",
+        processes=processes,
+        dataset_format=config.dataset_format,
+        dataset_options=config.dataset_options,
+    )
+
+
+def _use_cost_model(config: CampaignConfig, cost_model):
+    return (
+        config.cost_model_calibration
+        and cost_model is not None
+        and cost_model.fitted
+        and cost_model.n_samples >= config.cost_model_min_samples
+    )
+
+
+def choose_job_sampling(
+    config: CampaignConfig, data_input, budget_seconds: float, cache=None, cost_model=None
+):
+    """
+    Calibrate the cost of a record and choose the number of steps and repeats that fit in the budget.
+
+    If config.cost_model_calibration is set and cost_model has been fitted on enough records,
+    its predicted costs are used instead of a calibration run. The time of the calibration run is
+    part of the job, so only the rest of the budget is left for the sampling.
+
+    Returns
+    -------
+    dict
+        Sampling metadata, including the chosen and target number of steps and repeats.
+    """
+    from time import time
+
+    from budget import choose_sampling, estimate_run_cost
+    from xtb_config_gen import measure_step_cost
+
+    calibration = {}
+    if _use_cost_model(config, cost_model):
+        from cost_model import features_from_record
+
+        features = features_from_record(data_input)
+        step_cost = float(cost_model.step_cost(features))
+        single_point_cost = float(cost_model.single_point_cost(features))
+    else:
+        run_kwargs = config.run_kwargs()
+        start = time()
+        step_cost, single_point_cost = measure_step_cost(
+            data_input,
+            number_of_steps=config.calibration_steps,
+            temperature=run_kwargs["temperature"],
+            friction=run_kwargs["friction"],
+            timestep=run_kwargs["timestep"],
+            cache=cache,
+            method=config.method,
+            md_accuracy=config.md_accuracy,
+            property_accuracy=config.property_accuracy,
+            backend=config.backend,
+        )
+        calibration = {
+            "calibration_steps": config.calibration_steps,
+            "calibration_seconds": time() - start,
+            "step_cost_seconds": step_cost,
+            "single_point_cost_seconds": single_point_cost,
+        }
+    number_of_steps, number_of_repeats = choose_sampling(
+        step_cost,
+        single_point_cost,
+        max(budget_seconds - calibration.get("calibration_seconds", 0.0), 0.0),
+        target_steps=config.number_of_steps,
+        target_repeats=config.number_of_repeats,
+        min_steps=config.min_steps,
+        min_repeats=config.min_repeats,
+    )
+    logger.info(
+        f"budget {budget_seconds:.1f} s: {number_of_repeats} repeats of {number_of_steps} steps "
+        f"(target {config.number_of_repeats} x {config.number_of_steps})"
+    )
+    return {
+        "number_of_steps": number_of_steps,
+        "number_of_repeats": number_of_repeats,
+        "target_number_of_steps": config.number_of_steps,
+        "target_number_of_repeats": config.number_of_repeats,
+        "sampling_fraction": (number_of_steps * number_of_repeats)
+        / (config.number_of_steps * config.number_of_repeats),
+        "budget_seconds": budget_seconds,
+        "predicted_seconds": estimate_run_cost(
+            step_cost, single_point_cost, number_of_steps, number_of_repeats
+        ),
+        **calibration,
+    }
+
+
+def open_dataset(config: CampaignConfig):
+    """
+    Create the input adapter of the campaign dataset.
+    """
+    from adapters import open_adapter
+
+    return open_adapter(
+        config.dataset_format, config.dataset_path, config.dataset_options
+    )
+
+
+def load_record(config: CampaignConfig, key: str):
+    """
+    Load a single record from the dataset; for the key of a fanned-out job, only its conformer is returned.
+    """
+    from job_queue import split_conformer_key
+    from xtb_config_gen import select_conformer
+
+    parent, index = split_conformer_key(key)
+    with open_dataset(config) as dataset:
+        data_input = dataset.load(parent)
+    if index is None:
+        return data_input
+    return select_conformer(data_input, index, name=key)
+
+
+def compute_job(
+    config: CampaignConfig, data_input, cache=None, budget_seconds=None, cost_model=None
+):
+    """
+    Run the xtb calculation for a record that has already been loaded.
+
+    If budget_seconds is given, the number of steps and repeats are chosen to fit the budget.
+    If cost_model is given, its prediction of the walltime is stored with the timings,
+    so its error can be tracked (see cost_model.online_error).
+    If config.straggler_timeout_factor is set, the calculation is aborted with watchdog.JobTimeout
+    once it exceeds its time limit; records that timed out before are run with config.straggler_fallback.
+    The provenance hashes of the job are stored with the metadata (see provenance.py).
+
+    Returns
+    -------
+    tuple
+        (DataPoint, dict of metadata describing the run)
+    """
+    from contextlib import nullcontext
+    from time import time
+    from budget import estimate_memory_mb
+    from threads import thread_limit, threads_for_atoms
+    from utils import MemoryMonitor, NodeSemaphore, job_seed
+    from provenance import parameters_hash, provenance_hash, record_input_hash
+    from watchdog import Watchdog, time_limit_seconds
+    from xtb_config_gen import run_xtb_calc
+
+    fallback = _timed_out_before(config, data_input.name)
+    if fallback:
+        from dataclasses import replace
+
+        logger.info(f"{data_input.name} timed out before; using {config.straggler_fallback}")
+        config = replace(config, **(config.straggler_fallback or {}))
+
+    # hashed from the settings actually run, so a result of the fallback settings is not reused
+    # when the campaign is set up again
+    provenance = {
+        "input_hash": record_input_hash(data_input),
+        "parameters_hash": parameters_hash(config),
+    }
+    provenance["provenance_hash"] = provenance_hash(
+        provenance["input_hash"], provenance["parameters_hash"]
+    )
+
+    n_atoms = data_input.geometry.shape[1]
+    logger.debug(f"starting: {data_input.name}")
+    logger.debug(f"n_atoms:  {n_atoms}")
+
+    estimated_memory_mb = estimate_memory_mb(n_atoms)
+    memory_slot = nullcontext()
+    if (
+        config.big_memory_threshold_mb is not None
+        and estimated_memory_mb > config.big_memory_threshold_mb
+    ):
+        memory_slot = NodeSemaphore(
+            config.node_local_dir,
+            config.max_big_memory_jobs,
+            name=f"{config.name}_big_memory",
+        )
+
+    n_threads = threads_for_atoms(n_atoms, config.thread_thresholds)
+    core_slots = nullcontext()
+    if config.cores_per_node is not None:
+        core_slots = NodeSemaphore(
+            config.node_local_dir,
+            config.cores_per_node,
+            name=f"{config.name}_cores",
+            count=n_threads,
+            poll_interval=1.0,
+        )
+
+    # without thread_thresholds, the threads set by OMP_NUM_THREADS are left unchanged
+    with memory_slot, core_slots, thread_limit(
+        n_threads if config.thread_thresholds is not None else None
+    ), MemoryMonitor() as memory_monitor:
+        start = time()
+        run_kwargs = config.run_kwargs()
+        metadata = {}
+        if budget_seconds is not None:
+            # budgets are in CPU time; a job with several threads has that much less walltime
+            metadata = choose_job_sampling(
+                config,
+                data_input,
+                budget_seconds / n_threads,
+                cache=cache,
+                cost_model=cost_model,
+            )
+            run_kwargs["number_of_steps"] = metadata["number_of_steps"]
+            run_kwargs["number_of_repeats"] = metadata["number_of_repeats"]
+        metadata["number_of_steps"] = run_kwargs["number_of_steps"]
+        metadata["number_of_repeats"] = run_kwargs["number_of_repeats"]
+        metadata.update(provenance)
+        run_kwargs["seed"] = job_seed(data_input.name, config.seed)
+        metadata["seed"] = run_kwargs["seed"]
+        metadata["campaign_seed"] = config.seed
+        metadata["sampler"] = config.sampler
+        if cost_model is not None and config.sampler == "md":
+            from cost_model import features_from_record
+
+            metadata["model_predicted_seconds"] = float(
+                cost_model.job_seconds(
+                    features_from_record(data_input),
+                    run_kwargs["number_of_steps"],
+                    run_kwargs["number_of_repeats"],
+                )
+            )
+
+        limit_seconds = None
+        if config.straggler_timeout_factor is not None:
+            limit_seconds = time_limit_seconds(
+                _predicted_seconds(
+                    config, data_input, run_kwargs, metadata, cost_model
+                ),
+                config.straggler_timeout_factor,
+                config.straggler_min_seconds,
+            )
+            metadata["time_limit_seconds"] = limit_seconds
+        if fallback:
+            metadata["fallback_settings"] = True
+
+        with Watchdog(data_input.name, limit_seconds):
+            if config.sampler == "normal_modes":
+                from normal_modes import run_normal_mode_sampling
+
+                xtb_properties = run_normal_mode_sampling(
+                    data_input,
+                    number_of_samples=run_kwargs["number_of_repeats"],
+                    temperature=run_kwargs["temperature"],
+                    cache=cache,
+                    method=config.method,
+                    hessian_accuracy=config.md_accuracy,
+                    property_accuracy=config.property_accuracy,
+                    backend=config.backend,
+                    seed=run_kwargs["seed"],
+                    **(config.normal_mode_options or {}),
+                )
+            else:
+                xtb_properties = run_xtb_calc(data_input, cache=cache, **run_kwargs)
+        end = time()
+
+    logger.debug(f"name: {data_input.name}")
+    logger.debug(f"n_atoms:  {n_atoms}")
+    logger.info(f"Time taken: {end - start} ({n_threads} threads)")
+    metadata["elapsed_seconds"] = end - start
+    metadata["n_threads"] = n_threads
+    metadata["cpu_seconds"] = (end - start) * n_threads
+    if xtb_properties.md_abort_reason is not None:
+        metadata["md_abort_reason"] = xtb_properties.md_abort_reason
+        metadata["md_abort_step"] = xtb_properties.md_abort_step
+        metadata["completed_repeats"] = int(xtb_properties.n_configs) - 1
+    # calculator settings used, e.g., xtb_multiplicity and xtb_uhf
+    for name, value in (xtb_properties.calculator_settings or {}).items():
+        if value is not None:
+            metadata[f"xtb_{name}"] = value
+    metadata["completed_time"] = end
+    metadata["estimated_memory_mb"] = estimated_memory_mb
+    if memory_monitor.peak_mb is not None:
+        metadata["peak_rss_mb"] = memory_monitor.peak_mb
+    if isinstance(memory_slot, NodeSemaphore):
+        metadata["memory_slot_wait_seconds"] = memory_slot.wait_time
+    if isinstance(core_slots, NodeSemaphore):
+        metadata["core_slot_wait_seconds"] = core_slots.wait_time
+    return xtb_properties, metadata
+
+
+def _timed_out_before(config: CampaignConfig, key: str):
+    if config.straggler_timeout_factor is None:
+        return False
+    from sqlitedict import SqliteDict
+
+    with SqliteDict(config.database_path, tablename="metadata") as metadata_db:
+        return metadata_db.get(key, {}).get("timeout_count", 0) > 0
+
+
+def _predicted_seconds(
+    config: CampaignConfig, data_input, run_kwargs: dict, metadata: dict, cost_model
+):
+    # walltime predicted for the run: from the calibration run of the record if there was one,
+    # otherwise from the cost model (the prior from the atom count if it has not been fitted)
+    if "predicted_seconds" in metadata:
+        return metadata["predicted_seconds"]
+    if "model_predicted_seconds" in metadata:
+        return metadata["model_predicted_seconds"]
+    from cost_model import CostModel, features_from_record
+
+    if cost_model is None:
+        cost_model = CostModel()
+    features = features_from_record(data_input)
+    if config.sampler == "normal_modes":
+        # 6 * n_atoms force calls for the Hessian, and a single point per configuration
+        n_atoms = data_input.geometry.shape[1]
+        return float(
+            6 * n_atoms * cost_model.step_cost(features)
+            + (run_kwargs["number_of_repeats"] + 1)
+            * cost_model.single_point_cost(features)
+        )
+    return float(
+        cost_model.job_seconds(
+            features, run_kwargs["number_of_steps"], run_kwargs["number_of_repeats"]
+        )
+    )
+
+
+def run_job(
+    config: CampaignConfig, key: str, cache=None, budget_seconds=None, cost_model=None
+):
+    """
+    Load a single record from the dataset and run the xtb calculation.
+
+    Returns
+    -------
+    tuple
+        (DataPoint, dict of metadata describing the run)
+    """
+    data_input = load_record(config, key)
+    return compute_job(
+        config,
+        data_input,
+        cache=cache,
+        budget_seconds=budget_seconds,
+        cost_model=cost_model,
+    )
+
+
+def _open_cache(config: CampaignConfig):
+    if config.cache_path is None:
+        return None
+    from xtb_cache import XTBCache
+
+    return XTBCache(config.cache_path, max_size_bytes=config.cache_max_size_bytes)
+
+
+def _open_budget(config: CampaignConfig):
+    if config.budget_cpu_hours_total is None:
+        return None
+    from budget import CampaignBudget
+
+    return CampaignBudget(
+        config.database_path, config.lockfile_path, config.budget_cpu_hours_total
+    )
+
+
+def _job_budget(config: CampaignConfig, campaign_budget, key: str = None):
+    if config.budget_cpu_hours_per_job is not None:
+        return config.budget_cpu_hours_per_job * 3600.0
+    if campaign_budget is not None:
+        return campaign_budget.allocate(key)
+    return None
+
+
+def open_worker_queue(config: CampaignConfig, reverse: bool = False, cost_model=None):
+    """
+    Create the WorkerQueue of this worker, returning records of dead workers on this host to the queue first.
+
+    If batch_max_seconds is set, batches are sized with the walltimes predicted by cost_model
+    (the prior estimate from the atom count if it has not been fitted yet).
+    """
+    from job_queue import WorkerQueue, requeue_stale_claims
+
+    requeue_stale_claims(config.database_path, config.lockfile_path)
+
+    cost_function = None
+    if config.batch_max_seconds is not None:
+        from cost_model import CostModel, features_from_fields
+        from job_queue import split_conformer_key
+
+        if cost_model is None:
+            cost_model = CostModel()
+        features = features_from_fields(_load_record_fields(config))
+
+        def cost_function(key):
+            return float(
+                cost_model.job_seconds(
+                    features[split_conformer_key(key)[0]],
+                    config.number_of_steps,
+                    config.number_of_repeats,
+                )
+            )
+
+    return WorkerQueue(
+        config.database_path,
+        config.lockfile_path,
+        batch_size=config.batch_size,
+        max_batch_cost=config.batch_max_seconds,
+        cost_function=cost_function,
+        reverse=reverse,
+    )
+
+
+def _time_out(
+    config: CampaignConfig, queue, campaign_budget, key: str, budget_seconds, timeout
+):
+    # defers (or marks "timed_out") a record aborted by the watchdog, charging its elapsed time to the budget
+    if campaign_budget is not None:
+        campaign_budget.settle(budget_seconds, timeout.elapsed_seconds)
+    queue.time_out(key, str(timeout), max_timeouts=config.max_job_timeouts)
+
+
+def _exit_on_sigterm():
+    # batch schedulers send SIGTERM at the end of the walltime; exiting through SystemExit
+    # lets the worker queue return its unfinished records
+    import signal
+    import sys
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+
+def run_worker(config: CampaignConfig, n_jobs: int = 1, reverse: bool = False):
+    """
+    Claim and run up to n_jobs records from the queue, one at a time.
+    """
+    from utils import OpenWithLock
+
+    _exit_on_sigterm()
+    OpenWithLock.default_timeout = config.lock_timeout_seconds
+
+    if config.worker_mode == "pipelined":
+        from orchestrator import run_pipelined_worker
+
+        return run_pipelined_worker(config, n_jobs=n_jobs, reverse=reverse)
+    if config.worker_mode == "forkserver":
+        from forkserver import run_forkserver_worker
+
+        return run_forkserver_worker(config, n_jobs=n_jobs, reverse=reverse)
+
+    from time import time
+
+    from cost_model import load_cost_model
+    from watchdog import JobTimeout
+
+    campaign_budget = _open_budget(config)
+    cost_model = load_cost_model(config.database_path)
+    cache = _open_cache(config)
+    try:
+        with open_worker_queue(config, reverse=reverse, cost_model=cost_model) as queue:
+            for i in range(n_jobs):
+                key = queue.next_key()
+                if key is None:
+                    logger.info("No records left to submit.")
+                    break
+
+                budget_seconds = _job_budget(config, campaign_budget, key)
+
+                start = time()
+                try:
+                    xtb_properties, metadata = run_job(
+                        config,
+                        key,
+                        cache=cache,
+                        budget_seconds=budget_seconds,
+                        cost_model=cost_model,
+                    )
+                except JobTimeout as e:
+                    _time_out(config, queue, campaign_budget, key, budget_seconds, e)
+                    continue
+                except BaseException:
+                    # the allocation is also returned if the job raised, with the time it ran
+                    if campaign_budget is not None:
+                        campaign_budget.settle(budget_seconds, time() - start)
+                    raise
+                if campaign_budget is not None:
+                    campaign_budget.settle(budget_seconds, metadata["cpu_seconds"])
+
+                queue.complete(key, xtb_properties, metadata)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def export_campaign(config: CampaignConfig, repack: bool = False):
+    """
+    Write the results of the campaign using the configured output backend and export mode.
+
+    If repack is True, the output file is rewritten afterwards to reclaim the space of replaced records.
+    """
+    from export import export_results_to_hdf5, repack_hdf5
+
+    export_results_to_hdf5(
+        config.database_path,
+        config.output_path,
+        incremental=config.export_mode == "incremental",
+    )
+    if repack:
+        repack_hdf5(config.output_path)
+
+
+def dataset_qa(
+    config: CampaignConfig, filtered_path: str = None, processes: int = None
+):
+    """
+    Check the exported dataset of the campaign, see dataset_qa.run_qa.
+
+    The mask is saved next to the output file; if filtered_path is given, a copy holding only the
+    configurations that pass is written there.
+    """
+    from dataset_qa import run_qa
+
+    return run_qa(
+        config.output_path,
+        filtered_path=filtered_path,
+        processes=processes,
+        **(config.qa_options or {}),
+    )
+
+
+def dataset_dedup(
+    config: CampaignConfig,
+    reference_paths: list = None,
+    filtered_path: str = None,
+    processes: int = None,
+):
+    """
+    Find near-duplicate configurations in the exported dataset of the campaign, see dataset_dedup.run_dedup.
+
+    Configurations of the files in reference_paths (e.g., the output of an overlapping campaign) are
+    kept over duplicates in the campaign output. The report is saved next to the output file; if
+    filtered_path is given, a copy of the output without its duplicates is written there.
+    """
+    from dataset_dedup import run_dedup
+
+    file_paths = list(reference_paths or []) + [config.output_path]
+    return run_dedup(
+        file_paths,
+        output_paths=[None] * (len(file_paths) - 1) + [filtered_path],
+        processes=processes,
+        **(config.dedup_options or {}),
+    )
+
+
+def dataset_stats(config: CampaignConfig, processes: int = None):
+    """
+    Distributions and predicted cost of the records of the campaign dataset, see dataset_stats.summarize.
+
+    The per-record fields are cached in a sidecar file next to the campaign database.
+    """
+    from cost_model import load_cost_model
+    from dataset_stats import summarize
+
+    cost_model = None
+    if os.path.exists(config.database_path):
+        cost_model = load_cost_model(config.database_path)
+    return summarize(
+        _load_record_fields(config, processes=processes),
+        elements_to_include=config.elements,
+        number_of_steps=config.number_of_steps,
+        number_of_repeats=config.number_of_repeats,
+        cost_model=cost_model,
+    )
+
+
+def thread_scaling(
+    config: CampaignConfig,
+    n_samples: int = 5,
+    thread_counts=(1, 2, 4, 8),
+    min_efficiency: float = 0.7,
+):
+    """
+    Measure the thread scaling of records spread over the sizes in the dataset and suggest thread_thresholds.
+
+    Run this on a node of the type used for the campaign, with no other jobs running.
+
+    Returns
+    -------
+    dict
+        Measured seconds per MD step of each sample (keyed by number of atoms, then threads)
+        and the suggested thread_thresholds.
+    """
+    from threads import choose_thread_thresholds, measure_thread_scaling
+
+    record_fields = _load_record_fields(config)
+    order = np.argsort(record_fields["n_atoms"])
+    picks = order[
+        np.unique(np.linspace(0, len(order) - 1, n_samples).round().astype(int))
+    ]
+    run_kwargs = config.run_kwargs()
+
+    samples = []
+    for index in picks:
+        data_input = load_record(config, str(record_fields["keys"][index]))
+        if data_input.n_configs > 1:
+            from xtb_config_gen import select_conformer
+
+            data_input = select_conformer(data_input, 0)
+        step_costs = measure_thread_scaling(
+            data_input,
+            thread_counts=thread_counts,
+            number_of_steps=config.calibration_steps,
+            temperature=run_kwargs["temperature"],
+            friction=run_kwargs["friction"],
+            timestep=run_kwargs["timestep"],
+            method=config.method,
+            md_accuracy=config.md_accuracy,
+            property_accuracy=config.property_accuracy,
+            backend=config.backend,
+        )
+        n_atoms = int(record_fields["n_atoms"][index])
+        logger.info(f"{n_atoms} atoms: {step_costs}")
+        samples.append((n_atoms, step_costs))
+
+    return {
+        "step_costs": {str(n_atoms): step_costs for n_atoms, step_costs in samples},
+        "thread_thresholds": choose_thread_thresholds(
+            samples, min_efficiency=min_efficiency
+        ),
+    }
+
+
+def fit_cost_model(config: CampaignConfig):
+    """
+    Fit the cost model on the completed jobs of the campaign, store it, and report its error
+    and the predicted CPU hours of the campaign.
+    """
+    from sqlitedict import SqliteDict
+    from cost_model import (
+        features_from_fields,
+        fit_campaign_cost_model,
+        predict_campaign_hours,
+    )
+
+    fields = _load_record_fields(config)
+    model, report = fit_campaign_cost_model(
+        config.database_path, config.lockfile_path, fields
+    )
+    with SqliteDict(config.database_path, tablename="status") as status_db:
+        status = dict(status_db.items())
+    report["prediction"] = predict_campaign_hours(
+        model,
+        features_from_fields(fields),
+        status,
+        config.number_of_steps,
+        config.number_of_repeats,
+    )
+    return report
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run an xtb_config_gen campaign.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    setup_parser = subparsers.add_parser("setup", help="populate the job queue")
+    setup_parser.add_argument("config")
+
+    run_parser = subparsers.add_parser("run", help="claim and run jobs")
+    run_parser.add_argument("config")
+    run_parser.add_argument("--n-jobs", type=int, default=1)
+    run_parser.add_argument(
+        "--reverse", action="store_true", help="claim jobs from the end of the queue"
+    )
+    run_parser.add_argument(
+        "--worker-mode",
+        choices=worker_modes,
+        default=None,
+        help="override the worker_mode of the campaign",
+    )
+
+    single_parser = subparsers.add_parser(
+        "single", help="run a single record without the queue"
+    )
+    single_parser.add_argument("config")
+    single_parser.add_argument(
+        "--key", default=None, help="record to run; defaults to the first key"
+    )
+
+    export_parser = subparsers.add_parser("export", help="export the results")
+    export_parser.add_argument("config")
+    export_parser.add_argument(
+        "--export-mode",
+        choices=export_modes,
+        default=None,
+        help="override the export_mode of the campaign",
+    )
+    export_parser.add_argument(
+        "--repack",
+        action="store_true",
+        help="rewrite the output file to reclaim space from replaced records",
+    )
+
+    requeue_parser = subparsers.add_parser(
+        "requeue", help="return records claimed by dead workers to the queue"
+    )
+    requeue_parser.add_argument("config")
+    requeue_parser.add_argument(
+        "--max-age-hours",
+        type=float,
+        default=None,
+        help="also requeue claims older than this (e.g., from workers on other nodes)",
+    )
+
+    stats_parser = subparsers.add_parser(
+        "stats", help="distributions and predicted cost of the dataset"
+    )
+    stats_parser.add_argument("config")
+    stats_parser.add_argument("--processes", type=int, default=None)
+
+    qa_parser = subparsers.add_parser(
+        "qa", help="quality checks of the exported dataset"
+    )
+    qa_parser.add_argument("config")
+    qa_parser.add_argument("--processes", type=int, default=None)
+    qa_parser.add_argument(
+        "--filtered", default=None, help="write the configurations that pass to this file"
+    )
+
+    dedup_parser = subparsers.add_parser(
+        "dedup", help="find near-duplicate configurations in the exported dataset"
+    )
+    dedup_parser.add_argument("config")
+    dedup_parser.add_argument("--processes", type=int, default=None)
+    dedup_parser.add_argument(
+        "--reference",
+        nargs="+",
+        default=None,
+        help="exported files whose configurations are kept over duplicates in this campaign",
+    )
+    dedup_parser.add_argument(
+        "--filtered", default=None, help="write the output without its duplicates to this file"
+    )
+
+    cost_model_parser = subparsers.add_parser(
+        "cost-model",
+        help="fit the cost model on completed jobs and predict the campaign hours",
+    )
+    cost_model_parser.add_argument("config")
+
+    scaling_parser = subparsers.add_parser(
+        "thread-scaling",
+        help="measure thread scaling of sample records and suggest thread_thresholds",
+    )
+    scaling_parser.add_argument("config")
+    scaling_parser.add_argument("--n-samples", type=int, default=5)
+    scaling_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    scaling_parser.add_argument("--min-efficiency", type=float, default=0.7)
+
+    subparsers.add_parser(
+        "locks", help="report the time workers spent waiting for and holding lock files"
+    ).add_argument("config")
+
+    args = parser.parse_args(argv)
+    config = load_campaign_config(args.config)
+
+    if args.command == "setup":
+        setup_campaign(config)
+    elif args.command == "run":
+        if args.worker_mode is not None:
+            config.worker_mode = args.worker_mode
+        run_worker(config, n_jobs=args.n_jobs, reverse=args.reverse)
+    elif args.command == "single":
+        key = args.key
+        if key is None:
+            with open_dataset(config) as dataset:
+                key = dataset.first_key()
+        budget_seconds = None
+        if config.budget_cpu_hours_per_job is not None:
+            budget_seconds = config.budget_cpu_hours_per_job * 3600.0
+        run_job(config, key, budget_seconds=budget_seconds)
+    elif args.command == "export":
+        if args.export_mode is not None:
+            config.export_mode = args.export_mode
+        export_campaign(config, repack=args.repack)
+    elif args.command == "requeue":
+        from job_queue import requeue_stale_claims
+
+        requeue_stale_claims(
+            config.database_path,
+            config.lockfile_path,
+            max_age_hours=args.max_age_hours,
+        )
+    elif args.command == "stats":
+        import json
+
+        print(json.dumps(dataset_stats(config, processes=args.processes), indent=2))
+    elif args.command == "qa":
+        import json
+
+        print(
+            json.dumps(
+                dataset_qa(config, filtered_path=args.filtered, processes=args.processes),
+                indent=2,
+            )
+        )
+    elif args.command == "dedup":
+        import json
+
+        print(
+            json.dumps(
+                dataset_dedup(
+                    config,
+                    reference_paths=args.reference,
+                    filtered_path=args.filtered,
+                    processes=args.processes,
+                ),
+                indent=2,
+            )
+        )
+    elif args.command == "cost-model":
+        import json
+
+        print(json.dumps(fit_cost_model(config), indent=2))
+    elif args.command == "thread-scaling":
+        import json
+
+        result = thread_scaling(
+            config,
+            n_samples=args.n_samples,
+            thread_counts=args.threads,
+            min_efficiency=args.min_efficiency,
+        )
+        print(json.dumps(result, indent=2))
+    elif args.command == "locks":
+        import json
+        from job_queue import lock_contention_report
+
+        print(json.dumps(lock_contention_report(config.database_path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Runtime cost model for xtb jobs, fitted on the timings recorded by completed jobs of a campaign.
+
+The seconds per MD step are modelled as a power law in the number of atoms, corrected for the
+number of heavy atoms (Z > 18, mostly the transition metal centers), the magnitude of the total
+charge and open-shell systems:
+
+    log(step_cost) = c0 + c1 log(n_atoms) + c2 log(1 + n_heavy) + c3 |charge| + c4 [multiplicity > 1]
+
+A single point at the property accuracy costs single_point_ratio MD steps. Both are estimated
+from the metadata of completed jobs: the effective step cost of each job follows from its elapsed
+time and the sampling used (including the calibration steps of budget-driven jobs), and the ratio
+from the costs measured by the calibration runs of budget-driven jobs (2 if there are none).
+Until enough records are completed, the prior of budget.prior_step_cost is used.
+"""
+
+import numpy as np
+from loguru import logger
+
+feature_names = ["intercept", "log_n_atoms", "log_n_heavy", "abs_charge", "open_shell"]
+heavy_atomic_number = 18
+
+
+def record_features(n_atoms, n_heavy, total_charge, spin_multiplicity):
+    """
+    Feature matrix of the cost model, shape (n_records, len(feature_names)).
+
+    Parameters
+    ----------
+    n_atoms: array-like, required
+        Number of atoms of each record.
+    n_heavy: array-like, required
+        Number of atoms with atomic number above 18 in each record.
+    total_charge: array-like, required
+        Total charge of each record (e).
+    spin_multiplicity: array-like, required
+        Spin multiplicity of each record.
+    """
+    n_atoms = np.asarray(n_atoms, dtype=np.float64).reshape(-1)
+    return np.column_stack(
+        [
+            np.ones_like(n_atoms),
+            np.log(n_atoms),
+            np.log1p(np.asarray(n_heavy, dtype=np.float64).reshape(-1)),
+            np.abs(np.asarray(total_charge, dtype=np.float64).reshape(-1)),
+            (np.asarray(spin_multiplicity).reshape(-1) > 1).astype(np.float64),
+        ]
+    )
+
+
+def features_from_fields(fields: dict):
+    """
+    Features of every record of a dataset, from the per-record fields of dataset_stats.load_record_fields.
+
+    Returns
+    -------
+    dict
+        Feature vector keyed by record.
+    """
+    heavy = fields["elements"] > heavy_atomic_number
+    features = record_features(
+        fields["n_atoms"],
+        fields["element_counts"][:, heavy].sum(axis=1),
+        fields["total_charge"],
+        fields["spin_multiplicity"],
+    )
+    return dict(zip(fields["keys"].tolist(), features))
+
+
+def features_from_record(data_input):
+    """
+    Feature vector of a record loaded with xtb_config_gen.load_config.
+    """
+    atomic_numbers = np.asarray(data_input.atomic_numbers).reshape(-1)
+    return record_features(
+        atomic_numbers.size,
+        np.count_nonzero(atomic_numbers > heavy_atomic_number),
+        data_input.total_charge.magnitude.reshape(-1)[0],
+        np.asarray(data_input.spin_multiplicity).reshape(-1)[0],
+    )[0]
+
+
+class CostModel:
+    """
+    Predicts the seconds per MD step, per single point and per job of a record from its features.
+
+    Parameters
+    ----------
+    coefficients: np.ndarray, optional, default=None
+        Coefficients of the log step cost for each of feature_names; if None, the prior is used.
+    single_point_ratio: float, optional, default=2.0
+        Cost of a single point at the property accuracy relative to an MD step.
+    n_samples: int, optional, default=0
+        Number of records the model was fitted on.
+    """
+
+    def __init__(
+        self, coefficients=None, single_point_ratio: float = 2.0, n_samples: int = 0
+    ):
+        self.coefficients = None if coefficients is None else np.asarray(coefficients)
+        self.single_point_ratio = single_point_ratio
+        self.n_samples = n_samples
+
+    @property
+    def fitted(self):
+        return self.coefficients is not None
+
+    @classmethod
+    def fit(cls, features: np.ndarray, step_costs: np.ndarray, single_point_ratio: float = 2.0):
+        """
+        Least-squares fit of the log step cost.
+
+        With fewer than two samples per feature, only the intercept and the atom-count exponent are fitted.
+        """
+        features = np.atleast_2d(features)
+        step_costs = np.asarray(step_costs, dtype=np.float64)
+        n_samples = len(step_costs)
+        if n_samples < 2:
+            return cls(single_point_ratio=single_point_ratio, n_samples=n_samples)
+
+        columns = (
+            list(range(len(feature_names)))
+            if n_samples >= 2 * len(feature_names)
+            else [0, 1]
+        )
+        solution, *_ = np.linalg.lstsq(
+            features[:, columns], np.log(step_costs), rcond=None
+        )
+        coefficients = np.zeros(len(feature_names))
+        coefficients[columns] = solution
+        return cls(coefficients, single_point_ratio=single_point_ratio, n_samples=n_samples)
+
+    def step_cost(self, features):
+        """
+        Predicted seconds per MD step; features may be a single vector or a matrix.
+        """
+        from budget import prior_step_cost
+
+        features = np.asarray(features)
+        if not self.fitted:
+            return prior_step_cost(np.exp(features[..., 1]))
+        return np.exp(features @ self.coefficients)
+
+    def single_point_cost(self, features):
+        """
+        Predicted seconds per single point at the property accuracy.
+        """
+        return self.single_point_ratio * self.step_cost(features)
+
+    def job_seconds(self, features, number_of_steps: int, number_of_repeats: int):
+        """
+        Predicted walltime of a run_xtb_calc call with the given sampling.
+        """
+        from budget import estimate_run_cost
+
+        step_cost = self.step_cost(features)
+        return estimate_run_cost(
+            step_cost,
+            self.single_point_ratio * step_cost,
+            number_of_steps,
+            number_of_repeats,
+        )
+
+    def to_dict(self):
+        return {
+            "coefficients": None
+            if self.coefficients is None
+            else self.coefficients.tolist(),
+            "single_point_ratio": self.single_point_ratio,
+            "n_samples": self.n_samples,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        return cls(**values)
+
+
+def training_data(metadata: dict, features: dict):
+    """
+    Collect the samples of completed jobs from the metadata table of a campaign.
+
+    Parameters
+    ----------
+    metadata: dict, required
+        Metadata of the records, keyed by record.
+    features: dict, required
+        Feature vector of each record, see features_from_fields.
+
+    Returns
+    -------
+    tuple
+        (keys, feature matrix, effective step costs, elapsed seconds, single point ratio)
+    """
+    from job_queue import split_conformer_key
+
+    ratios = [
+        entries["single_point_cost_seconds"] / entries["step_cost_seconds"]
+        for entries in metadata.values()
+        if entries.get("step_cost_seconds", 0) > 0
+        and "single_point_cost_seconds" in entries
+    ]
+    single_point_ratio = float(np.median(ratios)) if ratios else 2.0
+
+    keys, rows, step_costs, elapsed = [], [], [], []
+    for key, entries in metadata.items():
+        record_key = split_conformer_key(key)[0]
+        if record_key not in features or "elapsed_seconds" not in entries:
+            continue
+        if "number_of_steps" not in entries or "number_of_repeats" not in entries:
+            continue
+        # the model predicts single-threaded cost
+        if entries.get("n_threads", 1) != 1:
+            continue
+        # runs stopped by an MD check did not take all their steps, and normal-mode sampling takes none
+        if "md_abort_reason" in entries or entries.get("sampler", "md") != "md":
+            continue
+        steps = entries["number_of_steps"]
+        repeats = entries["number_of_repeats"]
+        # elapsed = repeats * steps * c + (repeats + 1) * ratio * c (+ calibration, if any)
+        calibration = entries.get("calibration_steps", 0) + (
+            single_point_ratio if "step_cost_seconds" in entries else 0
+        )
+        denominator = repeats * steps + (repeats + 1) * single_point_ratio + calibration
+        if denominator <= 0 or entries["elapsed_seconds"] <= 0:
+            continue
+        keys.append(key)
+        rows.append(features[record_key])
+        step_costs.append(entries["elapsed_seconds"] / denominator)
+        elapsed.append(entries["elapsed_seconds"])
+
+    return (
+        keys,
+        np.array(rows).reshape(-1, len(feature_names)),
+        np.array(step_costs),
+        np.array(elapsed),
+        single_point_ratio,
+    )
+
+
+def _relative_errors(predicted, actual):
+    return np.abs(predicted - actual) / actual
+
+
+def cross_validate(
+    features: np.ndarray,
+    step_costs: np.ndarray,
+    elapsed: np.ndarray,
+    single_point_ratio: float,
+    n_folds: int = 5,
+    seed: int = 0,
+):
+    """
+    k-fold cross-validated error of the predicted job walltime.
+
+    Returns
+    -------
+    dict
+        Median and mean relative error of the per-job predictions, and the relative error of the
+        summed walltime (the error of a campaign-hours prediction); None values if there are too few samples.
+    """
+    n_samples = len(step_costs)
+    if n_samples < n_folds:
+        return {"median_relative_error": None, "mean_relative_error": None, "total_relative_error": None}
+
+    folds = np.random.default_rng(seed).permutation(n_samples) % n_folds
+    predicted = np.zeros(n_samples)
+    for fold in range(n_folds):
+        test = folds == fold
+        model = CostModel.fit(features[~test], step_costs[~test], single_point_ratio)
+        # step_costs are effective costs of the whole job, so scale them back to the elapsed time
+        predicted[test] = model.step_cost(features[test]) * (elapsed[test] / step_costs[test])
+
+    errors = _relative_errors(predicted, elapsed)
+    return {
+        "median_relative_error": float(np.median(errors)),
+        "mean_relative_error": float(np.mean(errors)),
+        "total_relative_error": float(abs(predicted.sum() - elapsed.sum()) / elapsed.sum()),
+    }
+
+
+def online_error(metadata: dict):
+    """
+    Error of the predictions made before each job ran ("model_predicted_seconds"), in order of completion.
+
+    Returns
+    -------
+    dict
+        Number of predictions and their median relative error, overall and for the most recent quarter.
+    """
+    samples = [
+        (entries.get("completed_time", 0.0), entries["model_predicted_seconds"], entries["elapsed_seconds"])
+        for entries in metadata.values()
+        if "model_predicted_seconds" in entries and entries.get("elapsed_seconds", 0) > 0
+    ]
+    if not samples:
+        return {"n_predictions": 0, "median_relative_error": None, "recent_median_relative_error": None}
+
+    samples.sort()
+    _, predicted, actual = (np.array(column) for column in zip(*samples))
+    errors = _relative_errors(predicted, actual)
+    recent = errors[-max(len(errors) // 4, 1) :]
+    return {
+        "n_predictions": len(errors),
+        "median_relative_error": float(np.median(errors)),
+        "recent_median_relative_error": float(np.median(recent)),
+    }
+
+
+def load_cost_model(database_path: str):
+    """
+    The cost model stored in the "cost_model" table of the campaign database; the prior if none was fitted yet.
+    """
+    from sqlitedict import SqliteDict
+
+    with SqliteDict(database_path, tablename="cost_model") as cost_model_db:
+        values = cost_model_db.get("current")
+    if values is None:
+        return CostModel()
+    return CostModel.from_dict(values)
+
+
+def fit_campaign_cost_model(
+    database_path: str, lockfile_path: str, fields: dict, n_folds: int = 5
+):
+    """
+    Fit the cost model on the completed jobs of a campaign and store it in the campaign database.
+
+    Each fit is appended to the "history" entry of the "cost_model" table with its cross-validated error,
+    so the accuracy of the model can be followed as more jobs complete.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    fields: dict, required
+        Per-record fields of the dataset, see dataset_stats.load_record_fields.
+    n_folds: int, optional, default=5
+        Number of folds used to estimate the prediction error.
+
+    Returns
+    -------
+    tuple
+        (CostModel, dict with the cross-validated and online errors and the fit history)
+    """
+    import time
+    from sqlitedict import SqliteDict
+    from utils import OpenWithLock
+
+    features = features_from_fields(fields)
+    with SqliteDict(database_path, tablename="metadata") as metadata_db:
+        metadata = dict(metadata_db.items())
+
+    _, x, step_costs, elapsed, single_point_ratio = training_data(metadata, features)
+    model = CostModel.fit(x, step_costs, single_point_ratio)
+    report = {"n_samples": model.n_samples, "single_point_ratio": single_point_ratio}
+    report.update(cross_validate(x, step_costs, elapsed, single_point_ratio, n_folds=n_folds))
+    report["online"] = online_error(metadata)
+
+    with OpenWithLock(lockfile_path, "w"):
+        with SqliteDict(
+            database_path, tablename="cost_model", autocommit=True
+        ) as cost_model_db:
+            history = cost_model_db.get("history", [])
+            history.append(
+                {
+                    "time": time.time(),
+                    "n_samples": model.n_samples,
+                    "median_relative_error": report["median_relative_error"],
+                    "total_relative_error": report["total_relative_error"],
+                }
+            )
+            cost_model_db["current"] = model.to_dict()
+            cost_model_db["history"] = history
+    report["history"] = history
+
+    logger.info(
+        f"Fitted cost model on {model.n_samples} records; "
+        f"cross-validated median relative error {report['median_relative_error']}"
+    )
+    return model, report
+
+
+def predict_campaign_hours(
+    model: CostModel,
+    features: dict,
+    status: dict,
+    number_of_steps: int,
+    number_of_repeats: int,
+):
+    """
+    Predicted CPU hours of a campaign, in total and for the jobs that are still to run.
+
+    Jobs still to run are those queued ("not_submitted" or "deferred") or running ("submitted");
+    "failed" and "timed_out" jobs are counted in the total only.
+
+    Parameters
+    ----------
+    model: CostModel, required
+        Cost model used for the predictions.
+    features: dict, required
+        Feature vector of each record, see features_from_fields.
+    status: dict, required
+        Status of each job (the status table of the campaign database).
+    number_of_steps: int, required
+        Number of MD steps between snapshots.
+    number_of_repeats: int, required
+        Number of snapshots.
+
+    Returns
+    -------
+    dict
+        "total_hours", "remaining_hours", "max_job_seconds" and "n_remaining".
+    """
+    included = [key for key, value in status.items() if value != "not_included"]
+    remaining = [
+        key
+        for key in included
+        if status[key] in ["not_submitted", "deferred", "submitted"]
+    ]
+    if not included:
+        return {"total_hours": 0.0, "remaining_hours": 0.0, "max_job_seconds": 0.0, "n_remaining": 0}
+
+    from job_queue import split_conformer_key
+
+    seconds = model.job_seconds(
+        np.array([features[split_conformer_key(key)[0]] for key in included]),
+        number_of_steps,
+        number_of_repeats,
+    )
+    is_remaining = np.isin(included, remaining)
+    return {
+        "total_hours": float(seconds.sum() / 3600.0),
+        "remaining_hours": float(seconds[is_remaining].sum() / 3600.0),
+        "max_job_seconds": float(seconds.max()),
+        "n_remaining": len(remaining),
+    }
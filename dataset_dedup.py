@@ -0,0 +1,378 @@
+"""
+Detection and removal of near-duplicate configurations in exported datasets.
+
+Correlated MD snapshots and overlapping campaigns (e.g., tmQM at 400 K and at 100 K) produce
+configurations that are nearly identical. Configurations are only compared within a stoichiometry,
+total charge and spin multiplicity (different electronic states are never duplicates), through a fingerprint that does not depend on the orientation, position or atom order: the sorted
+interatomic distances of each pair of elements (see pair_fingerprints). Two configurations are
+duplicates if the root mean square difference of their fingerprints is below threshold (angstrom).
+
+Rather than comparing all pairs, each fingerprint is hashed into buckets of n_tables hash tables,
+each keyed by n_projections random projections of the fingerprint quantized to bucket_width (locality
+sensitive hashing for the euclidean distance); only configurations sharing a bucket are compared.
+Configurations are visited in order (files in the order given, then records and configurations in
+file order), and a configuration within threshold of an earlier kept configuration is marked as its
+duplicate, so the first of a set of duplicates is kept.
+
+Stoichiometries are processed in parallel, and only the fingerprints of one stoichiometry are held
+in memory by a process at a time.
+
+Usage
+-----
+python dataset_dedup.py tmqm_T400.hdf5 tmqm_T100.hdf5 --threshold 0.02 --filtered T400_dedup.hdf5 T100_dedup.hdf5
+python campaign.py dedup campaigns/tmqm_T100.toml --reference tmqm_T400.hdf5
+"""
+
+import os
+
+import h5py
+import numpy as np
+from loguru import logger
+
+
+def pair_fingerprints(atomic_numbers, geometry):
+    """
+    Sorted interatomic distances of each pair of elements, for every configuration of a record.
+
+    The distances are grouped by the pair of elements (ordered by atomic numbers) and sorted within
+    each group, so records with the same stoichiometry have fingerprints of the same length, and the
+    fingerprint does not change under rotation, translation or permutation of equal atoms.
+
+    Parameters
+    ----------
+    atomic_numbers: np.ndarray, required
+        Atomic numbers of the record.
+    geometry: np.ndarray, required
+        Positions of the configurations, shape (n_configs, n_atoms, 3).
+
+    Returns
+    -------
+    np.ndarray
+        Fingerprints, shape (n_configs, n_atoms * (n_atoms - 1) / 2).
+    """
+    atomic_numbers = np.asarray(atomic_numbers).reshape(-1)
+    i, j = np.triu_indices(atomic_numbers.size, k=1)
+    low = np.minimum(atomic_numbers[i], atomic_numbers[j])
+    high = np.maximum(atomic_numbers[i], atomic_numbers[j])
+    pair_type = low * 1000 + high
+    order = np.argsort(pair_type, kind="stable")
+    i, j = i[order], j[order]
+    _, block = np.unique(pair_type[order], return_inverse=True)
+
+    difference = geometry[:, i, :] - geometry[:, j, :]
+    distances = np.sqrt(np.einsum("cmk,cmk->cm", difference, difference))
+    # distances are far below the offset, so one sort per configuration sorts within each block
+    offset = 1.0e4 * block
+    # single precision halves the memory of the fingerprints of a stoichiometry
+    return (np.sort(distances + offset, axis=1) - offset).astype(np.float32)
+
+
+def deduplicate(
+    fingerprints,
+    threshold: float = 0.02,
+    n_tables: int = 8,
+    n_projections: int = 4,
+    bucket_width: float = None,
+    seed: int = 0,
+):
+    """
+    Mark the configurations within threshold of an earlier kept configuration.
+
+    Parameters
+    ----------
+    fingerprints: np.ndarray, required
+        Fingerprints of the configurations, in the order they are visited, shape (n, m).
+    threshold: float, optional, default=0.02
+        Configurations whose fingerprints differ by less than this root mean square distance are duplicates.
+    n_tables: int, optional, default=8
+        Number of hash tables; more tables find more duplicates at the cost of more comparisons.
+    n_projections: int, optional, default=4
+        Number of projections in the key of a table; more projections give smaller buckets.
+    bucket_width: float, optional, default=None
+        Width of the quantization of a projection; defaults to 4 times threshold.
+    seed: int, optional, default=0
+        Seed of the random projections.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        (index of the kept configuration each configuration duplicates, -1 if it is kept;
+        root mean square distance to it, NaN if it is kept)
+    """
+    n, m = fingerprints.shape
+    duplicate_of = np.full(n, -1, dtype=np.int64)
+    distance = np.full(n, np.nan)
+    if n == 0:
+        return duplicate_of, distance
+    if bucket_width is None:
+        bucket_width = 4.0 * threshold
+
+    # scaled so the projection of the difference of two fingerprints has the standard deviation
+    # of their root mean square distance
+    rng = np.random.default_rng(seed)
+    projections = rng.normal(size=(m, n_tables * n_projections)) / np.sqrt(max(m, 1))
+    shifts = rng.uniform(0.0, bucket_width, size=n_tables * n_projections)
+    codes = np.floor((fingerprints @ projections + shifts) / bucket_width).astype(np.int64)
+    codes = codes.reshape(n, n_tables, n_projections)
+
+    tables = [{} for _ in range(n_tables)]
+    for index in range(n):
+        buckets = [codes[index, t].tobytes() for t in range(n_tables)]
+        candidates = set()
+        for table, bucket in zip(tables, buckets):
+            candidates.update(table.get(bucket, ()))
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            rms = np.sqrt(
+                np.mean((fingerprints[candidates] - fingerprints[index]) ** 2, axis=1)
+            )
+            best = int(np.argmin(rms))
+            if rms[best] < threshold:
+                duplicate_of[index] = candidates[best]
+                distance[index] = rms[best]
+                continue
+        for table, bucket in zip(tables, buckets):
+            table.setdefault(bucket, []).append(index)
+    return duplicate_of, distance
+
+
+def _deduplicate_groups(file_paths: list, groups: list, options: dict):
+    from dataset_qa import _read
+
+    results = []
+    files = [h5py.File(file_path, "r") for file_path in file_paths]
+    try:
+        for members in groups:
+            fingerprints = []
+            for file_index, key in members:
+                record = files[file_index][key]
+                fingerprints.append(
+                    pair_fingerprints(
+                        record["atomic_numbers"][()], _read(record, "geometry")
+                    )
+                )
+            results.append(deduplicate(np.concatenate(fingerprints), **options))
+    finally:
+        for f in files:
+            f.close()
+    return results
+
+
+def _chunk_groups(groups: list, sizes: list, chunk_size: int):
+    chunk, chunk_configs = [], 0
+    for members, size in zip(groups, sizes):
+        chunk.append(members)
+        chunk_configs += size
+        if chunk_configs >= chunk_size:
+            yield chunk
+            chunk, chunk_configs = [], 0
+    if chunk:
+        yield chunk
+
+
+def find_duplicates(
+    file_paths: list, processes: int = None, chunk_size: int = 20000, **options
+):
+    """
+    Find the near-duplicate configurations of one or more exported datasets.
+
+    Parameters
+    ----------
+    file_paths: list of str, required
+        Exported HDF5 files; configurations of earlier files are kept over duplicates in later ones.
+    processes: int, optional, default=None
+        Number of processes; defaults to the number of cores.
+    chunk_size: int, optional, default=20000
+        Approximate number of configurations handed to a process at a time.
+    **options
+        Passed to deduplicate (threshold, n_tables, n_projections, bucket_width, seed).
+
+    Returns
+    -------
+    dict
+        Per record: "file_index", "keys" and "n_configs" (in file order); per configuration, in the same
+        order: "duplicate_of" (index of the configuration it duplicates, -1 if it is kept) and "distance".
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    from dataset_qa import _read
+
+    file_index, keys, n_configs, states = [], [], [], []
+    for index, file_path in enumerate(file_paths):
+        with h5py.File(file_path, "r") as f:
+            for key, record in f.items():
+                file_index.append(index)
+                keys.append(key)
+                n_configs.append(int(record["n_configs"][()]))
+                # the sorted atomic numbers, rather than the stoichiometry string whose format
+                # depends on the source of the dataset, with the charge and multiplicity of the record
+                states.append(
+                    (
+                        np.sort(record["atomic_numbers"][()].reshape(-1)).tobytes(),
+                        round(float(_read(record, "total_charge").reshape(-1)[0]), 6),
+                        int(record["spin_multiplicity"][()].reshape(-1)[0]),
+                    )
+                )
+    n_configs = np.array(n_configs, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(n_configs)])
+
+    # records of each stoichiometry and electronic state, in the order they are visited
+    group_records = {}
+    for record_index, state in enumerate(states):
+        group_records.setdefault(state, []).append(record_index)
+    groups = list(group_records.values())
+    sizes = [int(n_configs[records].sum()) for records in groups]
+    chunks = list(_chunk_groups(groups, sizes, chunk_size))
+
+    duplicate_of = np.full(offsets[-1], -1, dtype=np.int64)
+    distance = np.full(offsets[-1], np.nan)
+    task = partial(_deduplicate_groups, file_paths, options=options)
+    members = [
+        [[(file_index[r], keys[r]) for r in records] for records in chunk]
+        for chunk in chunks
+    ]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for chunk, results in zip(chunks, pool.map(task, members)):
+            for records, (group_duplicate_of, group_distance) in zip(chunk, results):
+                # map the indices within the group back to the configurations of all files
+                index = np.concatenate(
+                    [np.arange(offsets[r], offsets[r + 1]) for r in records]
+                )
+                duplicate = group_duplicate_of >= 0
+                duplicate_of[index[duplicate]] = index[group_duplicate_of[duplicate]]
+                distance[index] = group_distance
+
+    return {
+        "file_index": np.array(file_index, dtype=np.int64),
+        "keys": np.array(keys, dtype=str),
+        "n_configs": n_configs,
+        "duplicate_of": duplicate_of,
+        "distance": distance,
+    }
+
+
+def summarize(duplicates: dict, file_paths: list):
+    """
+    Number of configurations and duplicates of each file.
+    """
+    config_file = np.repeat(duplicates["file_index"], duplicates["n_configs"])
+    duplicate = duplicates["duplicate_of"] >= 0
+    return {
+        "n_configs": int(duplicate.size),
+        "n_duplicates": int(duplicate.sum()),
+        "files": {
+            file_path: {
+                "n_configs": int((config_file == index).sum()),
+                "n_duplicates": int(duplicate[config_file == index].sum()),
+            }
+            for index, file_path in enumerate(file_paths)
+        },
+    }
+
+
+def write_deduplicated(file_paths: list, output_paths: list, duplicates: dict):
+    """
+    Write a copy of each file without its duplicate configurations, see dataset_qa.write_filtered.
+    """
+    from dataset_qa import write_filtered
+
+    config_file = np.repeat(duplicates["file_index"], duplicates["n_configs"])
+    keep = duplicates["duplicate_of"] < 0
+    for index, (file_path, output_path) in enumerate(zip(file_paths, output_paths)):
+        if output_path is None:
+            continue
+        records = duplicates["file_index"] == index
+        write_filtered(
+            file_path,
+            output_path,
+            {"keys": duplicates["keys"][records], "n_configs": duplicates["n_configs"][records]},
+            keep[config_file == index],
+        )
+
+
+def run_dedup(
+    file_paths: list,
+    report_path: str = None,
+    output_paths: list = None,
+    processes: int = None,
+    **options,
+):
+    """
+    Find the near-duplicates of exported datasets, save the report and optionally write deduplicated copies.
+
+    Parameters
+    ----------
+    file_paths: list of str, required
+        Exported HDF5 files, see find_duplicates.
+    report_path: str, optional, default=None
+        Path of the .npz report (see find_duplicates); defaults to the last file path with ".dedup.npz" appended.
+    output_paths: list of str, optional, default=None
+        Paths of the deduplicated copies, one per file (None to skip a file).
+    processes: int, optional, default=None
+        Number of processes.
+    **options
+        Passed to deduplicate.
+
+    Returns
+    -------
+    dict
+        See summarize.
+    """
+    if report_path is None:
+        report_path = f"{os.path.normpath(file_paths[-1])}.dedup.npz"
+
+    duplicates = find_duplicates(file_paths, processes=processes, **options)
+    np.savez_compressed(
+        report_path, file_paths=np.array(file_paths, dtype=str), **duplicates
+    )
+    summary = summarize(duplicates, file_paths)
+    logger.info(
+        f"{summary['n_duplicates']} of {summary['n_configs']} configurations are duplicates; "
+        f"report saved to {report_path}"
+    )
+    if output_paths is not None:
+        write_deduplicated(file_paths, output_paths, duplicates)
+    return summary
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate configurations in exported datasets."
+    )
+    parser.add_argument("file_paths", nargs="+")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--report", default=None, help="path of the .npz report")
+    parser.add_argument(
+        "--filtered",
+        nargs="+",
+        default=None,
+        help="write a copy of each file without its duplicates to these paths",
+    )
+    parser.add_argument("--threshold", type=float, default=0.02, help="angstrom")
+    parser.add_argument("--n-tables", type=int, default=8)
+    parser.add_argument("--n-projections", type=int, default=4)
+    parser.add_argument("--bucket-width", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    if args.filtered is not None and len(args.filtered) != len(args.file_paths):
+        parser.error("--filtered needs one path per input file")
+
+    summary = run_dedup(
+        args.file_paths,
+        report_path=args.report,
+        output_paths=args.filtered,
+        processes=args.processes,
+        threshold=args.threshold,
+        n_tables=args.n_tables,
+        n_projections=args.n_projections,
+        bucket_width=args.bucket_width,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Quality checks of an exported dataset, flagging configurations with exploded geometries, huge forces,
+charge anomalies or outlying energies.
+
+The records of the exported HDF5 file (see export.py) are read in parallel over chunks of keys, and
+every configuration is checked with array operations over all configurations of a record at once:
+
+- "atoms_overlap": the closest pair of atoms is nearer than overlap_scale times the sum of their
+  covalent radii (as in md_checks.MDCheck);
+- "max_force": the largest force exceeds max_force (eV/angstrom);
+- "charge_sum": the partial charges do not sum to the total charge within max_charge_error (e);
+- "dipole": the dipole moment differs from the dipole of the partial charges by more than
+  max_dipole_error (e*angstrom); xtb dipoles include atomic dipoles, so only large differences are flagged;
+- "energy_outlier": the robust z-score of the energy (distance from the median over the median absolute
+  deviation) among all configurations with the same stoichiometry exceeds max_energy_zscore;
+  stoichiometries with fewer than min_group_size configurations are not checked;
+- "not_finite": any property is NaN or infinite.
+
+The check values and the mask of the configurations that pass are saved to a .npz file, and a copy of
+the dataset holding only those configurations can be written with write_filtered.
+
+Usage
+-----
+python dataset_qa.py tmqm_T400.hdf5 --processes 8 --filtered tmqm_T400_filtered.hdf5
+python campaign.py qa campaigns/tmqm_T400.toml
+"""
+
+import os
+
+import h5py
+import numpy as np
+from loguru import logger
+
+check_names = [
+    "atoms_overlap",
+    "max_force",
+    "charge_sum",
+    "dipole",
+    "energy_outlier",
+    "not_finite",
+]
+# datasets of an exported record with one entry per configuration
+config_datasets = [
+    "geometry",
+    "energy",
+    "forces",
+    "partial_charges",
+    "dipole_moment",
+    "total_charge",
+    "spin_multiplicity",
+]
+# units the checks are computed in
+_check_units = {
+    "geometry": "angstrom",
+    "energy": "kilojoule_per_mole",
+    "forces": "kilojoule_per_mole/angstrom",
+    "partial_charges": "e",
+    "dipole_moment": "e*angstrom",
+    "total_charge": "e",
+}
+_unit_factors = {}
+
+
+def _unit_factor(from_units: str, to_units: str):
+    # pint is only used once per pair of units, the arrays are scaled with plain floats
+    if (from_units, to_units) not in _unit_factors:
+        from openff.units import unit
+        from utils import get_chem_context
+
+        get_chem_context()
+        _unit_factors[(from_units, to_units)] = float(
+            unit.Quantity(1.0, from_units).to(to_units, "chem").m
+        )
+    return _unit_factors[(from_units, to_units)]
+
+
+def _read(record, name: str):
+    values = record[name][()]
+    if name in _check_units:
+        values = values * _unit_factor(record[name].attrs["u"], _check_units[name])
+    return values
+
+
+def check_record(record):
+    """
+    Compute the check values of every configuration of an exported record.
+
+    Parameters
+    ----------
+    record: h5py.Group, required
+        Group of the record, in the layout written by export.write_record.
+
+    Returns
+    -------
+    dict
+        Arrays with one value per configuration: "min_distance_ratio" (closest distance over the sum of
+        covalent radii of the pair), "max_force" (eV/angstrom), "charge_error" (e), "dipole_error"
+        (e*angstrom), "energy" (kJ/mol) and "finite".
+    """
+    from ase import units
+    from ase.data import covalent_radii
+
+    atomic_numbers = record["atomic_numbers"][()].reshape(-1)
+    geometry = _read(record, "geometry")
+    # the unit registry of openff.units has no eV
+    forces = _read(record, "forces") * (units.kJ / units.mol)
+    partial_charges = _read(record, "partial_charges").reshape(geometry.shape[:2])
+    dipole_moment = _read(record, "dipole_moment").reshape(-1, 3)
+    total_charge = _read(record, "total_charge").reshape(-1)
+    energy = _read(record, "energy").reshape(-1)
+
+    radii = covalent_radii[atomic_numbers]
+    radii_sum = radii[:, np.newaxis] + radii[np.newaxis, :]
+    difference = geometry[:, :, np.newaxis, :] - geometry[:, np.newaxis, :, :]
+    distance_ratio = (
+        np.sqrt(np.einsum("cijk,cijk->cij", difference, difference)) / radii_sum
+    )
+    diagonal = np.arange(atomic_numbers.size)
+    distance_ratio[:, diagonal, diagonal] = np.inf
+    min_distance_ratio = distance_ratio.min(axis=(1, 2), initial=np.inf)
+
+    charge_dipole = np.einsum("ci,cik->ck", partial_charges, geometry)
+    finite = np.ones(geometry.shape[0], dtype=bool)
+    for values in [geometry, forces, partial_charges, dipole_moment, energy]:
+        finite &= np.isfinite(values.reshape(geometry.shape[0], -1)).all(axis=1)
+
+    return {
+        "min_distance_ratio": min_distance_ratio,
+        "max_force": np.sqrt(np.einsum("cik,cik->ci", forces, forces)).max(axis=1),
+        "charge_error": np.abs(partial_charges.sum(axis=1) - total_charge),
+        "dipole_error": np.linalg.norm(dipole_moment - charge_dipole, axis=1),
+        "energy": energy,
+        "finite": finite,
+    }
+
+
+def _check_chunk(file_path: str, keys: list):
+    values = []
+    stoichiometry = []
+    with h5py.File(file_path, "r") as f:
+        for key in keys:
+            record = f[key]
+            values.append(check_record(record))
+            stoichiometry.append(record["stoichiometry"].asstr()[()])
+    return values, stoichiometry
+
+
+def collect_checks(file_path: str, processes: int = None, chunk_size: int = 500):
+    """
+    Compute the check values of every configuration of an exported dataset.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path of the exported HDF5 file.
+    processes: int, optional, default=None
+        Number of processes used to read the file; defaults to the number of cores.
+    chunk_size: int, optional, default=500
+        Number of records read by a process at a time.
+
+    Returns
+    -------
+    dict
+        "keys" and "stoichiometry" of the records, "n_configs" (configurations per record), and the
+        arrays of check_record concatenated over all configurations, record by record.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    with h5py.File(file_path, "r") as f:
+        keys = list(f.keys())
+
+    chunks = [keys[i : i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    values, stoichiometry = [], []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for chunk_values, chunk_stoichiometry in pool.map(
+            partial(_check_chunk, file_path), chunks
+        ):
+            values.extend(chunk_values)
+            stoichiometry.extend(chunk_stoichiometry)
+
+    names = ["min_distance_ratio", "max_force", "charge_error", "dipole_error", "energy"]
+    checks = {
+        "keys": np.array(keys, dtype=str),
+        "stoichiometry": np.array(stoichiometry, dtype=str),
+        "n_configs": np.array([v["energy"].size for v in values], dtype=np.int64),
+    }
+    for name in names + ["finite"]:
+        checks[name] = (
+            np.concatenate([v[name] for v in values])
+            if values
+            else np.zeros(0, dtype=bool if name == "finite" else np.float64)
+        )
+    return checks
+
+
+def energy_zscores(energy, groups, min_group_size: int = 10):
+    """
+    Robust z-score of each energy within its group: (energy - median) / (1.4826 * median absolute deviation).
+
+    Parameters
+    ----------
+    energy: np.ndarray, required
+        Energy of each configuration.
+    groups: np.ndarray, required
+        Group (e.g., stoichiometry) of each configuration.
+    min_group_size: int, optional, default=10
+        Groups with fewer configurations get a z-score of 0. Non-finite energies are left out of
+        their group and get a z-score of 0.
+
+    Returns
+    -------
+    np.ndarray
+    """
+    _, inverse, counts = np.unique(groups, return_inverse=True, return_counts=True)
+    zscores = np.zeros(energy.size)
+    # sort by group once, so each group is a contiguous slice
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        index = order[start:end]
+        # a single NaN would make the median of the whole group NaN
+        index = index[np.isfinite(energy[index])]
+        if index.size < min_group_size:
+            continue
+        values = energy[index]
+        median = np.median(values)
+        mad = 1.4826 * np.median(np.abs(values - median))
+        if mad > 0:
+            zscores[index] = (values - median) / mad
+    return zscores
+
+
+def qa_mask(
+    checks: dict,
+    overlap_scale: float = 0.5,
+    max_force: float = 25.0,
+    max_charge_error: float = 0.01,
+    max_dipole_error: float = 1.0,
+    max_energy_zscore: float = 8.0,
+    min_group_size: int = 10,
+):
+    """
+    Apply the thresholds to the check values of collect_checks.
+
+    Parameters
+    ----------
+    checks: dict, required
+        Check values, see collect_checks.
+    overlap_scale: float, optional, default=0.5
+        Atoms closer than overlap_scale times the sum of their covalent radii overlap.
+    max_force: float, optional, default=25.0
+        Largest force accepted (eV/angstrom).
+    max_charge_error: float, optional, default=0.01
+        Largest difference accepted between the sum of the partial charges and the total charge (e).
+    max_dipole_error: float, optional, default=1.0
+        Largest difference accepted between the dipole moment and the dipole of the partial charges (e*angstrom).
+    max_energy_zscore: float, optional, default=8.0
+        Largest absolute robust z-score of the energy accepted within a stoichiometry.
+    min_group_size: int, optional, default=10
+        Stoichiometries with fewer configurations are not checked for energy outliers.
+
+    Returns
+    -------
+    dict
+        Boolean array of each check in check_names (True where the configuration fails), "energy_zscore",
+        and "passed" (True where the configuration passes all checks).
+    """
+    groups = np.repeat(checks["stoichiometry"], checks["n_configs"])
+    zscores = energy_zscores(checks["energy"], groups, min_group_size)
+    # comparisons with NaN are False, so non-finite configurations are only flagged by not_finite
+    failed = {
+        "atoms_overlap": checks["min_distance_ratio"] < overlap_scale,
+        "max_force": checks["max_force"] > max_force,
+        "charge_sum": checks["charge_error"] > max_charge_error,
+        "dipole": checks["dipole_error"] > max_dipole_error,
+        "energy_outlier": np.abs(zscores) > max_energy_zscore,
+        "not_finite": ~checks["finite"],
+    }
+    passed = ~np.logical_or.reduce([failed[name] for name in check_names])
+    return {**failed, "energy_zscore": zscores, "passed": passed}
+
+
+def summarize(checks: dict, mask: dict):
+    """
+    Number of configurations and records that fail each check.
+    """
+    record_index = np.repeat(np.arange(checks["keys"].size), checks["n_configs"])
+    summary = {
+        "n_records": int(checks["keys"].size),
+        "n_configs": int(mask["passed"].size),
+        "n_configs_passed": int(mask["passed"].sum()),
+        "n_records_with_failures": int(np.unique(record_index[~mask["passed"]]).size),
+        "failed_configs": {name: int(mask[name].sum()) for name in check_names},
+    }
+    return summary
+
+
+def save_mask(file_path: str, checks: dict, mask: dict):
+    """
+    Save the check values and the mask to a .npz file; configurations are ordered record by record,
+    with the records in the order of "keys" and "n_configs" configurations each.
+
+    The failed checks are saved as "failed_<check>", next to "energy_zscore" and "passed".
+    """
+    np.savez_compressed(
+        file_path,
+        **checks,
+        **{f"failed_{name}": mask[name] for name in check_names},
+        energy_zscore=mask["energy_zscore"],
+        passed=mask["passed"],
+    )
+
+
+def _filtered_attrs(attrs: dict, keep):
+    if "conformer_n_configs" not in attrs:
+        return attrs
+    n_configs = np.asarray(attrs["conformer_n_configs"])
+    offsets = np.concatenate([[0], np.cumsum(n_configs)])
+    kept = np.array(
+        [int(keep[start:end].sum()) for start, end in zip(offsets[:-1], offsets[1:])]
+    )
+    conformers = kept > 0
+    for name, value in attrs.items():
+        if isinstance(value, np.ndarray) and value.shape[:1] == n_configs.shape:
+            attrs[name] = value[conformers]
+    attrs["conformer_n_configs"] = kept[conformers]
+    return attrs
+
+
+def write_filtered(file_path: str, output_path: str, checks: dict, passed):
+    """
+    Write a copy of an exported dataset holding only the configurations that pass the checks.
+
+    Records without any passing configuration are left out. Attributes with a value per conformer of a
+    merged record (see export.merge_conformers) keep only the conformers with configurations left, and
+    "conformer_n_configs" counts the configurations kept; the other record attributes describe the run
+    and are copied unchanged.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path of the exported HDF5 file.
+    output_path: str, required
+        Path of the filtered HDF5 file to write.
+    checks: dict, required
+        Check values of the file, see collect_checks.
+    passed: np.ndarray, required
+        True for each configuration to keep, see qa_mask.
+
+    Returns
+    -------
+    int
+        Number of records written.
+    """
+    from tqdm import tqdm
+
+    offsets = np.concatenate([[0], np.cumsum(checks["n_configs"])])
+    n_written = 0
+    with h5py.File(file_path, "r") as source, h5py.File(output_path, "w") as target:
+        for i, key in enumerate(tqdm(checks["keys"].tolist())):
+            keep = passed[offsets[i] : offsets[i + 1]]
+            if not keep.any():
+                continue
+            record = source[key]
+            if keep.all():
+                source.copy(record, target, name=key)
+                n_written += 1
+                continue
+
+            filtered = target.create_group(key)
+            for name, dataset in record.items():
+                if name in config_datasets:
+                    filtered.create_dataset(name, data=dataset[()][keep])
+                    for attr, value in dataset.attrs.items():
+                        filtered[name].attrs[attr] = value
+                elif name == "n_configs":
+                    filtered.create_dataset(name, data=int(keep.sum()))
+                else:
+                    source.copy(dataset, filtered, name=name)
+            for attr, value in _filtered_attrs(dict(record.attrs), keep).items():
+                filtered.attrs[attr] = value
+            n_written += 1
+    logger.info(f"Wrote {n_written} of {checks['keys'].size} records to {output_path}")
+    return n_written
+
+
+def run_qa(
+    file_path: str,
+    mask_path: str = None,
+    filtered_path: str = None,
+    processes: int = None,
+    **thresholds,
+):
+    """
+    Check an exported dataset, save the mask and optionally write a filtered copy.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path of the exported HDF5 file.
+    mask_path: str, optional, default=None
+        Path of the .npz file with the check values and mask; defaults to the file path with ".qa.npz" appended.
+    filtered_path: str, optional, default=None
+        If set, a copy holding only the configurations that pass is written there.
+    processes: int, optional, default=None
+        Number of processes used to read the file.
+    **thresholds
+        Passed to qa_mask.
+
+    Returns
+    -------
+    dict
+        See summarize.
+    """
+    if mask_path is None:
+        mask_path = f"{os.path.normpath(file_path)}.qa.npz"
+
+    checks = collect_checks(file_path, processes=processes)
+    mask = qa_mask(checks, **thresholds)
+    save_mask(mask_path, checks, mask)
+    summary = summarize(checks, mask)
+    logger.info(
+        f"{summary['n_configs_passed']} of {summary['n_configs']} configurations pass; mask saved to {mask_path}"
+    )
+    if filtered_path is not None:
+        write_filtered(file_path, filtered_path, checks, mask["passed"])
+    return summary
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Quality checks of an exported dataset.")
+    parser.add_argument("file_path")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--mask", default=None, help="path of the .npz file with the mask")
+    parser.add_argument(
+        "--filtered", default=None, help="write the configurations that pass to this file"
+    )
+    parser.add_argument("--overlap-scale", type=float, default=0.5)
+    parser.add_argument("--max-force", type=float, default=25.0, help="eV/angstrom")
+    parser.add_argument("--max-charge-error", type=float, default=0.01, help="e")
+    parser.add_argument("--max-dipole-error", type=float, default=1.0, help="e*angstrom")
+    parser.add_argument("--max-energy-zscore", type=float, default=8.0)
+    parser.add_argument("--min-group-size", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    summary = run_qa(
+        args.file_path,
+        mask_path=args.mask,
+        filtered_path=args.filtered,
+        processes=args.processes,
+        overlap_scale=args.overlap_scale,
+        max_force=args.max_force,
+        max_charge_error=args.max_charge_error,
+        max_dipole_error=args.max_dipole_error,
+        max_energy_zscore=args.max_energy_zscore,
+        min_group_size=args.min_group_size,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
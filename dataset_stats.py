@@ -0,0 +1,312 @@
+"""
+Statistics of an input dataset (atom counts, elements, charges, multiplicities and predicted cost).
+
+Records are read through the input adapters (see adapters.py). Only the fields needed are read
+(atomic numbers, total charge and spin multiplicity), in parallel over chunks of keys, and the
+per-record values are cached in a sidecar .npz file next to the dataset, so later calls (e.g., with
+a different element filter) do not need to read the dataset again.
+
+Usage
+-----
+python dataset_stats.py /path/to/tmqm_dataset_v0.hdf5 --processes 8 --plot size_dist.png
+python campaign.py stats campaigns/tmqm_T100.toml
+"""
+
+import os
+
+import numpy as np
+from loguru import logger
+
+max_atomic_number = 118
+field_names = [
+    "keys",
+    "n_atoms",
+    "total_charge",
+    "spin_multiplicity",
+    "n_configs",
+    "elements",
+    "element_counts",
+]
+
+
+def _read_chunk(dataset_format: str, dataset_path: str, dataset_options: dict, keys: list):
+    from adapters import open_adapter
+
+    n_atoms = np.zeros(len(keys), dtype=np.int64)
+    total_charge = np.zeros(len(keys))
+    spin_multiplicity = np.zeros(len(keys), dtype=np.int64)
+    n_configs = np.zeros(len(keys), dtype=np.int64)
+    element_counts = np.zeros((len(keys), max_atomic_number + 1), dtype=np.int32)
+
+    with open_adapter(dataset_format, dataset_path, dataset_options) as adapter:
+        for i, key in enumerate(keys):
+            summary = adapter.summary(key)
+            n_atoms[i] = summary.atomic_numbers.size
+            element_counts[i] = np.bincount(
+                summary.atomic_numbers, minlength=max_atomic_number + 1
+            )
+            total_charge[i] = summary.total_charge
+            spin_multiplicity[i] = summary.spin_multiplicity
+            n_configs[i] = summary.n_configs
+
+    return n_atoms, total_charge, spin_multiplicity, n_configs, element_counts
+
+
+def collect_record_fields(
+    dataset_path: str,
+    processes: int = None,
+    chunk_size: int = 2000,
+    dataset_format: str = "modelforge_hdf5",
+    dataset_options: dict = None,
+):
+    """
+    Read the atom count, element composition, total charge and spin multiplicity of every record.
+
+    Parameters
+    ----------
+    dataset_path: str, required
+        Path to the dataset.
+    processes: int, optional, default=None
+        Number of processes used to read the file; defaults to the number of cores.
+    chunk_size: int, optional, default=2000
+        Number of keys read by a process at a time.
+    dataset_format: str, optional, default="modelforge_hdf5"
+        Format of the dataset, see adapters.open_adapter.
+    dataset_options: dict, optional, default=None
+        Options of the input adapter.
+
+    Returns
+    -------
+    dict
+        Arrays "keys", "n_atoms", "total_charge", "spin_multiplicity", "n_configs" (number of starting
+        conformers), and "elements" with "element_counts" (number of atoms of each element in each record).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from adapters import open_adapter
+
+    with open_adapter(dataset_format, dataset_path, dataset_options) as adapter:
+        keys = list(adapter.keys())
+
+    chunks = [keys[i : i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    read_chunk = partial(_read_chunk, dataset_format, dataset_path, dataset_options)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(read_chunk, chunks))
+
+    if results:
+        n_atoms, total_charge, spin_multiplicity, n_configs, element_counts = [
+            np.concatenate(parts) for parts in zip(*results)
+        ]
+    else:
+        n_atoms = np.zeros(0, dtype=np.int64)
+        total_charge = np.zeros(0)
+        spin_multiplicity = np.zeros(0, dtype=np.int64)
+        n_configs = np.zeros(0, dtype=np.int64)
+        element_counts = np.zeros((0, max_atomic_number + 1), dtype=np.int32)
+
+    # only keep the columns of elements that appear in the dataset
+    elements = np.nonzero(element_counts.sum(axis=0))[0]
+    return {
+        "keys": np.array(keys, dtype=str),
+        "n_atoms": n_atoms,
+        "total_charge": total_charge,
+        "spin_multiplicity": spin_multiplicity,
+        "n_configs": n_configs,
+        "elements": elements,
+        "element_counts": element_counts[:, elements],
+    }
+
+
+def load_record_fields(
+    dataset_path: str,
+    sidecar_path: str = None,
+    processes: int = None,
+    dataset_format: str = "modelforge_hdf5",
+    dataset_options: dict = None,
+):
+    """
+    Return the per-record fields of the dataset, from the sidecar file if it is up to date.
+
+    The sidecar stores the size and modification time of the dataset, and is regenerated if either changed.
+
+    Parameters
+    ----------
+    dataset_path: str, required
+        Path to the dataset.
+    sidecar_path: str, optional, default=None
+        Path of the sidecar file; defaults to the dataset path with ".stats.npz" appended.
+    processes: int, optional, default=None
+        Number of processes used if the dataset has to be read.
+    dataset_format: str, optional, default="modelforge_hdf5"
+        Format of the dataset, see adapters.open_adapter.
+    dataset_options: dict, optional, default=None
+        Options of the input adapter.
+
+    Returns
+    -------
+    dict
+        See collect_record_fields.
+    """
+    from adapters import open_adapter
+
+    if sidecar_path is None:
+        sidecar_path = f"{os.path.normpath(dataset_path)}.stats.npz"
+
+    signature = open_adapter(dataset_format, dataset_path, dataset_options).signature()
+    if os.path.exists(sidecar_path):
+        with np.load(sidecar_path) as sidecar:
+            # sidecars written by older versions may lack some fields
+            if np.array_equal(sidecar["signature"], signature) and set(
+                field_names
+            ).issubset(sidecar.files):
+                return {name: sidecar[name] for name in field_names}
+        logger.info(f"{sidecar_path} is out of date; reading {dataset_path}")
+
+    fields = collect_record_fields(
+        dataset_path,
+        processes=processes,
+        dataset_format=dataset_format,
+        dataset_options=dataset_options,
+    )
+    try:
+        np.savez_compressed(sidecar_path, signature=signature, **fields)
+    except OSError as e:
+        logger.warning(f"Could not write {sidecar_path}: {e}")
+    return fields
+
+
+def _distribution(values):
+    unique, counts = np.unique(values, return_counts=True)
+    return {str(u.item()): int(c) for u, c in zip(unique, counts)}
+
+
+def summarize(
+    fields: dict,
+    elements_to_include=None,
+    number_of_steps: int = 100,
+    number_of_repeats: int = 10,
+    cost_model=None,
+):
+    """
+    Compute distributions and predicted cost for the records of a dataset.
+
+    Parameters
+    ----------
+    fields: dict, required
+        Per-record fields, see collect_record_fields.
+    elements_to_include: list of int, optional, default=None
+        If set, only records made up of these elements are included (as in setup_status_db).
+    number_of_steps: int, optional, default=100
+        Number of MD steps between snapshots, used to predict the cost.
+    number_of_repeats: int, optional, default=10
+        Number of snapshots, used to predict the cost.
+    cost_model: CostModel, optional, default=None
+        Model used to predict the cost; if None, the prior estimate from the atom count is used.
+
+    Returns
+    -------
+    dict
+        Number of records, atom-count statistics and histogram, the number of records containing each element,
+        charge and multiplicity distributions, and the predicted walltime of the records.
+    """
+    from cost_model import CostModel, features_from_fields
+
+    mask = np.ones(len(fields["n_atoms"]), dtype=bool)
+    if elements_to_include is not None:
+        excluded = ~np.isin(fields["elements"], elements_to_include)
+        mask = fields["element_counts"][:, excluded].sum(axis=1) == 0
+
+    n_atoms = fields["n_atoms"][mask]
+    element_counts = fields["element_counts"][mask]
+    if cost_model is None:
+        cost_model = CostModel()
+    features = features_from_fields(fields)
+    predicted_seconds = np.array(
+        [
+            cost_model.job_seconds(features[key], number_of_steps, number_of_repeats)
+            for key in fields["keys"][mask].tolist()
+        ]
+    )
+
+    summary = {
+        "n_records": int(mask.sum()),
+        "n_records_excluded": int((~mask).sum()),
+        "n_atoms": {
+            "min": int(n_atoms.min()) if n_atoms.size else 0,
+            "max": int(n_atoms.max()) if n_atoms.size else 0,
+            "mean": float(n_atoms.mean()) if n_atoms.size else 0.0,
+            "median": float(np.median(n_atoms)) if n_atoms.size else 0.0,
+            "distribution": _distribution(n_atoms),
+        },
+        "records_containing_element": {
+            str(int(z)): int(count)
+            for z, count in zip(fields["elements"], (element_counts > 0).sum(axis=0))
+            if count > 0
+        },
+        "total_charge": _distribution(fields["total_charge"][mask]),
+        "spin_multiplicity": _distribution(fields["spin_multiplicity"][mask]),
+        "n_configs": _distribution(fields["n_configs"][mask]),
+        "predicted_cost": {
+            "total_hours": float(predicted_seconds.sum() / 3600.0),
+            "mean_job_seconds": float(predicted_seconds.mean())
+            if predicted_seconds.size
+            else 0.0,
+            "max_job_seconds": float(predicted_seconds.max())
+            if predicted_seconds.size
+            else 0.0,
+        },
+    }
+    return summary
+
+
+def plot_size_distribution(fields: dict, file_path: str, bins: int = 100):
+    """
+    Save a histogram of the number of atoms per record.
+    """
+    from matplotlib import pyplot as plt
+
+    plt.hist(fields["n_atoms"], bins=bins)
+    plt.xlabel("number of atoms")
+    plt.ylabel("number of records")
+    plt.savefig(file_path)
+    plt.close()
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    from adapters import adapter_names
+
+    parser = argparse.ArgumentParser(description="Statistics of an input dataset.")
+    parser.add_argument("dataset_path")
+    parser.add_argument("--format", choices=adapter_names, default="modelforge_hdf5")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--sidecar", default=None, help="path of the sidecar cache file")
+    parser.add_argument(
+        "--elements", type=int, nargs="+", default=None, help="atomic numbers to include"
+    )
+    parser.add_argument("--number-of-steps", type=int, default=100)
+    parser.add_argument("--number-of-repeats", type=int, default=10)
+    parser.add_argument("--plot", default=None, help="save a histogram of the atom counts")
+    args = parser.parse_args(argv)
+
+    fields = load_record_fields(
+        args.dataset_path,
+        sidecar_path=args.sidecar,
+        processes=args.processes,
+        dataset_format=args.format,
+    )
+    summary = summarize(
+        fields,
+        elements_to_include=args.elements,
+        number_of_steps=args.number_of_steps,
+        number_of_repeats=args.number_of_repeats,
+    )
+    print(json.dumps(summary, indent=2))
+    if args.plot is not None:
+        plot_size_distribution(fields, args.plot)
+
+
+if __name__ == "__main__":
+    main()
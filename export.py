@@ -0,0 +1,266 @@
+import h5py
+from loguru import logger
+from sqlitedict import SqliteDict
+
+
+def write_record(f, key: str, xtb_properties, metadata: dict = None):
+    """
+    Write a single DataPoint to the HDF5 file, using the modelforge layout.
+
+    Parameters
+    ----------
+    f: h5py.File, required
+        Open HDF5 file to write to.
+    key: str, required
+        Name of the group to create.
+    xtb_properties: DataPoint, required
+        Record to write.
+    metadata: dict, optional, default=None
+        Entries written as attributes of the record group.
+    """
+    dt = h5py.special_dtype(vlen=str)
+
+    record = f.create_group(key)
+    record.create_dataset(
+        "atomic_numbers",
+        data=xtb_properties.atomic_numbers,
+        shape=xtb_properties.atomic_numbers.shape,
+    )
+    for name in [
+        "geometry",
+        "energy",
+        "forces",
+        "partial_charges",
+        "dipole_moment",
+        "total_charge",
+    ]:
+        quantity = getattr(xtb_properties, name)
+        record.create_dataset(name, data=quantity.m, shape=quantity.shape)
+        record[name].attrs["u"] = str(quantity.u)
+
+    record.create_dataset(
+        "spin_multiplicity",
+        data=xtb_properties.spin_multiplicity,
+        shape=xtb_properties.spin_multiplicity.shape,
+    )
+
+    record.create_dataset("n_configs", data=xtb_properties.n_configs)
+
+    record.create_dataset("stoichiometry", data=xtb_properties.stoichiometry, dtype=dt)
+
+    if metadata is not None:
+        for name, value in metadata.items():
+            record.attrs[name] = value
+
+
+def merge_conformers(xtb_properties: list, metadata: list):
+    """
+    Merge the results of the conformer jobs of a record into a single record.
+
+    The configurations of the conformers are concatenated in order. For each metadata entry that
+    all conformers have, the merged metadata holds the array of its values, one per conformer
+    (string entries, e.g., "sampler" or the provenance hashes, are stored once if all conformers
+    have the same value, and otherwise as an array of variable-length strings);
+    "conformer_index" and "conformer_n_configs" give the index of each merged conformer and the number
+    of configurations that came from it (records are also exported while some conformers are still running).
+
+    Parameters
+    ----------
+    xtb_properties: list of DataPoint, required
+        Results of the conformer jobs, in conformer order.
+    metadata: list of dict, required
+        Metadata of the conformer jobs (empty dicts if there is none).
+
+    Returns
+    -------
+    tuple
+        (DataPoint, dict of metadata)
+    """
+    import numpy as np
+    from dataclasses import replace
+    from job_queue import split_conformer_key
+
+    first = xtb_properties[0]
+    merged = {}
+    for name in [
+        "geometry",
+        "energy",
+        "forces",
+        "partial_charges",
+        "dipole_moment",
+        "total_charge",
+    ]:
+        units = getattr(first, name).u
+        merged[name] = (
+            np.concatenate([getattr(point, name).m_as(units) for point in xtb_properties])
+            * units
+        )
+    merged["spin_multiplicity"] = np.concatenate(
+        [point.spin_multiplicity for point in xtb_properties]
+    )
+    n_configs = [int(point.n_configs) for point in xtb_properties]
+    merged_point = replace(
+        first,
+        name=split_conformer_key(first.name)[0],
+        n_configs=sum(n_configs),
+        **merged,
+    )
+
+    merged_metadata = {
+        "conformer_index": np.array(
+            [split_conformer_key(point.name)[1] for point in xtb_properties]
+        ),
+        "conformer_n_configs": np.array(n_configs),
+    }
+    for name in set.intersection(*(set(entries) for entries in metadata)):
+        values = [entries[name] for entries in metadata]
+        if not any(isinstance(value, str) for value in values):
+            merged_metadata[name] = np.array(values)
+        # HDF5 attributes cannot hold numpy unicode arrays
+        elif all(value == values[0] for value in values):
+            merged_metadata[name] = values[0]
+        else:
+            merged_metadata[name] = np.array(values, dtype=h5py.string_dtype())
+    return merged_point, merged_metadata
+
+
+def export_results_to_hdf5(
+    database_path: str, output_path: str, incremental: bool = False
+):
+    """
+    Export the completed records in the results table of the campaign database to an HDF5 file.
+
+    Only jobs whose status is "completed" are written; results left by jobs that were queued again
+    (e.g., after a change of the campaign settings) are skipped, and removed from the file on an
+    incremental export. Any metadata recorded for a record (see job_queue.record_metadata) is written as attributes of its group.
+    The results of conformer jobs (see job_queue.conformer_key) are merged into one group per record
+    with merge_conformers; a record is rewritten whenever one of its conformers is completed.
+    Exported records are flagged in the "exported" table of the campaign database; the flag is cleared
+    when a record is completed again, so a recomputed record is exported again.
+
+    Note, the results are pickled DataPoint instances, so this needs xtb_config_gen to be importable.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that stores the results.
+    output_path: str, required
+        Path of the HDF5 file to write.
+    incremental: bool, optional, default=False
+        If False, the file is overwritten with all records.
+        If True, records already exported to this file are skipped and only new completions are appended;
+        if the file does not exist, all records are exported.
+
+    Returns
+    -------
+    int
+        Number of jobs written (conformer jobs are counted separately).
+    """
+    import os
+    import time
+    from tqdm import tqdm
+    from job_queue import split_conformer_key
+
+    # xtb_config_gen imports openff.units lazily, but the pickled quantities of the results can
+    # only be loaded once its unit registry (with e.g. kilojoule_per_mole) is the application registry
+    from openff.units import unit  # noqa: F401
+
+    output_path = os.path.abspath(output_path)
+    incremental = incremental and os.path.exists(output_path)
+
+    with SqliteDict(database_path, tablename="status") as status_db:
+        completed = {key for key, status in status_db.items() if status == "completed"}
+    with SqliteDict(database_path, tablename="metadata") as metadata_db:
+        metadata = dict(metadata_db.items())
+    with SqliteDict(database_path, tablename="exported") as exported_db:
+        exported = {
+            key
+            for key, flag in exported_db.items()
+            if flag["output_path"] == output_path
+        }
+
+    written = []
+    with SqliteDict(database_path, tablename="results") as results_db:
+        # jobs of each record, in conformer order
+        jobs = {}
+        for key in results_db.keys():
+            if key not in completed:
+                continue
+            parent, index = split_conformer_key(key)
+            jobs.setdefault(parent, []).append((-1 if index is None else index, key))
+        # exported jobs that are no longer completed
+        stale = exported - completed
+
+        with h5py.File(output_path, "a" if incremental else "w") as f:
+            in_file = set(f.keys())
+            parents = list(jobs)
+            if incremental:
+                stale_parents = {split_conformer_key(key)[0] for key in stale}
+                parents = [
+                    parent
+                    for parent in parents
+                    if parent not in in_file
+                    or parent in stale_parents
+                    or any(key not in exported for _, key in jobs[parent])
+                ]
+                for parent in stale_parents - set(jobs):
+                    if parent in f:
+                        del f[parent]
+            for parent in tqdm(parents):
+                keys = [key for _, key in sorted(jobs[parent])]
+                # a group left by an earlier export of a record that was since recomputed
+                # (or that had fewer conformers completed)
+                if parent in f:
+                    del f[parent]
+                if keys == [parent]:
+                    write_record(f, parent, results_db[parent], metadata.get(parent))
+                else:
+                    write_record(
+                        f,
+                        parent,
+                        *merge_conformers(
+                            [results_db[key] for key in keys],
+                            [metadata.get(key, {}) for key in keys],
+                        ),
+                    )
+                written.extend(keys)
+
+    now = time.time()
+    with SqliteDict(database_path, tablename="exported", autocommit=False) as exported_db:
+        if not incremental:
+            exported_db.clear()
+        for key in stale:
+            if key in exported_db:
+                del exported_db[key]
+        for key in written:
+            exported_db[key] = {"output_path": output_path, "time": now}
+        exported_db.commit()
+
+    logger.info(f"Exported {len(written)} jobs to {output_path}")
+    return len(written)
+
+
+def repack_hdf5(file_path: str):
+    """
+    Rewrite an HDF5 file to reclaim the space left by deleted or replaced groups.
+
+    The records are copied to a temporary file next to the original, which then replaces it.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path of the HDF5 file to repack.
+    """
+    import os
+
+    tmp_path = f"{file_path}.repack"
+    with h5py.File(file_path, "r") as source, h5py.File(tmp_path, "w") as target:
+        for key in source.keys():
+            source.copy(source[key], target, name=key)
+        for name, value in source.attrs.items():
+            target.attrs[name] = value
+    size_before = os.path.getsize(file_path)
+    os.replace(tmp_path, file_path)
+    logger.info(
+        f"Repacked {file_path}: {size_before / 1e6:.1f} MB -> {os.path.getsize(file_path) / 1e6:.1f} MB"
+    )
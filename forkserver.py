@@ -0,0 +1,195 @@
+"""
+Fork-server worker: a pre-warmed parent process that forks an isolated child per job.
+
+A crash of tblite (a segmentation fault or a Fortran stop) or slow memory growth in a long-lived
+worker can take down every job that worker would still have run. The parent of this worker imports
+xtb_config_gen, ase, tblite and openff.units once and keeps the worker queue; each job (or small
+batch of jobs, see forkserver_jobs_per_child) runs in a child forked from it, so the child starts
+with the modules already imported and exits when its jobs are done. If a child dies, the parent
+records the exit status as a failure of the job it was running (see job_queue.record_failure):
+the job is returned to the queue until it has failed max_job_attempts times, and is marked "failed" after that.
+"""
+
+import os
+import sys
+from multiprocessing import Pipe
+from time import time
+
+from loguru import logger
+
+from campaign import (
+    CampaignConfig,
+    _job_budget,
+    _open_budget,
+    _open_cache,
+    compute_job,
+    _time_out,
+    load_record,
+    open_worker_queue,
+)
+from watchdog import JobTimeout
+
+
+def warm_up():
+    """
+    Import the modules used by the jobs, so forked children do not import them again.
+    """
+    import ase.md.langevin  # noqa: F401
+    import tblite.ase  # noqa: F401
+    import tblite.interface  # noqa: F401
+    from openff.units import unit  # noqa: F401
+
+    import backends  # noqa: F401
+    import xtb_config_gen  # noqa: F401
+
+
+def _describe_exit(status: int):
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code < 0:
+        import signal
+
+        return f"killed by {signal.Signals(-exit_code).name}"
+    return f"exited with status {exit_code}"
+
+
+def _run_child(config: CampaignConfig, jobs: list, cost_model, connection):
+    """
+    Run the jobs of a child and send each result to the parent; never returns.
+    """
+    import traceback
+
+    exit_code = 0
+    cache = None
+    try:
+        # sqlite connections cannot be shared with the parent, so the child opens its own
+        cache = _open_cache(config)
+        for key, budget_seconds in jobs:
+            connection.send(("started", key, None))
+            try:
+                result = compute_job(
+                    config,
+                    load_record(config, key),
+                    cache=cache,
+                    budget_seconds=budget_seconds,
+                    cost_model=cost_model,
+                )
+            except JobTimeout as e:
+                connection.send(("timed_out", key, e))
+                continue
+            except Exception:
+                logger.exception(f"{key} failed")
+                connection.send(("error", key, traceback.format_exc(limit=-1).strip()))
+                continue
+            connection.send(("completed", key, result))
+    except BaseException:
+        # includes SystemExit raised by the SIGTERM handler inherited from the parent
+        exit_code = 1
+    finally:
+        if cache is not None:
+            cache.close()
+        connection.close()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def _run_batch(config: CampaignConfig, queue, campaign_budget, cost_model, jobs: list):
+    """
+    Fork a child for the jobs, and record their results or failures.
+    """
+    reader, writer = Pipe(duplex=False)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        reader.close()
+        _run_child(config, jobs, cost_model, writer)
+    writer.close()
+
+    budgets = dict(jobs)
+    unfinished = [key for key, _ in jobs]
+    running, started = None, time()
+    try:
+        while True:
+            try:
+                event, key, payload = reader.recv()
+            except EOFError:
+                break
+            if event == "started":
+                running, started = key, time()
+                continue
+
+            running = None
+            unfinished.remove(key)
+            if event == "completed":
+                xtb_properties, metadata = payload
+                if campaign_budget is not None:
+                    campaign_budget.settle(budgets[key], metadata["cpu_seconds"])
+                queue.complete(key, xtb_properties, metadata)
+            elif event == "timed_out":
+                _time_out(config, queue, campaign_budget, key, budgets[key], payload)
+            else:
+                if campaign_budget is not None:
+                    campaign_budget.settle(budgets[key], time() - started)
+                queue.fail(
+                    key, payload.splitlines()[-1], max_attempts=config.max_job_attempts
+                )
+        _, status = os.waitpid(pid, 0)
+        pid = None
+    finally:
+        reader.close()
+        if pid is not None:
+            # the parent is exiting (e.g., SIGTERM); stop the child so its jobs can be released
+            import signal
+
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+
+    if running is not None:
+        reason = _describe_exit(status)
+        logger.error(f"child {reason} while running {running}")
+        unfinished.remove(running)
+        if campaign_budget is not None:
+            campaign_budget.settle(budgets[running], time() - started)
+        queue.fail(running, reason, max_attempts=config.max_job_attempts)
+    if unfinished:
+        # jobs of the batch the child did not reach
+        for key in unfinished:
+            if campaign_budget is not None:
+                campaign_budget.settle(budgets[key], 0.0)
+        queue.release(unfinished)
+
+
+def run_forkserver_worker(config: CampaignConfig, n_jobs: int = 1, reverse: bool = False):
+    """
+    Claim and run up to n_jobs records, each batch of forkserver_jobs_per_child records in a forked child.
+
+    Parameters
+    ----------
+    config: CampaignConfig, required
+        Settings of the campaign.
+    n_jobs: int, optional, default=1
+        Maximum number of records to run (completed or failed).
+    reverse: bool, optional, default=False
+        If True, claim records starting from the end of the queue.
+    """
+    from cost_model import load_cost_model
+
+    warm_up()
+    campaign_budget = _open_budget(config)
+    cost_model = load_cost_model(config.database_path)
+
+    with open_worker_queue(config, reverse=reverse, cost_model=cost_model) as queue:
+        n_run = 0
+        while n_run < n_jobs:
+            jobs = []
+            while len(jobs) < min(config.forkserver_jobs_per_child, n_jobs - n_run):
+                key = queue.next_key()
+                if key is None:
+                    break
+                jobs.append((key, _job_budget(config, campaign_budget, key)))
+            if not jobs:
+                logger.info("No records left to submit.")
+                break
+            _run_batch(config, queue, campaign_budget, cost_model, jobs)
+            n_run += len(jobs)
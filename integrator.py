@@ -0,0 +1,160 @@
+import numpy as np
+
+
+class BAOABLangevin:
+    """
+    Langevin integrator using the BAOAB splitting, operating directly on numpy arrays.
+
+    This avoids the per-step overhead of ase.md.Langevin (observers, Atoms property caches,
+    calculator bookkeeping), which is noticeable for small molecules.
+    Units follow ASE: positions in angstrom, masses in amu, energies in eV.
+
+    Parameters
+    ----------
+    masses: np.ndarray, required
+        Atomic masses in amu, shape (n_atoms,).
+    positions: np.ndarray, required
+        Initial positions in angstrom, shape (n_atoms, 3).
+    force_function: callable, required
+        Function that takes positions and returns (energy, forces) in eV and eV/angstrom.
+    timestep: float, required
+        Timestep in fs.
+    temperature: float, required
+        Temperature in K.
+    friction: float, required
+        Friction coefficient in 1/fs.
+    rng: np.random.Generator, optional, default=None
+        Random number generator; if None, a new unseeded generator is created.
+    velocities: np.ndarray, optional, default=None
+        Initial velocities in ASE units; zero if not provided, matching ase.md.Langevin with a fresh Atoms object.
+
+    Examples
+    --------
+    >>> backend = TBLiteBackend(mol.get_atomic_numbers(), mol.get_positions(), charge=0.0, accuracy=2.0)
+    >>> dyn = BAOABLangevin(mol.get_masses(), mol.get_positions(), backend.energy_and_forces, 1.0, 400.0, 0.01)
+    >>> dyn.run(100)
+    >>> dyn.positions
+
+    """
+
+    def __init__(
+        self,
+        masses: np.ndarray,
+        positions: np.ndarray,
+        force_function,
+        timestep: float,
+        temperature: float,
+        friction: float,
+        rng: np.random.Generator = None,
+        velocities: np.ndarray = None,
+    ):
+        import ase.units as ase_units
+
+        self.positions = np.ascontiguousarray(positions, dtype=np.float64).copy()
+        self.velocities = (
+            np.zeros_like(self.positions)
+            if velocities is None
+            else np.ascontiguousarray(velocities, dtype=np.float64).copy()
+        )
+        self._masses = np.asarray(masses, dtype=np.float64).reshape(-1, 1)
+        self._force_function = force_function
+        self._rng = np.random.default_rng() if rng is None else rng
+
+        self.dt = timestep * ase_units.fs
+        self.kT = temperature * ase_units.kB
+        gamma = friction / ase_units.fs
+        self._c1 = np.exp(-gamma * self.dt)
+        self._c2 = np.sqrt((1.0 - self._c1**2) * self.kT / self._masses)
+        self._half_dt_over_m = 0.5 * self.dt / self._masses
+
+        self.nsteps = 0
+        self.potential_energy, self.forces = self._force_function(self.positions)
+
+    def step(self):
+        v = self.velocities
+        x = self.positions
+
+        # B
+        v += self._half_dt_over_m * self.forces
+        # A
+        x += 0.5 * self.dt * v
+        # O
+        v *= self._c1
+        v += self._c2 * self._rng.standard_normal(v.shape)
+        # A
+        x += 0.5 * self.dt * v
+        # B
+        self.potential_energy, self.forces = self._force_function(x)
+        v += self._half_dt_over_m * self.forces
+
+        self.nsteps += 1
+
+    def kinetic_energy(self):
+        """
+        Kinetic energy in eV.
+        """
+        return 0.5 * float(np.sum(self._masses * self.velocities**2))
+
+    def temperature(self):
+        """
+        Instantaneous temperature in K, using 3 * n_atoms degrees of freedom (as ASE does).
+        """
+        import ase.units as ase_units
+
+        return 2.0 * self.kinetic_energy() / (3 * len(self._masses) * ase_units.kB)
+
+    def run(self, steps: int, callback=None, interval: int = 1):
+        """
+        Propagate the system.
+
+        Parameters
+        ----------
+        steps: int, required
+            Number of steps to take.
+        callback: callable, optional, default=None
+            Called with the integrator every interval steps (e.g., for logging or writing a trajectory).
+        interval: int, optional, default=1
+            Number of steps between callbacks.
+        """
+        for i in range(steps):
+            self.step()
+            if callback is not None and self.nsteps % interval == 0:
+                callback(self)
+
+
+class MDLogger:
+    """
+    Writes time, total, potential and kinetic energy and temperature of a BAOABLangevin run,
+    using the same columns as ase.md.MDLogger.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path of the log file.
+    """
+
+    def __init__(self, file_path: str):
+        self._file_handle = open(file_path, "w")
+        self._file_handle.write(
+            "%-10s %12s %12s %12s  %6s\n"
+            % ("Time[ps]", "Etot[eV]", "Epot[eV]", "Ekin[eV]", "T[K]")
+        )
+
+    def __call__(self, dyn: BAOABLangevin):
+        import ase.units as ase_units
+
+        ekin = dyn.kinetic_energy()
+        self._file_handle.write(
+            "%-10.4f %12.4f %12.4f %12.4f  %6.1f\n"
+            % (
+                dyn.nsteps * dyn.dt / (1000 * ase_units.fs),
+                dyn.potential_energy + ekin,
+                dyn.potential_energy,
+                ekin,
+                dyn.temperature(),
+            )
+        )
+        self._file_handle.flush()
+
+    def close(self):
+        self._file_handle.close()
@@ -0,0 +1,729 @@
+import os
+import socket
+import threading
+import time
+
+from loguru import logger
+from sqlitedict import SqliteDict
+
+from utils import lock_with_retries
+
+
+def worker_id():
+    """
+    Identifier of the current worker process, "hostname:pid".
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# separates the key of a record from the index of a conformer in the key of a fanned-out job
+conformer_separator = "::"
+
+
+def conformer_key(key: str, index: int):
+    """
+    Key of the job that runs conformer index of record key.
+    """
+    return f"{key}{conformer_separator}{index}"
+
+
+def split_conformer_key(key: str):
+    """
+    Split the key of a job into the key of its record and the conformer index (None if the job is not fanned out).
+    """
+    parent, separator, index = key.rpartition(conformer_separator)
+    if not separator or not index.isdigit():
+        return key, None
+    return parent, int(index)
+
+
+def setup_status_db(
+    database_path: str,
+    keys: list,
+    atomic_numbers_lookup=None,
+    elements_to_include=None,
+):
+    """
+    Populate the status table of the campaign database.
+
+    Records whose atomic numbers are not a subset of elements_to_include are marked "not_included",
+    all others "not_submitted". Jobs already "submitted" (claimed by a worker that may still be running)
+    keep their status, so their results are not lost when a campaign is set up again while it runs;
+    jobs left "submitted" by a worker that died are requeued with requeue_stale_claims. If
+    atomic_numbers_lookup is given, the number of atoms of each record
+    is stored in the "n_atoms" table, which is used to estimate the cost of a record when claiming jobs.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status and stores the results.
+    keys: list, required
+        Keys of the records in the input dataset.
+    atomic_numbers_lookup: callable, optional, default=None
+        Function that returns the atomic numbers for a given key; required if elements_to_include is set.
+    elements_to_include: list of int, optional, default=None
+        Atomic numbers allowed in a record; if None, all records are included.
+
+    Returns
+    -------
+    int
+        Number of records marked "not_submitted".
+    """
+    from tqdm import tqdm
+
+    allowed = set(elements_to_include) if elements_to_include is not None else None
+    total = 0
+    n_atoms = {}
+    claimed = 0
+    with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+        for key in tqdm(keys):
+            if atomic_numbers_lookup is not None:
+                atomic_numbers = atomic_numbers_lookup(key)
+                n_atoms[key] = int(atomic_numbers.size)
+            if status_db.get(key) == "submitted":
+                claimed += 1
+                continue
+            if allowed is not None:
+                if not set(atomic_numbers.flatten()).issubset(allowed):
+                    status_db[key] = "not_included"
+                    continue
+            status_db[key] = "not_submitted"
+            total += 1
+        status_db.commit()
+    if claimed:
+        logger.warning(f"{claimed} jobs are still claimed by workers and were left as they are")
+
+    # each SqliteDict has its own connection, so the tables are written one after the other
+    with SqliteDict(database_path, tablename="n_atoms", autocommit=False) as n_atoms_db:
+        for key, value in n_atoms.items():
+            n_atoms_db[key] = value
+        n_atoms_db.commit()
+    logger.info(f"Total records: {total}")
+    return total
+
+
+def fail_jobs(database_path: str, reasons: dict):
+    """
+    Mark queued records that cannot be run as "failed", e.g., when the campaign is set up.
+
+    The reason is stored in the metadata of the record ("last_failure"). Records that are not queued
+    ("not_submitted") keep their status.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    reasons: dict, required
+        Reason of the failure, keyed by record.
+
+    Returns
+    -------
+    int
+        Number of records marked "failed".
+    """
+    with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+        failed = [key for key in reasons if status_db.get(key) == "not_submitted"]
+        for key in failed:
+            status_db[key] = "failed"
+        status_db.commit()
+
+    with SqliteDict(database_path, tablename="metadata", autocommit=False) as metadata_db:
+        for key in failed:
+            metadata_db[key] = {"last_failure": reasons[key]}
+        metadata_db.commit()
+    for key in failed:
+        logger.warning(f"{key} marked failed: {reasons[key]}")
+    return len(failed)
+
+
+def claim_jobs(
+    database_path: str,
+    lockfile_path: str,
+    batch_size: int = 1,
+    max_batch_cost: float = None,
+    cost_function=None,
+    reverse: bool = False,
+):
+    """
+    Atomically claim a batch of records that have not been submitted and mark them as "submitted".
+
+    Records marked "deferred" (see record_timeout) are only claimed once no "not_submitted" records are left.
+
+    The status table is read and written once, in a single transaction under the lock, and each claim
+    is registered in the "claims" table with the id of the worker, so the records can be returned
+    to the queue if the worker exits or dies before completing them (see release_jobs and requeue_stale_claims).
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    batch_size: int, optional, default=1
+        Maximum number of records to claim.
+    max_batch_cost: float, optional, default=None
+        If set, stop claiming once the summed cost of the batch reaches this value
+        (at least one record is always claimed).
+    cost_function: callable, optional, default=None
+        Function that returns the estimated cost of a record given its key; required if max_batch_cost is set.
+    reverse: bool, optional, default=False
+        If True, search for records starting from the end of the queue.
+
+    Returns
+    -------
+    list of str
+        Keys of the claimed records; empty if no records are left.
+    """
+    claimed = []
+    batch_cost = 0.0
+    owner = worker_id()
+    with lock_with_retries(lockfile_path):
+        with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+            items = list(status_db.items())
+            if reverse:
+                items = items[::-1]
+            for claimable in ["not_submitted", "deferred"]:
+                for key, status in items:
+                    if status != claimable:
+                        continue
+                    claimed.append(key)
+                    if max_batch_cost is not None:
+                        batch_cost += cost_function(key)
+                        if batch_cost >= max_batch_cost:
+                            break
+                    if len(claimed) >= batch_size:
+                        break
+                if claimed:
+                    break
+
+            for key in claimed:
+                status_db[key] = "submitted"
+            status_db.commit()
+
+        _set_claims(database_path, claimed, {"owner": owner, "time": time.time()})
+    return claimed
+
+
+def _set_claims(database_path: str, keys: list, claim: dict = None):
+    # registers (or, if claim is None, removes) the claims for the keys
+    with SqliteDict(database_path, tablename="claims", autocommit=False) as claims_db:
+        for key in keys:
+            if claim is not None:
+                claims_db[key] = claim
+            elif key in claims_db:
+                del claims_db[key]
+        claims_db.commit()
+
+
+def claim_job(database_path: str, lockfile_path: str, reverse: bool = False):
+    """
+    Claim the next record that has not been submitted and mark it as "submitted".
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    reverse: bool, optional, default=False
+        If True, search for records starting from the end of the queue.
+
+    Returns
+    -------
+    str or None
+        The key of the claimed record, or None if no records are left.
+    """
+    claimed = claim_jobs(database_path, lockfile_path, batch_size=1, reverse=reverse)
+    return claimed[0] if claimed else None
+
+
+def mark_completed_batch(database_path: str, lockfile_path: str, results: dict):
+    """
+    Store the results of several records and mark them as "completed", one transaction per table.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status and stores the results.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    results: dict, required
+        Results to store, keyed by record.
+    """
+    if not results:
+        return
+
+    with SqliteDict(database_path, tablename="results", autocommit=False) as results_db:
+        for key, result in results.items():
+            results_db[key] = result
+        results_db.commit()
+
+    # a recomputed record needs to be exported again
+    with SqliteDict(database_path, tablename="exported", autocommit=False) as exported_db:
+        for key in results:
+            if key in exported_db:
+                del exported_db[key]
+        exported_db.commit()
+
+    with lock_with_retries(lockfile_path):
+        with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+            for key in results:
+                status_db[key] = "completed"
+            status_db.commit()
+        _set_claims(database_path, list(results))
+
+
+def mark_completed(database_path: str, lockfile_path: str, key: str, result):
+    """
+    Store the result of a record and mark it as "completed".
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status and stores the results.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    key: str, required
+        Key of the record.
+    result: DataPoint, required
+        Result to store in the results table.
+    """
+    mark_completed_batch(database_path, lockfile_path, {key: result})
+
+
+def release_jobs(database_path: str, lockfile_path: str, keys: list):
+    """
+    Return claimed records that were not completed to the queue ("not_submitted").
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    keys: list of str, required
+        Keys of the records to release.
+    """
+    if not keys:
+        return
+
+    with lock_with_retries(lockfile_path):
+        with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+            for key in keys:
+                if status_db.get(key) == "submitted":
+                    status_db[key] = "not_submitted"
+            status_db.commit()
+        _set_claims(database_path, keys)
+    logger.info(f"Returned {len(keys)} records to the queue.")
+
+
+def record_failure(
+    database_path: str, lockfile_path: str, key: str, reason: str, max_attempts: int = 2
+):
+    """
+    Record a failed attempt at a record (e.g., its worker process crashed) and requeue or mark it.
+
+    The number of failed attempts and the reason of the last one are stored in the metadata of the record
+    ("failure_count", "last_failure"). The record is returned to the queue until it has failed max_attempts
+    times, after which it is marked "failed" and no longer claimed.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    key: str, required
+        Key of the record.
+    reason: str, required
+        Description of the failure (e.g., "killed by signal 11").
+    max_attempts: int, optional, default=2
+        Number of failed attempts after which the record is marked "failed".
+
+    Returns
+    -------
+    str
+        New status of the record, "not_submitted" or "failed".
+    """
+    count, status = _record_attempt(
+        database_path,
+        lockfile_path,
+        key,
+        reason,
+        "failure",
+        max_attempts,
+        retry_status="not_submitted",
+        final_status="failed",
+    )
+    logger.warning(
+        f"{key} failed ({reason}); attempt {count} of {max_attempts}, now {status}"
+    )
+    return status
+
+
+def record_timeout(
+    database_path: str, lockfile_path: str, key: str, reason: str, max_timeouts: int = 1
+):
+    """
+    Record that a record was aborted for exceeding its time limit (see watchdog.py) and defer or mark it.
+
+    The number of timeouts and the reason of the last one are stored in the metadata of the record
+    ("timeout_count", "last_timeout"). Until it has timed out more than max_timeouts times, the record
+    is marked "deferred": it is only claimed once no "not_submitted" records are left, so a few
+    stragglers do not hold up the rest of the campaign. After that it is marked "timed_out".
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    key: str, required
+        Key of the record.
+    reason: str, required
+        Description of the timeout.
+    max_timeouts: int, optional, default=1
+        Number of timeouts after which the record is no longer retried.
+
+    Returns
+    -------
+    str
+        New status of the record, "deferred" or "timed_out".
+    """
+    count, status = _record_attempt(
+        database_path,
+        lockfile_path,
+        key,
+        reason,
+        "timeout",
+        max_timeouts + 1,
+        retry_status="deferred",
+        final_status="timed_out",
+    )
+    logger.warning(f"{key} timed out ({reason}); now {status}")
+    return status
+
+
+def _record_attempt(
+    database_path: str,
+    lockfile_path: str,
+    key: str,
+    reason: str,
+    kind: str,
+    max_attempts: int,
+    retry_status: str,
+    final_status: str,
+):
+    # counts the attempt in the metadata ({kind}_count, last_{kind}) and sets the status of the record
+    with SqliteDict(database_path, tablename="metadata", autocommit=False) as metadata_db:
+        entries = metadata_db.get(key, {})
+        entries[f"{kind}_count"] = entries.get(f"{kind}_count", 0) + 1
+        entries[f"last_{kind}"] = reason
+        metadata_db[key] = entries
+        metadata_db.commit()
+
+    count = entries[f"{kind}_count"]
+    status = final_status if count >= max_attempts else retry_status
+    with lock_with_retries(lockfile_path):
+        with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+            if status_db.get(key) == "submitted":
+                status_db[key] = status
+            status_db.commit()
+        _set_claims(database_path, [key])
+    return count, status
+
+
+def _owner_is_dead(owner: str):
+    hostname, pid = owner.rsplit(":", 1)
+    if hostname != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+def requeue_stale_claims(
+    database_path: str, lockfile_path: str, max_age_hours: float = None
+):
+    """
+    Return records claimed by workers that died (e.g., were killed or crashed) to the queue.
+
+    Claims made by a process on this host that no longer exists are always requeued;
+    claims from other hosts can only be requeued based on their age.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    max_age_hours: float, optional, default=None
+        If set, also requeue any claim older than this, regardless of host.
+
+    Returns
+    -------
+    list of str
+        Keys of the requeued records.
+    """
+    with SqliteDict(database_path, tablename="claims") as claims_db:
+        claims = dict(claims_db.items())
+
+    now = time.time()
+    stale = [
+        key
+        for key, claim in claims.items()
+        if _owner_is_dead(claim["owner"])
+        or (
+            max_age_hours is not None
+            and now - claim["time"] > max_age_hours * 3600.0
+        )
+    ]
+    release_jobs(database_path, lockfile_path, stale)
+    return stale
+
+
+class WorkerQueue:
+    """
+    Job queue as seen by a single worker: claims records in batches and reports completions in batches.
+
+    Records that were claimed but not completed are returned to the queue when the worker queue is closed,
+    including when the worker exits with an exception (use as a context manager).
+    The methods can be called from different threads (see orchestrator.py).
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database that tracks the status and stores the results.
+    lockfile_path: str, required
+        Path to the lock file used to coordinate workers.
+    batch_size: int, optional, default=1
+        Number of records claimed at a time.
+    completion_batch_size: int, optional, default=None
+        Number of completed records buffered before they are written; defaults to batch_size.
+    max_batch_cost: float, optional, default=None
+        If set, batches are limited by summed estimated cost rather than only by batch_size.
+    cost_function: callable, optional, default=None
+        Function returning the estimated cost of a record given its key.
+    reverse: bool, optional, default=False
+        If True, claim records starting from the end of the queue.
+
+    Examples
+    --------
+    >>> with WorkerQueue("tmqm.db", "status.lockfile", batch_size=10) as queue:
+    >>>     key = queue.next_key()
+    >>>     queue.complete(key, result, metadata)
+    """
+
+    def __init__(
+        self,
+        database_path: str,
+        lockfile_path: str,
+        batch_size: int = 1,
+        completion_batch_size: int = None,
+        max_batch_cost: float = None,
+        cost_function=None,
+        reverse: bool = False,
+    ):
+        self._database_path = database_path
+        self._lockfile_path = lockfile_path
+        self.batch_size = batch_size
+        self.completion_batch_size = (
+            batch_size if completion_batch_size is None else completion_batch_size
+        )
+        self.max_batch_cost = max_batch_cost
+        self._cost_function = cost_function
+        self.reverse = reverse
+
+        self._pending = []
+        self._in_progress = set()
+        self._results = {}
+        self._metadata = {}
+        self._lock = threading.RLock()
+
+    def next_key(self):
+        """
+        Return the key of the next record to run, claiming a new batch if needed; None if the queue is empty.
+        """
+        with self._lock:
+            return self._next_key()
+
+    def _next_key(self):
+        if not self._pending:
+            self._pending = claim_jobs(
+                self._database_path,
+                self._lockfile_path,
+                batch_size=self.batch_size,
+                max_batch_cost=self.max_batch_cost,
+                cost_function=self._cost_function,
+                reverse=self.reverse,
+            )
+        if not self._pending:
+            return None
+        key = self._pending.pop(0)
+        self._in_progress.add(key)
+        return key
+
+    def complete(self, key: str, result, metadata: dict = None):
+        """
+        Buffer the result of a record; buffered results are written once completion_batch_size is reached.
+
+        The metadata replaces the metadata stored for the record, see record_metadata_batch.
+        """
+        with self._lock:
+            self._results[key] = result
+            self._metadata[key] = metadata or {}
+            if len(self._results) >= self.completion_batch_size:
+                self.flush()
+
+    def fail(self, key: str, reason: str, max_attempts: int = 2):
+        """
+        Record a failed attempt at a claimed record, see record_failure.
+        """
+        with self._lock:
+            self._in_progress.discard(key)
+            return record_failure(
+                self._database_path,
+                self._lockfile_path,
+                key,
+                reason,
+                max_attempts=max_attempts,
+            )
+
+    def time_out(self, key: str, reason: str, max_timeouts: int = 1):
+        """
+        Record that a claimed record exceeded its time limit, see record_timeout.
+        """
+        with self._lock:
+            self._in_progress.discard(key)
+            return record_timeout(
+                self._database_path,
+                self._lockfile_path,
+                key,
+                reason,
+                max_timeouts=max_timeouts,
+            )
+
+    def release(self, keys: list):
+        """
+        Return claimed records that will not be run by this worker to the queue.
+        """
+        with self._lock:
+            self._in_progress.difference_update(keys)
+            release_jobs(self._database_path, self._lockfile_path, keys)
+
+    def flush(self):
+        """
+        Write all buffered results and mark the records completed.
+        """
+        with self._lock:
+            # the metadata of a completed run replaces that of earlier attempts
+            record_metadata_batch(self._database_path, self._metadata, replace=True)
+            mark_completed_batch(
+                self._database_path, self._lockfile_path, self._results
+            )
+            self._in_progress.difference_update(self._results)
+            self._results = {}
+            self._metadata = {}
+
+    def close(self):
+        """
+        Write buffered results and return unfinished records to the queue.
+        """
+        with self._lock:
+            try:
+                self.flush()
+            finally:
+                unfinished = self._pending + sorted(self._in_progress)
+                release_jobs(self._database_path, self._lockfile_path, unfinished)
+                self._pending = []
+                self._in_progress = set()
+                record_lock_metrics(self._database_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def record_metadata_batch(database_path: str, metadata: dict, replace: bool = False):
+    """
+    Add entries to the metadata stored for several records in a single transaction.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    metadata: dict, required
+        Entries to add, keyed by record.
+    replace: bool, optional, default=False
+        If True, the entries replace the metadata stored for each record, rather than being added to it;
+        used when a record completes, so entries of earlier attempts (e.g., md_abort_reason,
+        last_timeout or fallback_settings) do not describe the new result.
+    """
+    if not metadata:
+        return
+
+    with SqliteDict(database_path, tablename="metadata", autocommit=False) as metadata_db:
+        for key, entries in metadata.items():
+            current = {} if replace else metadata_db.get(key, {})
+            current.update(entries)
+            metadata_db[key] = current
+        metadata_db.commit()
+
+
+def record_metadata(database_path: str, key: str, metadata: dict):
+    """
+    Add entries to the metadata stored for a record (e.g., sampling settings and timings).
+
+    Existing entries with the same name are overwritten; the metadata is written as attributes
+    of the record when the results are exported.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    key: str, required
+        Key of the record.
+    metadata: dict, required
+        Entries to add; values should be scalars or strings.
+    """
+    record_metadata_batch(database_path, {key: metadata})
+
+
+def record_lock_metrics(database_path: str):
+    """
+    Store the lock metrics of this worker (utils.lock_metrics) in the lock_metrics table, keyed by worker.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    """
+    from utils import lock_metrics
+
+    snapshot = lock_metrics.snapshot()
+    if not snapshot:
+        return
+    with SqliteDict(database_path, tablename="lock_metrics", autocommit=True) as metrics_db:
+        metrics_db[worker_id()] = snapshot
+
+
+def lock_contention_report(database_path: str):
+    """
+    Combine the lock metrics stored by the workers of a campaign, see utils.lock_contention_report.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the sqlite database of the campaign.
+    """
+    from utils import lock_contention_report as combine
+
+    with SqliteDict(database_path, tablename="lock_metrics") as metrics_db:
+        snapshots = dict(metrics_db.items())
+    return combine(snapshots)
@@ -0,0 +1,141 @@
+"""
+Cheap checks for fragmentation or unphysical MD, run every few steps during sampling.
+
+At 400 K without constraints, some complexes dissociate ligands or blow up partway through the MD.
+Every check_interval steps, MDCheck looks at the positions, forces and temperature the integrator
+already holds (no extra xtb evaluations) and stops the run with UnphysicalMD if
+
+- the covalent-radius bond graph has more fragments than the starting geometry ("fragmentation"),
+- two atoms are closer than overlap_scale times the sum of their covalent radii ("atoms_overlap"),
+- the largest force exceeds max_force eV/angstrom ("max_force"), or
+- the instantaneous temperature exceeds max_temperature_factor times the thermostat temperature
+  ("temperature_spike").
+
+run_xtb_calc then truncates the record to the snapshots taken before the check fired, so neither
+the remaining MD steps nor the accuracy-1 evaluation of the bad snapshot are computed.
+"""
+
+import numpy as np
+
+
+class UnphysicalMD(Exception):
+    """
+    Raised by MDCheck when a check fails.
+    """
+
+    def __init__(self, reason: str, step: int, detail: str = ""):
+        super().__init__(reason, step, detail)
+        self.reason = reason
+        self.step = step
+        self.detail = detail
+
+    def __str__(self):
+        return f"{self.reason} at step {self.step}" + (
+            f" ({self.detail})" if self.detail else ""
+        )
+
+
+def bond_graph(atomic_numbers, positions, bond_scale: float = 1.5):
+    """
+    Adjacency matrix of the atoms closer than bond_scale times the sum of their covalent radii.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        (adjacency matrix, interatomic distances, sums of covalent radii)
+    """
+    from ase.data import covalent_radii
+
+    radii = covalent_radii[np.asarray(atomic_numbers).reshape(-1)]
+    radii_sum = radii[:, np.newaxis] + radii[np.newaxis, :]
+    difference = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+    distances = np.sqrt(np.einsum("ijk,ijk->ij", difference, difference))
+    adjacency = distances < bond_scale * radii_sum
+    np.fill_diagonal(adjacency, False)
+    return adjacency, distances, radii_sum
+
+
+def count_fragments(adjacency):
+    """
+    Number of connected components of a bond graph.
+    """
+    from scipy.sparse.csgraph import connected_components
+
+    n_components, _ = connected_components(adjacency, directed=False)
+    return n_components
+
+
+class MDCheck:
+    """
+    Connectivity and geometry checks of an MD run.
+
+    Parameters
+    ----------
+    atomic_numbers: np.ndarray, required
+        Atomic numbers of the molecule.
+    positions: np.ndarray, required
+        Starting positions (angstrom); the number of fragments of the starting geometry is the reference,
+        so records that start as several fragments (e.g., with counter-ions) are not flagged.
+    temperature: float, required
+        Temperature of the thermostat (K).
+    bond_scale: float, optional, default=1.5
+        Atoms closer than bond_scale times the sum of their covalent radii are bonded.
+    overlap_scale: float, optional, default=0.5
+        Atoms closer than overlap_scale times the sum of their covalent radii overlap.
+    max_force: float, optional, default=25.0
+        Largest force accepted (eV/angstrom); None disables the check.
+    max_temperature_factor: float, optional, default=3.0
+        Largest instantaneous temperature accepted, as a multiple of temperature; None disables the check.
+    """
+
+    def __init__(
+        self,
+        atomic_numbers,
+        positions,
+        temperature: float,
+        bond_scale: float = 1.5,
+        overlap_scale: float = 0.5,
+        max_force: float = 25.0,
+        max_temperature_factor: float = 3.0,
+    ):
+        self.atomic_numbers = np.asarray(atomic_numbers).reshape(-1)
+        self.bond_scale = bond_scale
+        self.overlap_scale = overlap_scale
+        self.max_force = max_force
+        self.max_temperature = (
+            None
+            if max_temperature_factor is None
+            else max_temperature_factor * temperature
+        )
+        adjacency, _, _ = bond_graph(self.atomic_numbers, positions, bond_scale)
+        self.reference_fragments = count_fragments(adjacency)
+
+    def __call__(self, step: int, positions, forces=None, temperature: float = None):
+        """
+        Check a state of the run, raising UnphysicalMD if a check fails.
+        """
+        if forces is not None and self.max_force is not None:
+            largest = float(np.sqrt(np.max(np.sum(forces**2, axis=1))))
+            if largest > self.max_force:
+                raise UnphysicalMD("max_force", step, f"{largest:.1f} eV/angstrom")
+
+        if temperature is not None and self.max_temperature is not None:
+            if temperature > self.max_temperature:
+                raise UnphysicalMD("temperature_spike", step, f"{temperature:.0f} K")
+
+        adjacency, distances, radii_sum = bond_graph(
+            self.atomic_numbers, positions, self.bond_scale
+        )
+        np.fill_diagonal(distances, np.inf)
+        if np.any(distances < self.overlap_scale * radii_sum):
+            raise UnphysicalMD(
+                "atoms_overlap", step, f"closest pair {float(distances.min()):.2f} angstrom"
+            )
+
+        n_fragments = count_fragments(adjacency)
+        if n_fragments > self.reference_fragments:
+            raise UnphysicalMD(
+                "fragmentation",
+                step,
+                f"{n_fragments} fragments, {self.reference_fragments} at the start",
+            )
@@ -0,0 +1,354 @@
+"""
+Normal-mode sampling: configurations drawn from the harmonic approximation instead of MD.
+
+run_xtb_calc generates number_of_repeats configurations with number_of_repeats * number_of_steps
+MD force calls (md_accuracy) plus one single point per configuration (property_accuracy).
+run_normal_mode_sampling instead computes one Hessian by central finite differences of the forces
+(6 * n_atoms force calls, optionally spread over several processes) at the starting or optimized
+geometry, draws thermally weighted displacements along the normal modes at the target temperature,
+and evaluates only the single points of the displaced configurations. For small and medium complexes
+this takes a fraction of the force calls of the MD.
+
+Each normal coordinate q_k is drawn from the classical Boltzmann distribution of a harmonic oscillator,
+q_k ~ N(0, kT / omega_k^2), and the displacement is M^(-1/2) sum_k q_k e_k. Modes below
+min_frequency (including the translations and rotations, and imaginary modes of a geometry that is
+not a minimum) are not displaced.
+"""
+
+import numpy as np
+from loguru import logger
+
+# backend of the Hessian processes, see _init_hessian_process
+_hessian_backend = None
+
+
+def _init_hessian_process(backend: str, numbers, positions, charge, multiplicity, kwargs):
+    global _hessian_backend
+    from backends import create_backend
+
+    _hessian_backend = create_backend(
+        backend, numbers, positions, charge, multiplicity, **kwargs
+    )
+
+
+def _displaced_forces(positions, delta: float, indices):
+    # forces at the positions displaced by +delta and -delta along each Cartesian index
+    forces = []
+    for index in indices:
+        for sign in [1.0, -1.0]:
+            displaced = positions.copy().reshape(-1)
+            displaced[index] += sign * delta
+            forces.append(
+                _hessian_backend.compute(displaced.reshape(-1, 3)).forces.reshape(-1)
+            )
+    return indices, np.array(forces)
+
+
+def finite_difference_hessian(
+    backend: str,
+    numbers,
+    positions,
+    charge: float,
+    multiplicity: int = None,
+    method: str = "GFN2-xTB",
+    accuracy: float = 2.0,
+    delta: float = 0.005,
+    processes: int = 1,
+):
+    """
+    Hessian (eV/angstrom^2) by central finite differences of the forces.
+
+    Parameters
+    ----------
+    backend: str, required
+        Backend used for the force calls, "ase" or "tblite" (see backends.py).
+    numbers: np.ndarray, required
+        Atomic numbers.
+    positions: np.ndarray, required
+        Positions (angstrom) at which the Hessian is evaluated.
+    charge: float, required
+        Total charge.
+    multiplicity: int, optional, default=None
+        Spin multiplicity.
+    method: str, optional, default="GFN2-xTB"
+        xtb method.
+    accuracy: float, optional, default=2.0
+        tblite accuracy of the force calls.
+    delta: float, optional, default=0.005
+        Displacement (angstrom).
+    processes: int, optional, default=1
+        Number of processes the 6 * n_atoms force calls are spread over.
+
+    Returns
+    -------
+    np.ndarray
+        Symmetric Hessian of shape (3 * n_atoms, 3 * n_atoms).
+    """
+    processes = processes or 1
+    positions = np.asarray(positions, dtype=np.float64)
+    n_coordinates = positions.size
+    kwargs = dict(method=method, accuracy=accuracy)
+    initargs = (backend, numbers, positions, charge, multiplicity, kwargs)
+
+    chunks = np.array_split(np.arange(n_coordinates), processes)
+    if processes == 1:
+        _init_hessian_process(*initargs)
+        results = [_displaced_forces(positions, delta, chunks[0])]
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the parent has already run tblite (and its OpenMP runtime), which is not safe to fork
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_hessian_process,
+            initargs=initargs,
+        ) as pool:
+            results = list(
+                pool.map(
+                    _displaced_forces,
+                    [positions] * len(chunks),
+                    [delta] * len(chunks),
+                    chunks,
+                )
+            )
+
+    hessian = np.zeros((n_coordinates, n_coordinates))
+    for indices, forces in results:
+        # row i: d^2E / dx_i dx_j = -(F_j(x + delta e_i) - F_j(x - delta e_i)) / (2 delta)
+        hessian[indices] = -(forces[0::2] - forces[1::2]) / (2.0 * delta)
+    return 0.5 * (hessian + hessian.T)
+
+
+def _rigid_body_modes(positions, masses):
+    # orthonormal mass-weighted translations and rotations (5 for a linear molecule)
+    masses = np.asarray(masses)
+    centered = positions - np.average(positions, axis=0, weights=masses)
+    sqrt_masses = np.sqrt(masses)[:, np.newaxis]
+    vectors = []
+    for axis in np.eye(3):
+        vectors.append((sqrt_masses * axis).reshape(-1))
+        vectors.append((sqrt_masses * np.cross(axis, centered)).reshape(-1))
+    u, singular_values, _ = np.linalg.svd(np.array(vectors).T, full_matrices=False)
+    return u[:, singular_values > 1e-6 * singular_values.max()]
+
+
+def normal_modes(hessian, masses, positions=None, min_frequency: float = 50.0):
+    """
+    Mass-weighted normal modes with frequencies above min_frequency (cm^-1).
+
+    If positions are given, translations and rotations are projected out of the Hessian first,
+    so they are not mistaken for vibrations when the geometry is not exactly a stationary point.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        (eigenvalues of the mass-weighted Hessian in ASE units, eigenvectors as columns, frequencies in cm^-1)
+    """
+    import ase.units as ase_units
+
+    inverse_sqrt_masses = np.repeat(1.0 / np.sqrt(np.asarray(masses)), 3)
+    weighted = hessian * np.outer(inverse_sqrt_masses, inverse_sqrt_masses)
+    if positions is not None:
+        rigid = _rigid_body_modes(np.asarray(positions).reshape(-1, 3), masses)
+        projector = np.eye(weighted.shape[0]) - rigid @ rigid.T
+        weighted = projector @ weighted @ projector
+    eigenvalues, eigenvectors = np.linalg.eigh(weighted)
+
+    # energy quanta in eV, as in ase.vibrations
+    s = ase_units._hbar * 1e10 / np.sqrt(ase_units._e * ase_units._amu)
+    frequencies = (
+        np.sign(eigenvalues) * s * np.sqrt(np.abs(eigenvalues)) / ase_units.invcm
+    )
+    keep = frequencies >= min_frequency
+    return eigenvalues[keep], eigenvectors[:, keep], frequencies[keep]
+
+
+def sample_displacements(
+    eigenvalues, eigenvectors, masses, temperature: float, n_samples: int, rng=None
+):
+    """
+    Thermally weighted Cartesian displacements (angstrom) along the normal modes.
+
+    Parameters
+    ----------
+    eigenvalues: np.ndarray, required
+        Eigenvalues of the mass-weighted Hessian (ASE units), see normal_modes.
+    eigenvectors: np.ndarray, required
+        Mass-weighted normal modes as columns.
+    masses: np.ndarray, required
+        Atomic masses (amu).
+    temperature: float, required
+        Temperature (K).
+    n_samples: int, required
+        Number of displacements.
+    rng: np.random.Generator, optional, default=None
+        Random number generator.
+
+    Returns
+    -------
+    np.ndarray
+        Displacements of shape (n_samples, n_atoms, 3).
+    """
+    import ase.units as ase_units
+
+    rng = np.random.default_rng() if rng is None else rng
+    kT = ase_units.kB * temperature
+    amplitudes = rng.standard_normal((n_samples, eigenvalues.size)) * np.sqrt(
+        kT / eigenvalues
+    )
+    inverse_sqrt_masses = np.repeat(1.0 / np.sqrt(np.asarray(masses)), 3)
+    displacements = (amplitudes @ eigenvectors.T) * inverse_sqrt_masses
+    return displacements.reshape(n_samples, -1, 3)
+
+
+def run_normal_mode_sampling(
+    data_input,
+    number_of_samples: int = 10,
+    temperature=None,
+    cache=None,
+    method: str = "GFN2-xTB",
+    hessian_accuracy: float = 2.0,
+    property_accuracy: float = 1.0,
+    backend: str = "ase",
+    calculator_factory=None,
+    seed: int = None,
+    optimize: bool = False,
+    fmax: float = 0.05,
+    delta: float = 0.005,
+    processes: int = 1,
+    min_frequency: float = 50.0,
+):
+    """
+    Generate configurations by normal-mode sampling and evaluate their properties.
+
+    The returned DataPoint has the same layout as that of run_xtb_calc: the starting geometry,
+    followed by number_of_samples displaced configurations.
+
+    parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        The configuration to start from.
+    number_of_samples: int, optional, default=10
+        Number of displaced configurations.
+    temperature: unit.Quantity, optional, default=400 K
+        Temperature of the thermal distribution.
+    cache: XTBCache, optional, default=None
+        Cache used for the single point calculations.
+    method: str, optional, default="GFN2-xTB"
+        xtb method used by tblite.
+    hessian_accuracy: float, optional, default=2.0
+        tblite accuracy of the Hessian (and optimization) force calls.
+    property_accuracy: float, optional, default=1.0
+        tblite accuracy used to evaluate the stored properties.
+    backend: str, optional, default="ase"
+        Backend used for the calculations, see run_xtb_calc.
+    calculator_factory: CalculatorFactory, optional, default=None
+        Factory used to create the calculators, see run_xtb_calc.
+    seed: int, optional, default=None
+        Seed of the random displacements.
+    optimize: bool, optional, default=False
+        If True, optimize the geometry (BFGS, at hessian_accuracy) before computing the Hessian.
+    fmax: float, optional, default=0.05
+        Force convergence criterion of the optimization (eV/angstrom).
+    delta: float, optional, default=0.005
+        Finite difference displacement (angstrom).
+    processes: int, optional, default=1
+        Number of processes used for the Hessian.
+    min_frequency: float, optional, default=50.0
+        Modes with lower (or imaginary) frequencies (cm^-1) are not displaced.
+    """
+    from ase import Atoms
+    from backends import get_calculator_factory
+    from xtb_config_gen import (
+        ConfigurationArrays,
+        _check_single_conformer,
+        _md_settings,
+        get_xtb_properties,
+    )
+
+    temperature, _, _ = _md_settings(temperature, None, None)
+    total_charge = float(data_input.total_charge.magnitude.reshape(-1)[0])
+    spin_multiplicity = int(round(float(data_input.spin_multiplicity.reshape(-1)[0])))
+    _check_single_conformer(data_input)
+    n_atoms = data_input.geometry.shape[1]
+
+    mol = Atoms(
+        numbers=data_input.atomic_numbers.reshape(-1),
+        positions=data_input.geometry.to("angstrom").magnitude.reshape(n_atoms, 3),
+    )
+    numbers = mol.get_atomic_numbers()
+
+    if calculator_factory is None:
+        calculator_factory = get_calculator_factory(backend, method)
+    property_backend = calculator_factory.create(
+        numbers, mol.get_positions(), total_charge, spin_multiplicity, property_accuracy
+    )
+    property_backend.reset_guess()
+    mol.calc = property_backend.ase_calculator()
+
+    configurations = ConfigurationArrays(number_of_samples + 1, n_atoms)
+    configurations.set(
+        0, get_xtb_properties(mol, cache=cache, backend=property_backend)
+    )
+
+    reference = mol.get_positions()
+    if optimize:
+        from ase.optimize import BFGS
+
+        hessian_backend = calculator_factory.create(
+            numbers, reference, total_charge, spin_multiplicity, hessian_accuracy
+        )
+        hessian_backend.reset_guess()
+        optimized = Atoms(numbers=numbers, positions=reference)
+        optimized.calc = hessian_backend.ase_calculator()
+        BFGS(optimized, logfile=None).run(fmax=fmax, steps=200)
+        reference = optimized.get_positions()
+
+    hessian = finite_difference_hessian(
+        calculator_factory.backend,
+        numbers,
+        reference,
+        total_charge,
+        spin_multiplicity,
+        method=method,
+        accuracy=hessian_accuracy,
+        delta=delta,
+        processes=processes,
+    )
+    eigenvalues, eigenvectors, frequencies = normal_modes(
+        hessian, mol.get_masses(), positions=reference, min_frequency=min_frequency
+    )
+    logger.info(
+        f"{data_input.name}: {frequencies.size} of {3 * n_atoms} modes above {min_frequency} cm^-1"
+    )
+
+    displacements = sample_displacements(
+        eigenvalues,
+        eigenvectors,
+        mol.get_masses(),
+        temperature.to("K").m,
+        number_of_samples,
+        rng=np.random.default_rng(seed),
+    )
+    for i, displacement in enumerate(displacements):
+        displaced = Atoms(numbers=numbers, positions=reference + displacement)
+        displaced.calc = mol.calc
+        configurations.set(
+            i + 1, get_xtb_properties(displaced, cache=cache, backend=property_backend)
+        )
+        logger.info(f"Completed sample {i} of {number_of_samples}")
+
+    if cache is not None:
+        cache.log_stats()
+
+    data_output = configurations.to_datapoint(data_input)
+    settings = calculator_factory.settings(
+        numbers, total_charge, spin_multiplicity, property_accuracy
+    )
+    settings["property_accuracy"] = settings.pop("accuracy")
+    settings["hessian_accuracy"] = float(hessian_accuracy)
+    settings["n_normal_modes"] = int(frequencies.size)
+    data_output.calculator_settings = settings
+    return data_output
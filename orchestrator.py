@@ -0,0 +1,196 @@
+"""
+Pipelined worker that overlaps the I/O of neighbouring jobs with the xtb calculation.
+
+While the xtb calculation of job i runs in a child process, a background thread claims job i+1
+and reads its input from the HDF5 file, and another writes the result of job i-1 to the campaign
+database and marks it completed. The lock waits and file I/O therefore no longer leave the core idle.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from time import time
+
+from loguru import logger
+
+from campaign import (
+    CampaignConfig,
+    _job_budget,
+    _open_budget,
+    _open_cache,
+    _time_out,
+    compute_job,
+    load_record,
+    open_worker_queue,
+)
+from watchdog import JobTimeout
+
+# state of the compute process, set by _init_compute_process
+_compute_cache = None
+_compute_cost_model = None
+
+
+def _init_compute_process(config: CampaignConfig, cost_model):
+    global _compute_cache, _compute_cost_model
+    # sqlite connections cannot be shared with the parent, so the child opens its own
+    _compute_cache = _open_cache(config)
+    _compute_cost_model = cost_model
+
+
+def _compute(config: CampaignConfig, data_input, budget_seconds):
+    return compute_job(
+        config,
+        data_input,
+        cache=_compute_cache,
+        budget_seconds=budget_seconds,
+        cost_model=_compute_cost_model,
+    )
+
+
+def _claim_and_load(config: CampaignConfig, queue, campaign_budget):
+    """
+    Claim the next job, reserve its budget and read its input.
+
+    Returns
+    -------
+    tuple or None
+        (data_input, budget_seconds), or None if there are no jobs left.
+    """
+    key = queue.next_key()
+    if key is None:
+        return None
+    budget_seconds = _job_budget(config, campaign_budget, key)
+    return load_record(config, key), budget_seconds
+
+
+def _write_result(queue, campaign_budget, key: str, budget_seconds, result):
+    xtb_properties, metadata = result
+    if campaign_budget is not None:
+        campaign_budget.settle(budget_seconds, metadata["cpu_seconds"])
+    queue.complete(key, xtb_properties, metadata)
+
+
+def _write_failure(
+    config: CampaignConfig,
+    queue,
+    campaign_budget,
+    key: str,
+    budget_seconds,
+    used_seconds: float,
+    reason: str,
+):
+    # as in the forkserver worker, the job is retried until max_job_attempts, then marked "failed"
+    if campaign_budget is not None:
+        campaign_budget.settle(budget_seconds, used_seconds)
+    queue.fail(key, reason, max_attempts=config.max_job_attempts)
+
+
+def _start_compute_pool(config: CampaignConfig, cost_model):
+    # the worker has threads (the I/O pool), so the compute process is started from a clean
+    # interpreter rather than forked from this one, where a lock held by a thread could deadlock it
+    return ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_compute_process,
+        initargs=(config, cost_model),
+    )
+
+
+def run_pipelined_worker(config: CampaignConfig, n_jobs: int = 1, reverse: bool = False):
+    """
+    Claim and run up to n_jobs records, overlapping input prefetch and result writes with the calculation.
+
+    The xtb calculation runs in a single child process, so this worker still occupies one core
+    with xtb work; run as many workers as there are cores, as with the serial worker.
+    A job that raises, or whose child process dies, is recorded as a failed attempt (as in the
+    forkserver worker), and the child process is replaced if it died.
+
+    Parameters
+    ----------
+    config: CampaignConfig, required
+        Settings of the campaign.
+    n_jobs: int, optional, default=1
+        Maximum number of records to run.
+    reverse: bool, optional, default=False
+        If True, claim records starting from the end of the queue.
+    """
+    from cost_model import load_cost_model
+
+    campaign_budget = _open_budget(config)
+    cost_model = load_cost_model(config.database_path)
+
+    compute_pool = _start_compute_pool(config, cost_model)
+    try:
+        with open_worker_queue(
+            config, reverse=reverse, cost_model=cost_model
+        ) as queue, ThreadPoolExecutor(max_workers=2) as io_pool:
+            next_job = io_pool.submit(_claim_and_load, config, queue, campaign_budget)
+            pending_write = None
+
+            for i in range(n_jobs):
+                job = next_job.result()
+                if job is None:
+                    logger.info("No records left to submit.")
+                    break
+                data_input, budget_seconds = job
+
+                started = time()
+                result = compute_pool.submit(_compute, config, data_input, budget_seconds)
+
+                # prefetch the next job while this one is running
+                if i + 1 < n_jobs:
+                    next_job = io_pool.submit(
+                        _claim_and_load, config, queue, campaign_budget
+                    )
+
+                # results are written one at a time, so the previous write must be finished
+                try:
+                    result = result.result()
+                except JobTimeout as e:
+                    if pending_write is not None:
+                        pending_write.result()
+                    pending_write = io_pool.submit(
+                        _time_out,
+                        config,
+                        queue,
+                        campaign_budget,
+                        data_input.name,
+                        budget_seconds,
+                        e,
+                    )
+                    continue
+                except Exception as e:
+                    logger.error(f"{data_input.name} failed: {e!r}")
+                    if pending_write is not None:
+                        pending_write.result()
+                    pending_write = io_pool.submit(
+                        _write_failure,
+                        config,
+                        queue,
+                        campaign_budget,
+                        data_input.name,
+                        budget_seconds,
+                        time() - started,
+                        f"{type(e).__name__}: {e}",
+                    )
+                    if isinstance(e, BrokenProcessPool):
+                        # the compute process died (e.g., a segfault in tblite)
+                        compute_pool.shutdown()
+                        compute_pool = _start_compute_pool(config, cost_model)
+                    continue
+
+                if pending_write is not None:
+                    pending_write.result()
+                pending_write = io_pool.submit(
+                    _write_result,
+                    queue,
+                    campaign_budget,
+                    data_input.name,
+                    budget_seconds,
+                    result,
+                )
+
+            if pending_write is not None:
+                pending_write.result()
+    finally:
+        compute_pool.shutdown()
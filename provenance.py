@@ -0,0 +1,379 @@
+"""
+Provenance hashes of campaign results, used to reuse unchanged results when a campaign is set up again.
+
+Every completed job stores three hashes with its metadata (and so as attributes of the exported record):
+
+- "input_hash": hash of the starting conformers of the job (atomic numbers, geometry, total charge
+  and spin multiplicity), see conformer_hashes and input_hash;
+- "parameters_hash": hash of the campaign settings that change the result of a job (parameter_fields);
+- "provenance_hash": hash of both.
+
+When a campaign is set up, the provenance hash each job would get is computed from the per-conformer
+hashes of the records (see load_conformer_hashes, which hashes the geometry read by the input adapter
+without loading the records, and caches the hashes in a sidecar file) and compared with
+the completed results of the campaign database itself (if it already exists) and of the databases in
+reuse_databases. Jobs with a matching result are marked "completed" (results from other databases are
+copied over); only the jobs whose input or parameters changed are queued.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+from loguru import logger
+
+# settings of a campaign that change the result of a job; paths, worker and scheduling settings,
+# and the straggler settings are not included (a fallback run is hashed with the settings it ran with)
+parameter_fields = [
+    "temperature",
+    "friction",
+    "timestep",
+    "number_of_steps",
+    "number_of_repeats",
+    "method",
+    "md_accuracy",
+    "property_accuracy",
+    "integrator",
+    "backend",
+    "md_check_interval",
+    "md_check_options",
+    "sampler",
+    "normal_mode_options",
+    "seed",
+    "budget_cpu_hours_per_job",
+    "budget_cpu_hours_total",
+    "calibration_steps",
+    "min_steps",
+    "min_repeats",
+    "cost_model_calibration",
+]
+
+
+def conformer_hashes(data_input, decimals: int = 6):
+    """
+    Hash each starting conformer of a record.
+
+    Parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        Record with one or more conformers.
+    decimals: int, optional, default=6
+        Number of decimals positions (in angstrom) are rounded to before hashing.
+
+    Returns
+    -------
+    list of str
+        sha256 hex digest of the atomic numbers, geometry, total charge and spin multiplicity of each conformer.
+    """
+    return hash_conformers(
+        data_input.atomic_numbers,
+        data_input.geometry.m_as("angstrom"),
+        data_input.total_charge.m_as("elementary_charge"),
+        data_input.spin_multiplicity,
+        decimals=decimals,
+    )
+
+
+def hash_conformers(
+    atomic_numbers, geometry, total_charge, spin_multiplicity, decimals: int = 6
+):
+    """
+    Hash each starting conformer of a record from plain arrays, without loading the record.
+
+    Parameters
+    ----------
+    atomic_numbers: np.ndarray, required
+        Atomic numbers of the record.
+    geometry: np.ndarray, required
+        Positions in angstrom, shape (n_configs, n_atoms, 3).
+    total_charge: float or np.ndarray, required
+        Total charge in elementary charges, for all conformers or for each one.
+    spin_multiplicity: int or np.ndarray, required
+        Spin multiplicity, for all conformers or for each one.
+    decimals: int, optional, default=6
+        Number of decimals positions are rounded to before hashing.
+
+    Returns
+    -------
+    list of str
+        sha256 hex digest of each conformer, see conformer_hashes.
+    """
+    atomic_numbers = np.asarray(atomic_numbers, dtype=np.int64).reshape(-1)
+    geometry = np.asarray(geometry, dtype=np.float64).reshape(
+        -1, atomic_numbers.size, 3
+    )
+    # add 0.0 to map -0.0 to 0.0 so that rounding does not change the hash
+    geometry = np.round(geometry, decimals) + 0.0
+    total_charge = np.asarray(total_charge, dtype=np.float64).reshape(-1)
+    spin_multiplicity = np.asarray(spin_multiplicity).reshape(-1)
+
+    hashes = []
+    for i in range(geometry.shape[0]):
+        # charge and multiplicity may be stored once for all conformers
+        charge = total_charge[i if total_charge.size > 1 else 0]
+        multiplicity = spin_multiplicity[i if spin_multiplicity.size > 1 else 0]
+        h = hashlib.sha256()
+        h.update(atomic_numbers.tobytes())
+        h.update(geometry[i].reshape(-1).tobytes())
+        h.update(f"{float(charge)}|{int(multiplicity)}|{decimals}".encode())
+        hashes.append(h.hexdigest())
+    return hashes
+
+
+def _hash_chunk(dataset_format: str, dataset_path: str, dataset_options: dict, keys: list):
+    from adapters import open_adapter
+
+    hashes = []
+    with open_adapter(dataset_format, dataset_path, dataset_options) as adapter:
+        for key in keys:
+            summary = adapter.summary(key)
+            hashes.append(
+                hash_conformers(
+                    summary.atomic_numbers,
+                    adapter.geometry(key),
+                    summary.total_charge,
+                    summary.spin_multiplicity,
+                )
+            )
+    return hashes
+
+
+def load_conformer_hashes(
+    dataset_path: str,
+    keys: list,
+    sidecar_path: str,
+    processes: int = None,
+    chunk_size: int = 2000,
+    dataset_format: str = "modelforge_hdf5",
+    dataset_options: dict = None,
+):
+    """
+    Return the conformer hashes of records, from the sidecar file where it is up to date.
+
+    Records missing from the sidecar (or all records, if the dataset changed since it was written) are
+    read in parallel over chunks of keys, and the sidecar is rewritten.
+
+    Parameters
+    ----------
+    dataset_path: str, required
+        Path to the dataset.
+    keys: list of str, required
+        Keys of the records to hash.
+    sidecar_path: str, required
+        Path of the sidecar file.
+    processes: int, optional, default=None
+        Number of processes used if records have to be read.
+    chunk_size: int, optional, default=2000
+        Number of keys read by a process at a time.
+    dataset_format: str, optional, default="modelforge_hdf5"
+        Format of the dataset, see adapters.open_adapter.
+    dataset_options: dict, optional, default=None
+        Options of the input adapter.
+
+    Returns
+    -------
+    dict
+        List of conformer hashes (see hash_conformers), keyed by record.
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from adapters import open_adapter
+
+    with open_adapter(dataset_format, dataset_path, dataset_options) as adapter:
+        signature = adapter.signature()
+    record_hashes = {}
+    if os.path.exists(sidecar_path):
+        with np.load(sidecar_path) as sidecar:
+            if np.array_equal(sidecar["signature"], signature):
+                offsets = np.concatenate([[0], np.cumsum(sidecar["n_hashes"])])
+                hashes = sidecar["hashes"].tolist()
+                for key, start, end in zip(
+                    sidecar["keys"].tolist(), offsets[:-1], offsets[1:]
+                ):
+                    record_hashes[key] = hashes[start:end]
+
+    missing = [key for key in keys if key not in record_hashes]
+    if missing:
+        logger.info(f"Hashing the conformers of {len(missing)} records")
+        chunks = [missing[i : i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        hash_chunk = partial(_hash_chunk, dataset_format, dataset_path, dataset_options)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            for chunk, hashes in zip(chunks, pool.map(hash_chunk, chunks)):
+                record_hashes.update(zip(chunk, hashes))
+        try:
+            np.savez_compressed(
+                sidecar_path,
+                signature=signature,
+                keys=np.array(list(record_hashes), dtype=str),
+                n_hashes=np.array([len(h) for h in record_hashes.values()], dtype=np.int64),
+                hashes=np.array(
+                    [h for hashes in record_hashes.values() for h in hashes], dtype="<U64"
+                ),
+            )
+        except OSError as e:
+            logger.warning(f"Could not write {sidecar_path}: {e}")
+    return {key: record_hashes[key] for key in keys}
+
+
+def input_hash(hashes):
+    """
+    Hash of the input of a job from the hashes of its conformers.
+    """
+    return hashlib.sha256("|".join(hashes).encode()).hexdigest()
+
+
+def record_input_hash(data_input):
+    """
+    Hash of the input of a job from its loaded record.
+    """
+    return input_hash(conformer_hashes(data_input))
+
+
+def run_parameters(config):
+    """
+    Settings of a campaign that change the result of a job, see parameter_fields.
+    """
+    return {name: getattr(config, name) for name in parameter_fields}
+
+
+def parameters_hash(config):
+    """
+    Hash of the settings of a campaign that change the result of a job.
+    """
+    encoded = json.dumps(run_parameters(config), sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def provenance_hash(input_hash: str, parameters_hash: str):
+    """
+    Hash of the input and parameters of a job.
+    """
+    return hashlib.sha256(f"{input_hash}|{parameters_hash}".encode()).hexdigest()
+
+
+def find_reusable(expected: dict, database_paths: list):
+    """
+    Find completed jobs whose provenance hash matches the expected one.
+
+    Parameters
+    ----------
+    expected: dict, required
+        Provenance hash of each job of the new campaign, keyed by job.
+    database_paths: list of str, required
+        Campaign databases to search, in order of preference; databases that do not exist are skipped.
+
+    Returns
+    -------
+    dict
+        Database holding the result to reuse, keyed by job.
+    """
+    import os
+    from sqlitedict import SqliteDict
+
+    reusable = {}
+    for database_path in database_paths:
+        if not os.path.exists(database_path):
+            continue
+        n_found = 0
+        with SqliteDict(database_path, tablename="status", flag="r") as status_db:
+            completed = [
+                key
+                for key, status in status_db.items()
+                if status == "completed" and key in expected and key not in reusable
+            ]
+        with SqliteDict(database_path, tablename="metadata") as metadata_db:
+            for key in completed:
+                metadata = metadata_db.get(key, {})
+                if metadata.get("provenance_hash") == expected[key]:
+                    reusable[key] = database_path
+                    n_found += 1
+        logger.info(
+            f"{n_found} of {len(completed)} completed jobs in {database_path} can be reused"
+        )
+    return reusable
+
+
+def reuse_results(database_path: str, reusable: dict):
+    """
+    Mark the reusable jobs as "completed", copying their results and metadata from other databases.
+
+    Only jobs queued in the status table ("not_submitted") are marked, so jobs excluded by the element
+    filter of the new campaign stay "not_included". The metadata of the other queued jobs is cleared,
+    and the results of every job of this database that is not "completed" (or "submitted", i.e.
+    still running) are deleted, so results computed with other settings or inputs are not exported.
+
+    Parameters
+    ----------
+    database_path: str, required
+        Path to the database of the new campaign.
+    reusable: dict, required
+        Database holding the result to reuse, keyed by job (see find_reusable).
+
+    Returns
+    -------
+    int
+        Number of jobs marked "completed".
+    """
+    import os
+    from sqlitedict import SqliteDict
+
+    with SqliteDict(database_path, tablename="status", flag="r") as status_db:
+        statuses = dict(status_db.items())
+    queued = {key for key, status in statuses.items() if status == "not_submitted"}
+    reused = [key for key in reusable if key in queued]
+
+    sources = {}
+    for key in reused:
+        if os.path.abspath(reusable[key]) != os.path.abspath(database_path):
+            sources.setdefault(reusable[key], []).append(key)
+
+    # each SqliteDict has its own connection, so the tables are written one after the other
+    def raw(value):
+        return value
+
+    for source_path, keys in sources.items():
+        for table in ["results", "metadata"]:
+            # the pickled values are copied as they are, without loading the results
+            with SqliteDict(
+                source_path, tablename=table, flag="r", decode=raw
+            ) as source_db:
+                with SqliteDict(
+                    database_path, tablename=table, autocommit=False, encode=raw
+                ) as target_db:
+                    for key in keys:
+                        target_db[key] = source_db[key]
+                    target_db.commit()
+        # copied results have not been exported to the output of this campaign yet
+        with SqliteDict(
+            database_path, tablename="exported", autocommit=False
+        ) as exported_db:
+            for key in keys:
+                if key in exported_db:
+                    del exported_db[key]
+            exported_db.commit()
+
+    # jobs of this database that are queued again start over (e.g., with no failed attempts)
+    queued.difference_update(reused)
+    with SqliteDict(database_path, tablename="metadata", autocommit=False) as metadata_db:
+        for key in [key for key in metadata_db.keys() if key in queued]:
+            del metadata_db[key]
+        metadata_db.commit()
+
+    # results of jobs queued again, excluded or failed on setup (also when no result was reused)
+    outdated = {
+        key
+        for key, status in statuses.items()
+        if status not in ["completed", "submitted"]
+    }
+    outdated.difference_update(reused)
+    with SqliteDict(database_path, tablename="results", autocommit=False) as results_db:
+        for key in [key for key in results_db.keys() if key in outdated]:
+            del results_db[key]
+        results_db.commit()
+
+    with SqliteDict(database_path, tablename="status", autocommit=False) as status_db:
+        for key in reused:
+            status_db[key] = "completed"
+        status_db.commit()
+    return len(reused)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def make_datapoint():
+    """
+    Factory of DataPoint results, with magnitudes in the units of the exported records.
+
+    geometry (nm) has shape (n_configs, n_atoms, 3); properties not given are zero.
+    """
+    from openff.units import unit
+
+    from xtb_config_gen import DataPoint
+
+    def make(
+        name,
+        atomic_numbers,
+        geometry,
+        energy=None,
+        forces=None,
+        partial_charges=None,
+        dipole_moment=None,
+        total_charge=0.0,
+        spin_multiplicity=1,
+        stoichiometry="H2O",
+    ):
+        geometry = np.asarray(geometry, dtype=np.float64)
+        n_configs, n_atoms = geometry.shape[:2]
+        if energy is None:
+            energy = np.zeros((n_configs, 1))
+        if forces is None:
+            forces = np.zeros((n_configs, n_atoms, 3))
+        if partial_charges is None:
+            partial_charges = np.zeros((n_configs, n_atoms))
+        if dipole_moment is None:
+            dipole_moment = np.zeros((n_configs, 3))
+        return DataPoint(
+            name=name,
+            n_configs=n_configs,
+            spin_multiplicity=np.full((n_configs, 1), spin_multiplicity),
+            stoichiometry=stoichiometry,
+            atomic_numbers=np.asarray(atomic_numbers).reshape(-1, 1),
+            geometry=geometry * unit.nanometer,
+            total_charge=np.full((n_configs, 1), total_charge) * unit.elementary_charge,
+            energy=energy * unit.kilojoule_per_mole,
+            partial_charges=partial_charges * unit.elementary_charge,
+            dipole_moment=dipole_moment * unit.elementary_charge * unit.nanometer,
+            forces=forces * unit.kilojoule_per_mole / unit.nanometer,
+        )
+
+    return make
+
+
+@pytest.fixture
+def water_result(make_datapoint):
+    """
+    Factory of water results of n_configs identical configurations, offset by shift.
+    """
+
+    def make(key, n_configs, shift=0.0):
+        return make_datapoint(
+            key,
+            [8, 1, 1],
+            np.full((n_configs, 3, 3), 0.1 + shift),
+            energy=np.full((n_configs, 1), -100.0 - shift),
+        )
+
+    return make
@@ -0,0 +1,105 @@
+import h5py
+import numpy as np
+import pytest
+from ase import Atoms
+from ase.db import connect
+from ase.io import write
+
+from adapters import InputAdapter, XYZDirectoryAdapter, open_adapter
+from export import write_record
+from provenance import conformer_hashes, hash_conformers
+
+
+def _water(shift=0.0):
+    return Atoms(
+        "OH2",
+        positions=[
+            [0.0, 0.0, 0.119 + shift],
+            [0.0, 0.763, -0.477],
+            [0.0, -0.763, -0.477],
+        ],
+    )
+
+
+def test_xyz_adapter_reads_frames_as_conformers(tmp_path):
+    water = _water()
+    water.info["charge"] = -1
+    water.info["multiplicity"] = 2
+    write(tmp_path / "water.xyz", [water, _water(0.05)], format="extxyz")
+
+    adapter = open_adapter("xyz", str(tmp_path))
+    assert isinstance(adapter, XYZDirectoryAdapter)
+    assert list(adapter.keys()) == ["water"]
+
+    summary = adapter.summary("water")
+    np.testing.assert_array_equal(summary.atomic_numbers, [8, 1, 1])
+    assert summary.total_charge == -1.0
+    assert summary.spin_multiplicity == 2
+    assert summary.n_configs == 2
+
+    data_input = adapter.load("water")
+    assert data_input.n_configs == 2
+    np.testing.assert_allclose(
+        data_input.geometry.m_as("angstrom")[1, 0], [0.0, 0.0, 0.169]
+    )
+
+
+def test_xyz_adapter_finds_the_files_of_any_pattern(tmp_path):
+    write(tmp_path / "mol_1.xyz.gz", _water(), format="extxyz")
+    write(tmp_path / "mol_2.extxyz", [_water(), _water(0.05)], format="extxyz")
+
+    adapter = open_adapter("xyz", str(tmp_path), {"pattern": "mol_*"})
+    assert list(adapter.keys()) == ["mol_1", "mol_2"]
+    assert adapter.summary("mol_1").n_configs == 1
+    assert adapter.load("mol_2").n_configs == 2
+
+    write(tmp_path / "mol_1.xyz", _water(), format="extxyz")
+    with pytest.raises(ValueError, match="mol_1"):
+        list(open_adapter("xyz", str(tmp_path), {"pattern": "mol_*"}).keys())
+
+
+def _write_dataset(tmp_path, dataset_format, water_result):
+    if dataset_format == "modelforge_hdf5":
+        path = tmp_path / "dataset.hdf5"
+        with h5py.File(path, "w") as f:
+            write_record(f, "water", water_result("water", 2, shift=0.0123457))
+    elif dataset_format == "xyz":
+        path = tmp_path
+        write(path / "water.xyz", [_water(), _water(0.0123457)], format="extxyz")
+    else:
+        path = tmp_path / "dataset.db"
+        with connect(path) as db:
+            db.write(_water(0.0123457), charge=1, multiplicity=2)
+    return str(path)
+
+
+@pytest.mark.parametrize("dataset_format", ["modelforge_hdf5", "xyz", "ase_db"])
+def test_geometry_hashes_match_the_loaded_record(
+    tmp_path, dataset_format, water_result
+):
+    dataset_path = _write_dataset(tmp_path, dataset_format, water_result)
+    adapter = open_adapter(dataset_format, dataset_path)
+    key = adapter.first_key()
+    summary = adapter.summary(key)
+
+    hashes = hash_conformers(
+        summary.atomic_numbers,
+        adapter.geometry(key),
+        summary.total_charge,
+        summary.spin_multiplicity,
+    )
+    assert len(hashes) == summary.n_configs
+    assert hashes == conformer_hashes(adapter.load(key))
+    adapter.close()
+
+
+def test_incomplete_adapter_cannot_be_created():
+    class NoLoad(InputAdapter):
+        def keys(self):
+            return iter([])
+
+        def summary(self, key):
+            pass
+
+    with pytest.raises(TypeError):
+        NoLoad()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tblite")
+
+from backends import ASEBackend, TBLiteBackend, XTBBackend  # noqa: E402
+
+water_numbers = np.array([8, 1, 1])
+water_positions = np.array(
+    [
+        [0.0, 0.0, 0.119],
+        [0.0, 0.763, -0.477],
+        [0.0, -0.763, -0.477],
+    ]
+)
+
+
+@pytest.mark.parametrize("accuracy", [1.0, 2.0])
+def test_tblite_backend_matches_ase_backend(accuracy):
+    ase_backend = ASEBackend(water_numbers, water_positions, 0.0, 1, accuracy=accuracy)
+    tblite_backend = TBLiteBackend(
+        water_numbers, water_positions, 0.0, 1, accuracy=accuracy
+    )
+
+    # a displaced geometry as well, so the restart from the previous wavefunction is compared too
+    for positions in [water_positions, water_positions + 0.01]:
+        expected = ase_backend.compute(positions)
+        result = tblite_backend.compute(positions)
+
+        assert result.energy == pytest.approx(expected.energy, abs=1e-8)
+        np.testing.assert_allclose(result.forces, expected.forces, atol=1e-8)
+        np.testing.assert_allclose(result.charges, expected.charges, atol=1e-8)
+        np.testing.assert_allclose(result.dipole, expected.dipole, atol=1e-8)
+
+
+@pytest.mark.parametrize("backend_class", [ASEBackend, TBLiteBackend])
+def test_reset_guess(backend_class):
+    backend = backend_class(water_numbers, water_positions, 0.0, 1)
+    fresh = backend.compute(water_positions)
+    backend.compute(water_positions + 0.05)
+
+    backend.reset_guess()
+    result = backend.compute(water_positions)
+
+    assert result.energy == pytest.approx(fresh.energy, abs=1e-8)
+    np.testing.assert_allclose(result.forces, fresh.forces, atol=1e-8)
+
+
+def test_incomplete_backend_cannot_be_created():
+    class NoCompute(XTBBackend):
+        def reset_guess(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoCompute(water_numbers, water_positions, 0.0)
+
+
+def test_factory_reuses_the_ase_calculator():
+    from backends import CalculatorFactory
+
+    factory = CalculatorFactory("ase")
+    water = factory.create(water_numbers, water_positions, 0.0, 1, 1.0)
+    calc = water.calc
+    assert factory.create(water_numbers, water_positions, 0.0, 1, 1.0) is water
+
+    # a different molecule with the same settings gets the cached calculator
+    ammonia_numbers = np.array([7, 1, 1, 1])
+    ammonia_positions = np.array(
+        [
+            [0.0, 0.0, 0.1],
+            [0.94, 0.0, -0.27],
+            [-0.47, 0.81, -0.27],
+            [-0.47, -0.81, -0.27],
+        ]
+    )
+    ammonia = factory.create(ammonia_numbers, ammonia_positions, 0.0, 1, 1.0)
+    assert ammonia.calc is calc
+    ammonia.reset_guess()
+    assert ammonia.calc is calc
+
+    expected = ASEBackend(ammonia_numbers, ammonia_positions, 0.0, 1).compute(
+        ammonia_positions
+    )
+    result = ammonia.compute(ammonia_positions)
+    assert result.energy == pytest.approx(expected.energy, abs=1e-8)
+    np.testing.assert_allclose(result.forces, expected.forces, atol=1e-8)
@@ -0,0 +1,42 @@
+import pytest
+from sqlitedict import SqliteDict
+
+from budget import choose_sampling
+
+
+def test_sampling_keeps_the_target_when_it_fits():
+    assert choose_sampling(0.1, 1.0, 1e6, target_steps=100, target_repeats=10) == (
+        100,
+        10,
+    )
+
+
+def test_sampling_reduces_repeats_before_steps():
+    # 1 s for the initial point and 11 s per repeat of 100 steps
+    assert choose_sampling(0.1, 1.0, 1.0 + 3 * 11.0, 100, 10) == (100, 3)
+
+
+def test_sampling_reduces_steps_down_to_the_minimum():
+    assert choose_sampling(0.125, 1.0, 1.0 + 1.0 + 5.0, 100, 10) == (40, 1)
+    assert choose_sampling(0.1, 1.0, 0.5, 100, 10, min_steps=10) == (10, 1)
+
+
+def test_worker_returns_the_allocation_of_a_job_that_raised(tmp_path, monkeypatch):
+    import campaign
+    from campaign import run_worker, setup_campaign
+    from tests.test_campaign_setup import _make_config
+
+    config = _make_config(tmp_path, budget_cpu_hours_total=1.0)
+    setup_campaign(config)
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("crashed")
+
+    monkeypatch.setattr(campaign, "run_job", crash)
+    with pytest.raises(RuntimeError):
+        run_worker(config)
+
+    with SqliteDict(config.database_path, tablename="budget", flag="r") as budget_db:
+        # only the few milliseconds the job ran are still charged
+        assert budget_db["allocated"] == pytest.approx(budget_db["used"])
+        assert budget_db["used"] < 1.0
@@ -0,0 +1,55 @@
+from ase import Atoms
+from ase.io import write
+from sqlitedict import SqliteDict
+
+from campaign import CampaignConfig, setup_campaign
+
+
+def _water(shift=0.0):
+    return Atoms(
+        "OH2",
+        positions=[
+            [0.0, 0.0, 0.119 + shift],
+            [0.0, 0.763, -0.477],
+            [0.0, -0.763, -0.477],
+        ],
+    )
+
+
+def _make_config(tmp_path, **kwargs):
+    dataset_path = tmp_path / "dataset"
+    dataset_path.mkdir(exist_ok=True)
+    write(dataset_path / "single.xyz", _water(), format="extxyz")
+    write(dataset_path / "multi.xyz", [_water(), _water(0.05)], format="extxyz")
+    return CampaignConfig(
+        name="test",
+        dataset_path=str(dataset_path),
+        database_path=str(tmp_path / "campaign.sqlite"),
+        dataset_format="xyz",
+        lockfile_path=str(tmp_path / "status.lockfile"),
+        **kwargs,
+    )
+
+
+def _table(config, tablename):
+    with SqliteDict(config.database_path, tablename=tablename, flag="r") as db:
+        return dict(db.items())
+
+
+def test_multi_conformer_record_fails_without_fan_out(tmp_path):
+    config = _make_config(tmp_path)
+
+    assert setup_campaign(config) == 1
+    assert _table(config, "status") == {"single": "not_submitted", "multi": "failed"}
+    assert "fan_out_conformers" in _table(config, "metadata")["multi"]["last_failure"]
+
+
+def test_fan_out_queues_each_conformer(tmp_path):
+    config = _make_config(tmp_path, fan_out_conformers=True)
+
+    assert setup_campaign(config) == 3
+    assert _table(config, "status") == {
+        "single": "not_submitted",
+        "multi::0": "not_submitted",
+        "multi::1": "not_submitted",
+    }
@@ -0,0 +1,83 @@
+import numpy as np
+from openff.units import unit
+
+from xtb_config_gen import ConfigurationArrays, DataPointFromHDF5, XTBProperties
+
+
+def _data_points(n_configs, n_atoms, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        XTBProperties(
+            geometry=rng.normal(size=(n_atoms, 3)) * unit.angstrom,
+            potential_energy=rng.normal() * 1e-18 * unit.joule,
+            forces=rng.normal(size=(n_atoms, 3)) * 1e-9 * unit.joule / unit.angstrom,
+            partial_charges=rng.normal(size=n_atoms) * unit.elementary_charge,
+            dipole_moment=rng.normal(size=3) * unit.elementary_charge * unit.angstrom,
+        )
+        for _ in range(n_configs)
+    ]
+
+
+def _stacked(data_points, data_input):
+    # the output of run_xtb_calc before ConfigurationArrays, over all data points
+    from utils import get_chem_context
+
+    get_chem_context()
+    n_atoms = data_input.atomic_numbers.shape[0]
+    geometry = data_points[0].geometry.reshape(1, n_atoms, 3)
+    energy = data_points[0].potential_energy.reshape(1, 1)
+    forces = data_points[0].forces.reshape(1, n_atoms, 3)
+    partial_charges = data_points[0].partial_charges.reshape(1, n_atoms)
+    dipole_moment = data_points[0].dipole_moment.reshape(1, 3)
+    total_charge = data_input.total_charge
+    spin_multiplicity = data_input.spin_multiplicity
+    for data_point in data_points[1:]:
+        geometry = np.vstack((geometry, data_point.geometry.reshape(1, n_atoms, 3)))
+        energy = np.vstack((energy, data_point.potential_energy.reshape(1, 1)))
+        forces = np.vstack((forces, data_point.forces.reshape(1, n_atoms, 3)))
+        partial_charges = np.vstack(
+            (partial_charges, data_point.partial_charges.reshape(1, n_atoms))
+        )
+        dipole_moment = np.vstack((dipole_moment, data_point.dipole_moment.reshape(1, 3)))
+        total_charge = np.vstack((total_charge, data_input.total_charge))
+        spin_multiplicity = np.vstack((spin_multiplicity, data_input.spin_multiplicity))
+    return {
+        "geometry": geometry.to("nanometer"),
+        "energy": energy.to("kilojoule_per_mole", "chem"),
+        "forces": forces.to("kilojoule_per_mole/nanometer", "chem"),
+        "partial_charges": partial_charges.to("e"),
+        "dipole_moment": dipole_moment.to("e*nanometer"),
+        "total_charge": total_charge.to("e", "chem"),
+        "spin_multiplicity": spin_multiplicity,
+    }
+
+
+def test_configuration_arrays_match_the_stacked_data_points():
+    n_configs, n_atoms = 11, 3
+    data_input = DataPointFromHDF5(
+        name="water",
+        n_configs=1,
+        spin_multiplicity=np.array([[1]]),
+        stoichiometry="H2O",
+        atomic_numbers=np.array([[8], [1], [1]]),
+        geometry=np.zeros((1, n_atoms, 3)) * unit.nanometer,
+        total_charge=np.array([[0.0]]) * unit.elementary_charge,
+    )
+    data_points = _data_points(n_configs, n_atoms)
+    configurations = ConfigurationArrays(n_configs, n_atoms)
+    for index, data_point in enumerate(data_points):
+        configurations.set(index, data_point)
+    data_output = configurations.to_datapoint(data_input)
+
+    assert data_output.n_configs == n_configs
+    for name, expected in _stacked(data_points, data_input).items():
+        value = getattr(data_output, name)
+        assert value.shape == expected.shape, name
+        if isinstance(expected, unit.Quantity):
+            assert value.u == expected.u, name
+            np.testing.assert_allclose(value.m, expected.m, rtol=1e-12, err_msg=name)
+        else:
+            np.testing.assert_array_equal(value, expected)
+
+    configurations.truncate(4)
+    assert configurations.to_datapoint(data_input).geometry.shape == (4, n_atoms, 3)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from cost_model import (
+    CostModel,
+    cross_validate,
+    predict_campaign_hours,
+    record_features,
+    training_data,
+)
+
+
+def _synthetic_jobs(n_records=40, seed=0):
+    rng = np.random.default_rng(seed)
+    n_atoms = rng.integers(10, 200, n_records)
+    n_heavy = rng.integers(0, 3, n_records)
+    charge = rng.integers(-2, 3, n_records)
+    multiplicity = rng.choice([1, 2], n_records)
+    features = record_features(n_atoms, n_heavy, charge, multiplicity)
+    coefficients = np.array([-9.0, 1.5, 0.3, 0.05, 0.2])
+    return features, coefficients
+
+
+def test_fit_recovers_the_step_cost_of_synthetic_timings():
+    features, coefficients = _synthetic_jobs()
+    metadata, features_by_key = {}, {}
+    for index, row in enumerate(features):
+        key = f"record{index}"
+        features_by_key[key] = row
+        step_cost = np.exp(row @ coefficients)
+        # elapsed time of 10 repeats of 100 steps, with single points at twice the cost of a step
+        metadata[key] = {
+            "number_of_steps": 100,
+            "number_of_repeats": 10,
+            "elapsed_seconds": step_cost * (10 * 100 + 11 * 2.0),
+        }
+
+    keys, rows, step_costs, elapsed, ratio = training_data(metadata, features_by_key)
+    assert len(keys) == len(features)
+    assert ratio == 2.0
+    model = CostModel.fit(rows, step_costs, ratio)
+    np.testing.assert_allclose(model.coefficients, coefficients, atol=1e-8)
+    np.testing.assert_allclose(model.job_seconds(rows, 100, 10), elapsed)
+
+    errors = cross_validate(rows, step_costs, elapsed, ratio)
+    assert errors["median_relative_error"] == pytest.approx(0.0, abs=1e-8)
+    assert errors["total_relative_error"] == pytest.approx(0.0, abs=1e-8)
+
+
+def test_cross_validation_needs_a_sample_per_fold():
+    features, coefficients = _synthetic_jobs(n_records=3)
+    step_costs = np.exp(features @ coefficients)
+    errors = cross_validate(features, step_costs, step_costs, 2.0)
+    assert errors["median_relative_error"] is None
+
+
+def test_remaining_hours_count_only_jobs_still_to_run():
+    model = CostModel()
+    features = {"a": record_features([20], [0], [0], [1])[0]}
+    status = {
+        "a::0": "completed",
+        "a::1": "not_submitted",
+        "a::2": "deferred",
+        "a::3": "submitted",
+        "a::4": "failed",
+        "a::5": "timed_out",
+        "a::6": "not_included",
+    }
+    prediction = predict_campaign_hours(model, features, status, 100, 10)
+
+    job_hours = model.job_seconds(features["a"], 100, 10) / 3600.0
+    assert prediction["n_remaining"] == 3
+    assert prediction["remaining_hours"] == pytest.approx(3 * job_hours)
+    assert prediction["total_hours"] == pytest.approx(6 * job_hours)
@@ -0,0 +1,124 @@
+import h5py
+import numpy as np
+import pytest
+
+from dataset_dedup import find_duplicates, pair_fingerprints, run_dedup
+from export import write_record
+
+# a small distorted ethanol-like molecule, so distances within each pair of elements differ
+numbers = np.array([6, 6, 8, 1, 1, 1, 1])
+positions = np.array(
+    [
+        [0.00, 0.00, 0.00],
+        [1.52, 0.00, 0.00],
+        [2.05, 1.33, 0.10],
+        [-0.38, 1.02, 0.05],
+        [-0.40, -0.52, 0.88],
+        [1.90, -0.55, -0.86],
+        [2.98, 1.30, 0.32],
+    ]
+)  # angstrom
+
+
+def _rotation(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+@pytest.fixture
+def record(make_datapoint):
+    def make(name, atomic_numbers, geometry, total_charge=0.0, multiplicity=1):
+        # a single configuration, with the geometry in angstrom
+        return make_datapoint(
+            name,
+            atomic_numbers,
+            geometry[np.newaxis] * 0.1,
+            total_charge=total_charge,
+            spin_multiplicity=multiplicity,
+            stoichiometry="C2H4O",
+        )
+
+    return make
+
+
+def _write(file_path, records):
+    with h5py.File(file_path, "w") as f:
+        for record in records:
+            write_record(f, record.name, record)
+
+
+def test_fingerprints_do_not_depend_on_orientation_or_atom_order():
+    permutation = np.array([1, 0, 2, 6, 4, 5, 3])
+    moved = positions @ _rotation(0.7).T + np.array([3.0, -1.0, 2.0])
+
+    expected = pair_fingerprints(numbers, positions[np.newaxis])
+    np.testing.assert_allclose(
+        pair_fingerprints(numbers, moved[np.newaxis]), expected, atol=1e-5
+    )
+    np.testing.assert_allclose(
+        pair_fingerprints(numbers[permutation], positions[permutation][np.newaxis]),
+        expected,
+        atol=1e-5,
+    )
+
+
+def test_duplicates_are_found_within_an_electronic_state(tmp_path, record):
+    file_path = str(tmp_path / "dataset.hdf5")
+    permutation = np.array([1, 0, 2, 6, 4, 5, 3])
+    distorted = positions.copy()
+    distorted[2] += [0.3, -0.2, 0.1]
+    _write(
+        file_path,
+        [
+            record("a", numbers, positions),
+            record("b_rotated", numbers, positions @ _rotation(1.2).T + 5.0),
+            record("c_permuted", numbers[permutation], positions[permutation]),
+            record(
+                "d_perturbed",
+                numbers,
+                positions + np.random.default_rng(0).normal(scale=0.002, size=(7, 3)),
+            ),
+            record("e_distorted", numbers, distorted),
+            record("f_anion", numbers, positions, total_charge=-1.0, multiplicity=2),
+            record("g_triplet", numbers, positions, multiplicity=3),
+        ],
+    )
+
+    duplicates = find_duplicates([file_path], processes=1)
+
+    assert duplicates["keys"].tolist() == [
+        "a",
+        "b_rotated",
+        "c_permuted",
+        "d_perturbed",
+        "e_distorted",
+        "f_anion",
+        "g_triplet",
+    ]
+    np.testing.assert_array_equal(duplicates["duplicate_of"], [-1, 0, 0, 0, -1, -1, -1])
+    assert (duplicates["distance"][1:4] < 0.02).all()
+
+
+def test_reference_configurations_are_kept(tmp_path, record):
+    reference_path = str(tmp_path / "reference.hdf5")
+    file_path = str(tmp_path / "dataset.hdf5")
+    filtered_path = str(tmp_path / "filtered.hdf5")
+    _write(reference_path, [record("a", numbers, positions)])
+    _write(
+        file_path,
+        [
+            record("a", numbers, positions @ _rotation(0.3).T),
+            record("b", numbers, positions, total_charge=1.0, multiplicity=2),
+        ],
+    )
+
+    summary = run_dedup(
+        [reference_path, file_path],
+        output_paths=[None, filtered_path],
+        processes=1,
+    )
+
+    assert summary["files"][reference_path]["n_duplicates"] == 0
+    assert summary["files"][file_path]["n_duplicates"] == 1
+    with h5py.File(filtered_path, "r") as f:
+        assert list(f.keys()) == ["b"]
@@ -0,0 +1,123 @@
+import h5py
+import numpy as np
+import pytest
+
+from dataset_qa import run_qa
+from export import write_record
+
+water_positions = np.array(
+    [
+        [0.0, 0.0, 0.0119],
+        [0.0, 0.0763, -0.0477],
+        [0.0, -0.0763, -0.0477],
+    ]
+)  # nm
+water_charges = np.array([-0.6, 0.3, 0.3])
+n_configs = 15
+
+
+@pytest.fixture
+def water_configurations(make_datapoint):
+    """
+    Water configurations that pass all checks, except those changed on purpose:
+    1 overlapping atoms, 2 a huge force, 3 charges that do not sum to the total charge,
+    4 a NaN energy and 5 an outlying energy.
+    """
+    rng = np.random.default_rng(0)
+    geometry = water_positions + rng.normal(scale=0.001, size=(n_configs, 3, 3))
+    geometry[1, 1] = geometry[1, 0] + 0.001
+    forces = rng.normal(scale=10.0, size=(n_configs, 3, 3))
+    forces[2, 0, 0] = 1e6
+    charges = np.tile(water_charges, (n_configs, 1))
+    charges[3] += 0.1
+    dipole = np.einsum("ci,cik->ck", charges, geometry)
+    energy = -100.0 + rng.normal(scale=0.1, size=(n_configs, 1))
+    energy[4] = np.nan
+    energy[5] = 0.0
+
+    return make_datapoint(
+        "water",
+        [8, 1, 1],
+        geometry,
+        energy=energy,
+        forces=forces,
+        partial_charges=charges,
+        dipole_moment=dipole,
+    )
+
+
+def test_qa_flags_and_filters_bad_configurations(tmp_path, water_configurations):
+    file_path = str(tmp_path / "dataset.hdf5")
+    filtered_path = str(tmp_path / "filtered.hdf5")
+    with h5py.File(file_path, "w") as f:
+        write_record(f, "water", water_configurations, {"sampler": "md"})
+
+    summary = run_qa(file_path, filtered_path=filtered_path, processes=1)
+
+    assert summary["n_configs"] == n_configs
+    assert summary["n_configs_passed"] == n_configs - 5
+    assert summary["n_records_with_failures"] == 1
+    mask = np.load(f"{file_path}.qa.npz")
+    expected = {
+        "atoms_overlap": [1],
+        "max_force": [2],
+        "charge_sum": [3],
+        "not_finite": [4],
+        "energy_outlier": [5],
+        "dipole": [],
+    }
+    for name, configs in expected.items():
+        np.testing.assert_array_equal(np.nonzero(mask[f"failed_{name}"])[0], configs)
+    np.testing.assert_array_equal(np.nonzero(~mask["passed"])[0], [1, 2, 3, 4, 5])
+
+    with h5py.File(file_path, "r") as f, h5py.File(filtered_path, "r") as filtered:
+        record, kept = f["water"], filtered["water"]
+        assert kept["n_configs"][()] == n_configs - 5
+        passed = np.r_[0, 6:n_configs]
+        np.testing.assert_array_equal(kept["energy"][()], record["energy"][()][passed])
+        np.testing.assert_array_equal(
+            kept["geometry"][()], record["geometry"][()][passed]
+        )
+        assert kept["geometry"].attrs["u"] == record["geometry"].attrs["u"]
+        assert kept.attrs["sampler"] == "md"
+
+
+def test_small_stoichiometries_are_not_checked_for_energy_outliers(
+    tmp_path, water_configurations
+):
+    file_path = str(tmp_path / "dataset.hdf5")
+    with h5py.File(file_path, "w") as f:
+        write_record(f, "water", water_configurations)
+
+    run_qa(file_path, processes=1, min_group_size=n_configs + 1)
+
+    mask = np.load(f"{file_path}.qa.npz")
+    assert not mask["failed_energy_outlier"].any()
+    assert not mask["energy_zscore"].any()
+
+
+def test_filtered_records_keep_the_attributes_of_their_conformers(
+    tmp_path, water_configurations
+):
+    file_path = str(tmp_path / "dataset.hdf5")
+    filtered_path = str(tmp_path / "filtered.hdf5")
+    # configuration 0 comes from conformer 0, the failing 1-5 from conformer 1, the rest from 2
+    metadata = {
+        "sampler": "md",
+        "conformer_index": np.array([0, 1, 2]),
+        "conformer_n_configs": np.array([1, 5, 9]),
+        "number_of_steps": np.array([10, 20, 30]),
+        "input_hash": np.array(["a", "b", "c"], dtype=h5py.string_dtype()),
+    }
+    with h5py.File(file_path, "w") as f:
+        write_record(f, "water", water_configurations, metadata)
+
+    run_qa(file_path, filtered_path=filtered_path, processes=1)
+
+    with h5py.File(filtered_path, "r") as f:
+        attrs = dict(f["water"].attrs)
+    np.testing.assert_array_equal(attrs["conformer_index"], [0, 2])
+    np.testing.assert_array_equal(attrs["conformer_n_configs"], [1, 9])
+    np.testing.assert_array_equal(attrs["number_of_steps"], [10, 30])
+    assert list(attrs["input_hash"]) == ["a", "c"]
+    assert attrs["sampler"] == "md"
@@ -0,0 +1,42 @@
+import os
+
+import h5py
+import pytest
+
+import dataset_stats
+from dataset_stats import load_record_fields
+from export import write_record
+
+
+def _write(file_path, keys, water_result):
+    with h5py.File(file_path, "w") as f:
+        for key in keys:
+            write_record(f, key, water_result(key, 1))
+
+
+def test_sidecar_is_used_until_the_dataset_changes(
+    tmp_path, monkeypatch, water_result
+):
+    file_path = str(tmp_path / "dataset.hdf5")
+    _write(file_path, ["a", "b"], water_result)
+
+    fields = load_record_fields(file_path, processes=1)
+    assert fields["keys"].tolist() == ["a", "b"]
+    assert fields["n_atoms"].tolist() == [3, 3]
+    assert os.path.exists(f"{file_path}.stats.npz")
+
+    collect_record_fields = dataset_stats.collect_record_fields
+
+    def not_read(*args, **kwargs):
+        raise AssertionError("the dataset was read again")
+
+    monkeypatch.setattr(dataset_stats, "collect_record_fields", not_read)
+    assert load_record_fields(file_path, processes=1)["keys"].tolist() == ["a", "b"]
+
+    # a record is added, which changes the size of the file
+    _write(file_path, ["a", "b", "c"], water_result)
+    with pytest.raises(AssertionError, match="read again"):
+        load_record_fields(file_path, processes=1)
+    monkeypatch.setattr(dataset_stats, "collect_record_fields", collect_record_fields)
+    fields = load_record_fields(file_path, processes=1)
+    assert fields["keys"].tolist() == ["a", "b", "c"]
@@ -0,0 +1,48 @@
+import h5py
+import numpy as np
+
+from export import export_results_to_hdf5
+from job_queue import (
+    conformer_key,
+    mark_completed_batch,
+    record_metadata_batch,
+    setup_status_db,
+)
+
+
+def test_export_merges_conformers_with_string_metadata(tmp_path, water_result):
+    database_path = str(tmp_path / "campaign.sqlite")
+    lockfile_path = str(tmp_path / "status.lockfile")
+    output_path = str(tmp_path / "output.hdf5")
+    keys = [conformer_key("water", 0), conformer_key("water", 1)]
+    setup_status_db(database_path, keys)
+
+    mark_completed_batch(
+        database_path,
+        lockfile_path,
+        {
+            keys[0]: water_result(keys[0], 2),
+            keys[1]: water_result(keys[1], 3, shift=0.01),
+        },
+    )
+    record_metadata_batch(
+        database_path,
+        {
+            keys[0]: {"sampler": "md", "input_hash": "a", "number_of_steps": 10},
+            keys[1]: {"sampler": "md", "input_hash": "b", "number_of_steps": 20},
+        },
+    )
+
+    assert export_results_to_hdf5(database_path, output_path) == 2
+
+    with h5py.File(output_path, "r") as f:
+        record = f["water"]
+        assert record["n_configs"][()] == 5
+        assert record["geometry"].shape == (5, 3, 3)
+        np.testing.assert_allclose(record["energy"][2:, 0], -100.01)
+        attrs = dict(record.attrs)
+    np.testing.assert_array_equal(attrs["conformer_index"], [0, 1])
+    np.testing.assert_array_equal(attrs["conformer_n_configs"], [2, 3])
+    np.testing.assert_array_equal(attrs["number_of_steps"], [10, 20])
+    assert attrs["sampler"] == "md"
+    assert list(attrs["input_hash"]) == ["a", "b"]
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+heavy_modules = ["tblite", "ase", "openff.units", "h5py"]
+
+
+def _run(code):
+    # a fresh interpreter, as the modules may already be loaded by other tests
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=repository,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+@pytest.mark.parametrize("module", ["xtb_config_gen", "utils", "job_queue"])
+def test_import_does_not_load_heavy_modules(module):
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(name for name in {heavy_modules!r} if name in sys.modules))"
+    )
+    assert _run(code) == ""
+
+
+def test_chem_context_is_built_on_first_use():
+    code = (
+        "import sys, utils; "
+        "print(utils._chem_context is None, 'openff.units' in sys.modules); "
+        "from utils import chem_context; "
+        "print(utils._chem_context is chem_context)"
+    )
+    assert _run(code).split() == ["True", "False", "True"]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tblite")
+
+from ase import Atoms  # noqa: E402
+
+from backends import TBLiteBackend  # noqa: E402
+from integrator import BAOABLangevin  # noqa: E402
+
+water_numbers = np.array([8, 1, 1])
+water_positions = np.array(
+    [
+        [0.0, 0.0, 0.119],
+        [0.0, 0.763, -0.477],
+        [0.0, -0.763, -0.477],
+    ]
+)
+
+
+def test_baoab_holds_the_target_temperature():
+    backend = TBLiteBackend(water_numbers, water_positions, 0.0, 1, accuracy=2.0)
+    dyn = BAOABLangevin(
+        masses=Atoms(numbers=water_numbers).get_masses(),
+        positions=water_positions,
+        force_function=backend.energy_and_forces,
+        timestep=1.0,
+        temperature=400.0,
+        friction=0.05,
+        rng=np.random.default_rng(0),
+    )
+    # starts from rest
+    dyn.run(1000)
+
+    temperatures = []
+    dyn.run(10000, callback=lambda dyn: temperatures.append(dyn.temperature()))
+
+    assert np.mean(temperatures) == pytest.approx(400.0, rel=0.1)
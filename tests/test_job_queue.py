@@ -0,0 +1,29 @@
+from sqlitedict import SqliteDict
+
+from job_queue import WorkerQueue, setup_status_db
+
+
+def _table(database_path, tablename):
+    with SqliteDict(database_path, tablename=tablename, flag="r") as db:
+        return dict(db.items())
+
+
+def test_completed_run_replaces_the_metadata_of_earlier_attempts(tmp_path):
+    database_path = str(tmp_path / "campaign.sqlite")
+    lockfile_path = str(tmp_path / "status.lockfile")
+    setup_status_db(database_path, ["a"])
+
+    with WorkerQueue(database_path, lockfile_path) as queue:
+        key = queue.next_key()
+        queue.time_out(key, "a timeout", max_timeouts=1)
+        assert _table(database_path, "status") == {"a": "deferred"}
+        assert _table(database_path, "metadata")["a"]["last_timeout"] == "a timeout"
+
+        # the deferred record is claimed again and completes with fallback settings
+        assert queue.next_key() == "a"
+        queue.complete("a", None, {"sampler": "md", "fallback_settings": True})
+
+    assert _table(database_path, "status") == {"a": "completed"}
+    assert _table(database_path, "metadata") == {
+        "a": {"sampler": "md", "fallback_settings": True}
+    }
@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+
+from utils import LockTimeout, NodeSemaphore, OpenWithLock, lock_with_retries
+
+
+@pytest.fixture
+def default_timeout():
+    OpenWithLock.default_timeout = 0.05
+    yield
+    OpenWithLock.default_timeout = None
+
+
+def _release_later(lock, delay):
+    timer = threading.Timer(delay, lock.__exit__, (None, None, None))
+    timer.start()
+    return timer
+
+
+def test_lock_with_retries_waits_for_a_released_lock(tmp_path, default_timeout):
+    lockfile_path = str(tmp_path / "status.lockfile")
+    holder = OpenWithLock(lockfile_path, "w")
+    holder.__enter__()
+    timer = _release_later(holder, 0.3)
+
+    with pytest.raises(LockTimeout):
+        with lock_with_retries(lockfile_path, attempts=1):
+            pass
+    with lock_with_retries(lockfile_path, attempts=5, backoff=0.1):
+        pass
+    timer.join()
+
+
+def test_node_semaphore_ignores_the_default_timeout(tmp_path, default_timeout):
+    acquire_path = str(tmp_path / "cores_acquire.lock")
+    holder = OpenWithLock(acquire_path, "w")
+    holder.__enter__()
+    timer = _release_later(holder, 0.3)
+
+    with NodeSemaphore(str(tmp_path), 1, name="cores", poll_interval=0.01) as slots:
+        assert slots.wait_time >= 0.2
+    timer.join()
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("scipy")
+
+from md_checks import MDCheck, UnphysicalMD  # noqa: E402
+
+water_numbers = np.array([8, 1, 1])
+water_positions = np.array(
+    [
+        [0.0, 0.0, 0.119],
+        [0.0, 0.763, -0.477],
+        [0.0, -0.763, -0.477],
+    ]
+)
+
+
+def test_fragmented_geometry_aborts_the_run():
+    check = MDCheck(water_numbers, water_positions, temperature=400.0)
+    check(10, water_positions + 0.01)
+
+    dissociated = water_positions.copy()
+    dissociated[1] += [0.0, 3.0, 0.0]
+    with pytest.raises(UnphysicalMD) as error:
+        check(20, dissociated)
+    assert error.value.reason == "fragmentation"
+    assert error.value.step == 20
+
+
+def test_fragments_of_the_starting_geometry_are_not_flagged():
+    # two waters 5 angstrom apart
+    numbers = np.concatenate([water_numbers, water_numbers])
+    positions = np.concatenate([water_positions, water_positions + [5.0, 0.0, 0.0]])
+    check = MDCheck(numbers, positions, temperature=400.0)
+    check(10, positions)
+
+
+@pytest.mark.parametrize(
+    "reason, kwargs",
+    [
+        ("atoms_overlap", {"positions": water_positions * [1.0, 0.2, 0.2]}),
+        ("max_force", {"forces": np.full((3, 3), 30.0)}),
+        ("temperature_spike", {"temperature": 1300.0}),
+    ],
+)
+def test_unphysical_states_abort_the_run(reason, kwargs):
+    check = MDCheck(water_numbers, water_positions, temperature=400.0)
+    state = {"positions": water_positions, **kwargs}
+    with pytest.raises(UnphysicalMD, match=reason):
+        check(5, **state)
+
+
+def test_run_is_truncated_when_a_check_fails():
+    pytest.importorskip("tblite")
+    from openff.units import unit
+
+    from xtb_config_gen import DataPointFromHDF5, run_xtb_calc
+
+    water = DataPointFromHDF5(
+        name="water",
+        n_configs=1,
+        spin_multiplicity=np.array([[1]]),
+        stoichiometry="H2O",
+        atomic_numbers=water_numbers.reshape(-1, 1),
+        geometry=water_positions[np.newaxis] * unit.angstrom,
+        total_charge=np.array([[0.0]]) * unit.elementary_charge,
+    )
+    # every state fails the force check, so the run stops at the check of the first state
+    result = run_xtb_calc(
+        water,
+        number_of_steps=4,
+        number_of_repeats=3,
+        seed=0,
+        md_check_interval=2,
+        md_check_options={"max_force": 1e-6},
+    )
+    assert result.md_abort_reason == "max_force"
+    assert result.md_abort_step == 0
+    assert result.n_configs == 1
+    assert result.geometry.shape == (1, 3, 3)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tblite")
+
+from ase import Atoms  # noqa: E402
+from ase.optimize import BFGS  # noqa: E402
+from tblite.ase import TBLite  # noqa: E402
+
+from normal_modes import (  # noqa: E402
+    finite_difference_hessian,
+    normal_modes,
+    sample_displacements,
+)
+
+
+@pytest.fixture(scope="module")
+def water():
+    mol = Atoms(
+        "OH2",
+        positions=[[0.0, 0.0, 0.119], [0.0, 0.763, -0.477], [0.0, -0.763, -0.477]],
+    )
+    mol.calc = TBLite(method="GFN2-xTB", verbosity=0)
+    BFGS(mol, logfile=None).run(fmax=1e-3)
+    return mol
+
+
+def test_water_has_three_real_vibrational_modes(water):
+    hessian = finite_difference_hessian(
+        "ase", water.numbers, water.positions, charge=0.0, multiplicity=1
+    )
+    np.testing.assert_allclose(hessian, hessian.T)
+
+    eigenvalues, eigenvectors, frequencies = normal_modes(
+        hessian, water.get_masses(), water.positions
+    )
+    # 3N - 6 modes: the bend and the two O-H stretches
+    assert frequencies.shape == (3,)
+    assert (eigenvalues > 0).all()
+    assert 1000.0 < frequencies[0] < 2000.0
+    assert (frequencies[1:] > 3000.0).all()
+    assert eigenvectors.shape == (9, 3)
+
+    displacements = sample_displacements(
+        eigenvalues,
+        eigenvectors,
+        water.get_masses(),
+        temperature=400.0,
+        n_samples=5,
+        rng=np.random.default_rng(0),
+    )
+    assert displacements.shape == (5, 3, 3)
+    # displacements along vibrations do not move the center of mass
+    center = np.einsum("i,sik->sk", water.get_masses(), displacements)
+    np.testing.assert_allclose(center, 0.0, atol=1e-10)
+
+
+def test_rigid_body_motion_is_projected_out_away_from_a_minimum(water):
+    rng = np.random.default_rng(0)
+    positions = water.positions + rng.normal(scale=0.02, size=(3, 3))
+    hessian = finite_difference_hessian(
+        "ase", water.numbers, positions, charge=0.0, multiplicity=1
+    )
+    _, _, frequencies = normal_modes(hessian, water.get_masses(), positions)
+    assert frequencies.shape == (3,)
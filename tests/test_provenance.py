@@ -0,0 +1,137 @@
+import os
+from dataclasses import replace
+
+import h5py
+import pytest
+from sqlitedict import SqliteDict
+
+from campaign import compute_job, load_record
+from export import export_results_to_hdf5
+from job_queue import mark_completed_batch, record_metadata_batch, setup_status_db
+from provenance import (
+    find_reusable,
+    load_conformer_hashes,
+    parameters_hash,
+    reuse_results,
+)
+from tests.test_campaign_setup import _make_config
+
+
+def _run_campaign(database_path, lockfile_path, keys, water_result):
+    setup_status_db(database_path, keys)
+    mark_completed_batch(
+        database_path, lockfile_path, {key: water_result(key, 2) for key in keys}
+    )
+    record_metadata_batch(
+        database_path, {key: {"provenance_hash": f"{key}-old"} for key in keys}
+    )
+
+
+def test_changed_jobs_are_requeued_and_not_exported(tmp_path, water_result):
+    database_path = str(tmp_path / "campaign.sqlite")
+    lockfile_path = str(tmp_path / "status.lockfile")
+    output_path = str(tmp_path / "output.hdf5")
+    _run_campaign(database_path, lockfile_path, ["a", "b"], water_result)
+    assert export_results_to_hdf5(database_path, output_path) == 2
+
+    # the settings of b changed
+    expected = {"a": "a-old", "b": "b-new"}
+    reusable = find_reusable(expected, [database_path])
+    assert reusable == {"a": database_path}
+    setup_status_db(database_path, list(expected))
+    assert reuse_results(database_path, reusable) == 1
+
+    with SqliteDict(database_path, tablename="status", flag="r") as status_db:
+        assert dict(status_db.items()) == {"a": "completed", "b": "not_submitted"}
+    with SqliteDict(database_path, tablename="results", flag="r") as results_db:
+        assert list(results_db.keys()) == ["a"]
+    with SqliteDict(database_path, tablename="metadata", flag="r") as metadata_db:
+        assert list(metadata_db.keys()) == ["a"]
+
+    # an incremental export removes the record written before
+    export_results_to_hdf5(database_path, output_path, incremental=True)
+    with h5py.File(output_path, "r") as f:
+        assert list(f.keys()) == ["a"]
+
+
+def test_export_skips_results_of_jobs_that_are_not_completed(tmp_path, water_result):
+    database_path = str(tmp_path / "campaign.sqlite")
+    lockfile_path = str(tmp_path / "status.lockfile")
+    output_path = str(tmp_path / "output.hdf5")
+    _run_campaign(database_path, lockfile_path, ["a", "b"], water_result)
+    with SqliteDict(database_path, tablename="status", autocommit=True) as status_db:
+        status_db["b"] = "not_submitted"
+
+    assert export_results_to_hdf5(database_path, output_path) == 1
+    with h5py.File(output_path, "r") as f:
+        assert list(f.keys()) == ["a"]
+
+
+def test_fallback_run_is_hashed_with_the_fallback_settings(tmp_path):
+    pytest.importorskip("tblite")
+    config = _make_config(
+        tmp_path,
+        number_of_steps=2,
+        number_of_repeats=1,
+        straggler_timeout_factor=1000.0,
+        straggler_fallback={"number_of_steps": 1},
+    )
+    record_metadata_batch(config.database_path, {"single": {"timeout_count": 1}})
+
+    _, metadata = compute_job(config, load_record(config, "single"))
+
+    assert metadata["fallback_settings"]
+    assert metadata["parameters_hash"] == parameters_hash(
+        replace(config, number_of_steps=1)
+    )
+    assert metadata["parameters_hash"] != parameters_hash(config)
+
+
+def test_setup_keeps_jobs_claimed_by_running_workers(tmp_path, water_result):
+    database_path = str(tmp_path / "campaign.sqlite")
+    lockfile_path = str(tmp_path / "status.lockfile")
+    _run_campaign(database_path, lockfile_path, ["a", "b"], water_result)
+    # b was requeued and claimed again; its worker is still running
+    with SqliteDict(database_path, tablename="status", autocommit=True) as status_db:
+        status_db["b"] = "submitted"
+
+    assert setup_status_db(database_path, ["a", "b"]) == 1
+    assert reuse_results(database_path, {}) == 0
+
+    with SqliteDict(database_path, tablename="status", flag="r") as status_db:
+        assert dict(status_db.items()) == {"a": "not_submitted", "b": "submitted"}
+    with SqliteDict(database_path, tablename="results", flag="r") as results_db:
+        assert list(results_db.keys()) == ["b"]
+
+
+def test_conformer_hashes_are_cached_on_setup_only(tmp_path, monkeypatch):
+    import concurrent.futures
+
+    from campaign import setup_campaign
+    from dataset_stats import load_record_fields
+
+    config = _make_config(tmp_path, fan_out_conformers=True)
+    hashes_path = f"{config.database_path}.hashes.npz"
+    load_record_fields(
+        config.dataset_path,
+        sidecar_path=f"{config.database_path}.stats.npz",
+        dataset_format=config.dataset_format,
+    )
+    assert not os.path.exists(hashes_path)
+
+    setup_campaign(config)
+    assert os.path.exists(hashes_path)
+    expected = load_conformer_hashes(
+        config.dataset_path, ["single", "multi"], hashes_path, dataset_format="xyz"
+    )
+
+    # a second call reads the hashes from the sidecar, without reading the dataset
+    def no_pool(*args, **kwargs):
+        raise AssertionError("the dataset was read again")
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", no_pool)
+    hashes = load_conformer_hashes(
+        config.dataset_path, ["single", "multi"], hashes_path, dataset_format="xyz"
+    )
+    assert hashes == expected
+    assert [len(hashes["single"]), len(hashes["multi"])] == [1, 2]
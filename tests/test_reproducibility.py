@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from openff.units import unit
+
+pytest.importorskip("tblite")
+
+from utils import job_seed  # noqa: E402
+from xtb_config_gen import DataPointFromHDF5, run_xtb_calc  # noqa: E402
+
+water = DataPointFromHDF5(
+    name="water",
+    n_configs=1,
+    spin_multiplicity=np.array([[1]]),
+    stoichiometry="H2O",
+    atomic_numbers=np.array([[8], [1], [1]]),
+    geometry=np.array(
+        [[[0.0, 0.0, 0.0119], [0.0, 0.0763, -0.0477], [0.0, -0.0763, -0.0477]]]
+    )
+    * unit.nanometer,
+    total_charge=np.array([[0.0]]) * unit.elementary_charge,
+)
+
+
+def _run(seed, integrator):
+    result = run_xtb_calc(
+        water, number_of_steps=5, number_of_repeats=2, seed=seed, integrator=integrator
+    )
+    return result.geometry.m, result.energy.m
+
+
+def test_job_seeds_depend_only_on_the_key_and_campaign_seed():
+    assert job_seed("water", 1) == job_seed("water", 1)
+    assert job_seed("water", 1) != job_seed("water", 2)
+    assert job_seed("water", 1) != job_seed("ammonia", 1)
+    assert 0 <= job_seed("water", 1) < 2**63
+
+
+@pytest.mark.parametrize("integrator", ["ase", "baoab"])
+def test_runs_with_the_same_seed_are_identical(integrator):
+    seed = job_seed("water", 1)
+    geometry, energy = _run(seed, integrator)
+    repeated_geometry, repeated_energy = _run(seed, integrator)
+    np.testing.assert_array_equal(repeated_geometry, geometry)
+    np.testing.assert_array_equal(repeated_energy, energy)
+
+    other_geometry, _ = _run(job_seed("water", 2), integrator)
+    assert not np.array_equal(other_geometry[1:], geometry[1:])
@@ -0,0 +1,37 @@
+import importlib.util
+
+import pytest
+
+from campaign import CampaignConfig
+from threads import thread_limit, threads_for_atoms
+
+has_threadpoolctl = importlib.util.find_spec("threadpoolctl") is not None
+
+
+def test_threads_for_atoms():
+    thresholds = [[50, 2], [100, 4]]
+    assert threads_for_atoms(10) == 1
+    assert threads_for_atoms(10, thresholds) == 1
+    assert threads_for_atoms(50, thresholds) == 2
+    assert threads_for_atoms(150, thresholds) == 4
+
+
+def test_thread_limit_without_threads_does_not_chain_errors():
+    with pytest.raises(RuntimeError) as error:
+        with thread_limit(None):
+            raise RuntimeError("job failed")
+    assert error.value.__context__ is None
+
+
+@pytest.mark.skipif(has_threadpoolctl, reason="threadpoolctl is installed")
+def test_thread_thresholds_need_threadpoolctl():
+    with pytest.raises(ModuleNotFoundError):
+        with thread_limit(2):
+            pass
+    with pytest.raises(ValueError, match="threadpoolctl"):
+        CampaignConfig(
+            name="test",
+            dataset_path="dataset.hdf5",
+            database_path="campaign.sqlite",
+            thread_thresholds=[[50, 2]],
+        )
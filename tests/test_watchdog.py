@@ -0,0 +1,33 @@
+import signal
+import time
+
+import pytest
+
+from watchdog import JobTimeout, Watchdog, time_limit_seconds
+
+
+def test_time_limit_is_a_multiple_of_the_prediction():
+    assert time_limit_seconds(100.0, 3.0, min_seconds=60.0) == 300.0
+    assert time_limit_seconds(1.0, 3.0, min_seconds=60.0) == 60.0
+
+
+def test_watchdog_aborts_a_job_over_its_limit():
+    handler = signal.getsignal(signal.SIGALRM)
+    with pytest.raises(JobTimeout) as error:
+        with Watchdog("straggler", 0.05):
+            # a job that returns to Python between calculator calls
+            for _ in range(100):
+                time.sleep(0.01)
+    assert error.value.name == "straggler"
+    assert error.value.limit_seconds == 0.05
+    assert 0.05 <= error.value.elapsed_seconds < 1.0
+    assert signal.getsignal(signal.SIGALRM) is handler
+
+
+def test_watchdog_is_disarmed_when_the_job_finishes():
+    with Watchdog("job", 0.05):
+        pass
+    # the timer was cancelled, so it does not fire after the job
+    time.sleep(0.1)
+    with Watchdog("job", None):
+        time.sleep(0.01)
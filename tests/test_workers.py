@@ -0,0 +1,46 @@
+import os
+import signal
+
+import forkserver
+from campaign import setup_campaign
+from orchestrator import run_pipelined_worker
+from tests.test_campaign_setup import _make_config, _table
+
+
+def test_pipelined_worker_records_failed_jobs(tmp_path):
+    # the method is only checked by tblite, in the compute process
+    config = _make_config(
+        tmp_path,
+        fan_out_conformers=True,
+        method="not-a-method",
+        max_job_attempts=1,
+        budget_cpu_hours_total=1.0,
+    )
+    setup_campaign(config)
+    run_pipelined_worker(config, n_jobs=3)
+
+    assert set(_table(config, "status").values()) == {"failed"}
+    metadata = _table(config, "metadata")
+    assert all(metadata[key]["failure_count"] == 1 for key in metadata)
+    budget = _table(config, "budget")
+    assert budget["allocated"] == budget["used"]
+
+
+def test_forkserver_requeues_the_job_of_a_killed_child(tmp_path, monkeypatch):
+    config = _make_config(tmp_path, worker_mode="forkserver")
+    setup_campaign(config)
+
+    def kill(*args, **kwargs):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    # the child is forked, so it runs the patched function
+    monkeypatch.setattr(forkserver, "compute_job", kill)
+    forkserver.run_forkserver_worker(config, n_jobs=1)
+
+    assert _table(config, "status")["single"] == "not_submitted"
+    metadata = _table(config, "metadata")["single"]
+    assert metadata["failure_count"] == 1
+    assert metadata["last_failure"] == "killed by SIGKILL"
+
+    forkserver.run_forkserver_worker(config, n_jobs=1)
+    assert _table(config, "status")["single"] == "failed"
@@ -0,0 +1,74 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import xtb_cache
+from xtb_cache import XTBCache, make_cache_key
+
+water_numbers = np.array([8, 1, 1])
+water_positions = np.array(
+    [
+        [0.0, 0.0, 0.119],
+        [0.0, 0.763, -0.477],
+        [0.0, -0.763, -0.477],
+    ]
+)
+
+
+def _key(shift=0.0, accuracy=1.0):
+    return make_cache_key(
+        water_numbers, water_positions + shift, 0.0, 1, "GFN2-xTB", accuracy
+    )
+
+
+def test_keys_depend_on_the_rounded_inputs():
+    assert _key() == _key(shift=1e-8)
+    assert _key() != _key(shift=1e-3)
+    assert _key() != _key(accuracy=2.0)
+
+
+def test_least_recently_used_entries_are_evicted_by_size(tmp_path, monkeypatch):
+    # a clock that advances on every call, so access times never tie
+    clock = itertools.count()
+    monkeypatch.setattr(xtb_cache.time, "time", lambda: float(next(clock)))
+    value = {"energy": np.zeros(100)}
+    with XTBCache(str(tmp_path / "cache.db")) as cache:
+        cache.put("a", value)
+        entry_size = cache.size_bytes()
+        cache.max_size_bytes = int(2.5 * entry_size)
+        cache.put("b", value)
+
+        assert cache.get("c") is None
+        np.testing.assert_array_equal(cache.get("a")["energy"], value["energy"])
+        # b is now the least recently used entry
+        cache.put("c", value)
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+    assert stats["size_bytes"] == 2 * entry_size
+
+
+def test_properties_are_returned_from_the_cache(tmp_path):
+    pytest.importorskip("tblite")
+    from ase import Atoms
+    from tblite.ase import TBLite
+
+    from xtb_config_gen import get_xtb_properties
+
+    mol = Atoms(numbers=water_numbers, positions=water_positions)
+    mol.calc = TBLite(method="GFN2-xTB", accuracy=1.0, verbosity=0)
+    with XTBCache(str(tmp_path / "cache.db")) as cache:
+        computed = get_xtb_properties(mol, cache=cache)
+        cached = get_xtb_properties(mol, cache=cache)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    for name in ["potential_energy", "forces", "partial_charges", "dipole_moment"]:
+        np.testing.assert_array_equal(
+            getattr(cached, name).m, getattr(computed, name).m
+        )
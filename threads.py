@@ -0,0 +1,123 @@
+"""
+Per-job thread counts for tblite, chosen by molecule size.
+
+Small complexes run fastest per core with one thread (see the README), but for the largest
+molecules a single-threaded job can outlast the rest of an allocation. With thread_thresholds,
+jobs above a size get several OpenMP threads; with cores_per_node, each job takes as many core
+slots of the node as it uses threads (see utils.NodeSemaphore), so fewer jobs run at once while
+a large job runs and the number of busy cores stays constant.
+
+The thresholds are tuned from the measured scaling of sample records (measure_thread_scaling and
+choose_thread_thresholds; python campaign.py thread-scaling <config>).
+"""
+
+from contextlib import contextmanager
+
+
+def threads_for_atoms(n_atoms: int, thresholds=None):
+    """
+    Number of threads of a job.
+
+    Parameters
+    ----------
+    n_atoms: int, required
+        Number of atoms of the record.
+    thresholds: list of [int, int], optional, default=None
+        Pairs [min_atoms, threads]: records with at least min_atoms atoms use threads threads.
+        Records below all thresholds (or if thresholds is None) use one thread.
+    """
+    n_threads = 1
+    for min_atoms, threads in thresholds or []:
+        if n_atoms >= min_atoms:
+            n_threads = max(n_threads, int(threads))
+    return n_threads
+
+
+@contextmanager
+def thread_limit(n_threads: int = None):
+    """
+    Limit the OpenMP and BLAS threads of the libraries loaded in this process (tblite) to n_threads.
+
+    If n_threads is None, nothing is changed and the thread count set by OMP_NUM_THREADS when the
+    process started is used. Otherwise this needs threadpoolctl.
+    """
+    if n_threads is None:
+        yield
+        return
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError(
+            "threadpoolctl is required to set the number of threads of a job (thread_thresholds)"
+        ) from None
+
+    with threadpool_limits(limits=n_threads):
+        yield
+
+
+def measure_thread_scaling(data_input, thread_counts=(1, 2, 4, 8), **kwargs):
+    """
+    Measure the seconds per MD step of a record with different thread counts.
+
+    Parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        Record to measure.
+    thread_counts: tuple of int, optional, default=(1, 2, 4, 8)
+        Thread counts to measure.
+    kwargs:
+        Passed to xtb_config_gen.measure_step_cost (e.g., number_of_steps, method, md_accuracy, backend).
+
+    Returns
+    -------
+    dict
+        Seconds per MD step, keyed by thread count.
+    """
+    from xtb_config_gen import measure_step_cost
+
+    step_costs = {}
+    for n_threads in thread_counts:
+        with thread_limit(n_threads):
+            step_costs[n_threads], _ = measure_step_cost(data_input, **kwargs)
+    return step_costs
+
+
+def choose_thread_thresholds(samples, min_efficiency: float = 0.7):
+    """
+    Choose thread_thresholds from measured scaling.
+
+    A thread count is used from the smallest size above which every sample reaches min_efficiency
+    parallel efficiency (speed-up over one thread divided by the thread count) with it.
+
+    Parameters
+    ----------
+    samples: list of tuple, required
+        (n_atoms, step costs keyed by thread count, as returned by measure_thread_scaling).
+    min_efficiency: float, optional, default=0.7
+        Lowest parallel efficiency accepted for a thread count.
+
+    Returns
+    -------
+    list of [int, int]
+        Pairs [min_atoms, threads], see threads_for_atoms.
+    """
+    samples = sorted(samples, key=lambda sample: sample[0])
+    thread_counts = sorted(
+        {n for _, step_costs in samples for n in step_costs if n > 1}
+    )
+
+    thresholds = []
+    for n_threads in thread_counts:
+        min_atoms = None
+        # scan from the largest sample down, while the efficiency stays high enough
+        for n_atoms, step_costs in reversed(samples):
+            if 1 not in step_costs or n_threads not in step_costs:
+                continue
+            efficiency = step_costs[1] / (n_threads * step_costs[n_threads])
+            if efficiency < min_efficiency:
+                break
+            min_atoms = n_atoms
+        if min_atoms is not None:
+            thresholds.append([int(min_atoms), int(n_threads)])
+    return thresholds
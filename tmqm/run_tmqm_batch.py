@@ -7,6 +7,7 @@ from loguru import logger
 
 filepath = "/home/cri/datasets/hdf5_files/tmqm_dataset_v0.hdf5"
 from utils import OpenWithLock
+from xtb_cache import XTBCache
 
 data_input = None
 with OpenWithLock(f"../status.lockfile", "w") as lock_file:
@@ -24,7 +25,9 @@ logger.debug(f"starting: {data_input.name}")
 logger.debug(f"n_atoms:  {data_input.geometry.shape[1]}")
 
 start = time()
-xtb_properties = run_xtb_calc(data_input)
+# the cache is shared between workers (and campaigns) so repeated geometries are not recomputed
+with XTBCache("../xtb_cache.db") as cache:
+    xtb_properties = run_xtb_calc(data_input, cache=cache)
 end = time()
 
 logger.debug(f"name: {data_input.name}")
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from loguru import logger
 
 
@@ -68,9 +70,170 @@ def check_file_lock(file_handle):
     except:
         return True
 
+    # the probe acquired the lock; release it so it is not held by a check
+    fcntl.flock(file_handle.fileno(), fcntl.LOCK_UN)
     return False
 
 
+def try_lock_file(file_handle):
+    """
+    Tries to lock the file stream for exclusive access without waiting.
+
+    Parameters
+    ----------
+    file_handle: file stream, required
+        File stream to lock.
+
+    Returns
+    -------
+    bool
+        True if the lock was acquired, False if the file is locked by another process.
+    """
+
+    import fcntl
+
+    try:
+        fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+class LockTimeout(TimeoutError):
+    """
+    Raised when a lock could not be acquired within the timeout.
+    """
+
+
+class LockMetrics:
+    """
+    Sink for the wait and hold durations of the locks taken by this process, aggregated by lock file.
+
+    The metrics of all OpenWithLock instances are recorded in lock_metrics; snapshot returns them
+    as plain dicts that can be stored and combined with those of other workers (see lock_contention_report).
+    """
+
+    def __init__(self):
+        import threading
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        name: str,
+        wait_seconds: float,
+        hold_seconds: float = None,
+        contended: bool = False,
+        timed_out: bool = False,
+    ):
+        """
+        Record an acquisition (hold_seconds is None if the lock was not acquired).
+        """
+        with self._lock:
+            stats = self._stats.setdefault(
+                name,
+                {
+                    "acquisitions": 0,
+                    "contended": 0,
+                    "timeouts": 0,
+                    "wait_seconds": 0.0,
+                    "max_wait_seconds": 0.0,
+                    "hold_seconds": 0.0,
+                    "max_hold_seconds": 0.0,
+                },
+            )
+            stats["wait_seconds"] += wait_seconds
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait_seconds)
+            stats["contended"] += int(contended)
+            if timed_out:
+                stats["timeouts"] += 1
+                return
+            stats["acquisitions"] += 1
+            if hold_seconds is not None:
+                stats["hold_seconds"] += hold_seconds
+                stats["max_hold_seconds"] = max(
+                    stats["max_hold_seconds"], hold_seconds
+                )
+
+    def snapshot(self):
+        """
+        Return a copy of the metrics, keyed by lock file.
+        """
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+lock_metrics = LockMetrics()
+
+
+def lock_contention_report(snapshots: dict):
+    """
+    Combine the lock metrics of several workers into a contention report.
+
+    Parameters
+    ----------
+    snapshots: dict, required
+        LockMetrics.snapshot of each worker, keyed by worker.
+
+    Returns
+    -------
+    dict
+        For each lock file: the number of workers, acquisitions, contended acquisitions and timeouts,
+        the total, mean and maximum wait and hold durations, and the worker that waited longest in total.
+    """
+    report = {}
+    for worker, snapshot in snapshots.items():
+        for name, stats in snapshot.items():
+            entry = report.setdefault(
+                name,
+                {
+                    "workers": 0,
+                    "acquisitions": 0,
+                    "contended": 0,
+                    "timeouts": 0,
+                    "wait_seconds": 0.0,
+                    "max_wait_seconds": 0.0,
+                    "hold_seconds": 0.0,
+                    "max_hold_seconds": 0.0,
+                    "longest_waiting_worker": None,
+                    "_longest_wait": -1.0,
+                },
+            )
+            entry["workers"] += 1
+            for field in [
+                "acquisitions",
+                "contended",
+                "timeouts",
+                "wait_seconds",
+                "hold_seconds",
+            ]:
+                entry[field] += stats[field]
+            for field in ["max_wait_seconds", "max_hold_seconds"]:
+                entry[field] = max(entry[field], stats[field])
+            if stats["wait_seconds"] > entry["_longest_wait"]:
+                entry["_longest_wait"] = stats["wait_seconds"]
+                entry["longest_waiting_worker"] = worker
+
+    for entry in report.values():
+        del entry["_longest_wait"]
+        attempts = entry["acquisitions"] + entry["timeouts"]
+        entry["mean_wait_seconds"] = (
+            entry["wait_seconds"] / attempts if attempts else 0.0
+        )
+        entry["mean_hold_seconds"] = (
+            entry["hold_seconds"] / entry["acquisitions"]
+            if entry["acquisitions"]
+            else 0.0
+        )
+    return report
+
+
 class OpenWithLock:
     """
     Context manager for opening a file that also locks the file for exclusive access.
@@ -84,6 +247,17 @@ class OpenWithLock:
     mode: str, optional, default='r'
         Specifies how to open the file, matching the python open function.
         Options are 'r', 'w', 'a', 'r+', 'w+', 'a+', 'rb', 'wb', 'ab', 'r+b', 'w+b', 'a+b'
+    timeout: float, optional, default=None
+        Seconds to wait for the lock before raising LockTimeout; defaults to OpenWithLock.default_timeout.
+        Without a timeout (or with float("inf"), which overrides the default), the process waits in the
+        kernel until the lock is released; with a timeout, it retries with exponential backoff and jitter.
+        Neither wait is fair: flock does not serve waiters in arrival order, and a polling waiter can
+        lose the lock to one that arrived later. Ordered (first-come, first-served) acquisition is out
+        of scope; lock_metrics records how long waits actually take.
+    max_poll_interval: float, optional, default=0.5
+        Longest wait between retries when a timeout is set.
+
+    The wait and hold durations of every acquisition are recorded in lock_metrics.
 
     Examples
     --------
@@ -93,77 +267,380 @@ class OpenWithLock:
 
     """
 
-    def __init__(self, file_path: str, mode: str = "r"):
+    # timeout used when none is given, e.g., set by a campaign worker from lock_timeout_seconds
+    default_timeout = None
+
+    def __init__(
+        self,
+        file_path: str,
+        mode: str = "r",
+        timeout: float = None,
+        max_poll_interval: float = 0.5,
+    ):
         self._file_path = file_path
         self._mode = mode
+        self._timeout = timeout
+        self._max_poll_interval = max_poll_interval
         self._file_handle = None
+        self._acquired_time = None
+
+    def _wait(self, timeout):
+        import random
+        import time
+
+        start = time.monotonic()
+        poll_interval = 0.001
+        while True:
+            if try_lock_file(self._file_handle):
+                return True
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                return False
+            # jitter keeps waiters from retrying in lockstep
+            time.sleep(min(poll_interval * random.uniform(0.5, 1.5), remaining))
+            poll_interval = min(2 * poll_interval, self._max_poll_interval)
 
     def __enter__(self):
+        import time
+
         # open the file
         self._file_handle = open(self._file_path, self._mode)
 
-        # check to see if the file is already locked
-        if check_file_lock(self._file_handle):
+        start = time.monotonic()
+        contended = not try_lock_file(self._file_handle)
+        if contended:
             logger.debug(
                 f"{self._file_path} in locked by another process; waiting until lock is released."
             )
-
-        # try to lock the file; if the file is already locked, this will wait
-        # until the file is released. I added helper function definitions that
-        # call fcntl, as we might not always want to use a context manager and
-        # to test the function in isolation
-
-        lock_file(self._file_handle)
+            timeout = (
+                self._timeout if self._timeout is not None else self.default_timeout
+            )
+            if timeout is None or timeout == float("inf"):
+                # the kernel wakes the waiter when the lock is released
+                lock_file(self._file_handle)
+            elif not self._wait(timeout):
+                wait_seconds = time.monotonic() - start
+                lock_metrics.record(
+                    self._file_path, wait_seconds, contended=True, timed_out=True
+                )
+                self._file_handle.close()
+                raise LockTimeout(
+                    f"could not lock {self._file_path} within {timeout} seconds"
+                )
+
+        self._acquired_time = time.monotonic()
+        self._wait_seconds = self._acquired_time - start
+        self._contended = contended
 
         # return the opened file stream
         return self._file_handle
 
     def __exit__(self, *args):
+        import time
+
         # unlock the file and close the file stream
         unlock_file(self._file_handle)
         self._file_handle.close()
+        lock_metrics.record(
+            self._file_path,
+            self._wait_seconds,
+            hold_seconds=time.monotonic() - self._acquired_time,
+            contended=self._contended,
+        )
+
+
+@contextmanager
+def lock_with_retries(
+    file_path: str, mode: str = "w", attempts: int = 5, backoff: float = 1.0
+):
+    """
+    Lock a file with OpenWithLock, trying again with exponential backoff (and jitter) if it times out.
+
+    Used for the updates of the campaign database that must not be lost to a single timeout,
+    e.g., marking records as completed or returning them to the queue.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path to the lock file.
+    mode: str, optional, default="w"
+        Mode the file is opened with.
+    attempts: int, optional, default=5
+        Number of attempts before LockTimeout is raised.
+    backoff: float, optional, default=1.0
+        Seconds to wait after the first timeout; doubled after each further timeout.
+    """
+    import random
+    import time
+    from contextlib import ExitStack
+
+    with ExitStack() as stack:
+        for attempt in range(attempts):
+            try:
+                file_handle = stack.enter_context(OpenWithLock(file_path, mode))
+                break
+            except LockTimeout:
+                if attempt == attempts - 1:
+                    raise
+                delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+                logger.warning(
+                    f"could not lock {file_path} (attempt {attempt + 1} of {attempts}); retrying in {delay:.1f} s"
+                )
+                time.sleep(delay)
+        yield file_handle
+
+
+def job_seed(key: str, campaign_seed: int = 0):
+    """
+    Seed of the random number generator of a job, derived from the record key and the campaign seed.
 
+    The seed does not depend on the worker, the order in which jobs are run, or the Python hash seed,
+    so re-running a record reproduces its trajectory.
+
+    Parameters
+    ----------
+    key: str, required
+        Key of the record (or job).
+    campaign_seed: int, optional, default=0
+        Seed of the campaign.
+
+    Returns
+    -------
+    int
+        Non-negative 63-bit integer (so it can be stored as a signed 64-bit attribute).
+    """
+    import hashlib
+
+    digest = hashlib.sha256(f"{campaign_seed}:{key}".encode()).digest()
+    return int.from_bytes(digest[:8], "little") & (2**63 - 1)
+
+
+def current_rss_mb():
+    """
+    Resident set size of the current process in MB, read from /proc (Linux only).
+
+    Returns
+    -------
+    float or None
+        The resident set size, or None if /proc is not available.
+    """
+    import os
+
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+class MemoryMonitor:
+    """
+    Context manager that samples the resident memory of the process in a background thread
+    and records the peak seen while the context is active.
+
+    Unlike resource.getrusage, which reports the peak over the lifetime of the process, this gives
+    the peak of a single job in a long-lived worker, including memory allocated by tblite.
+
+    Parameters
+    ----------
+    interval: float, optional, default=0.5
+        Seconds between samples.
+
+    Examples
+    --------
+    >>> with MemoryMonitor() as monitor:
+    >>>    run_xtb_calc(data_input)
+    >>> print(monitor.peak_mb)
+
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = None
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        import threading
+
+        self._sample()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class NodeSemaphore:
+    """
+    Context manager that limits how many processes on a node can be inside the context at once.
+
+    Each of the n_slots slots is a lock file in a node-local directory; a process enters by taking an
+    exclusive lock on count free slots, and waits (polling) if not enough slots are free. As the locks are
+    held with fcntl, they are released by the kernel if the process dies.
+    Slots are gathered while holding an acquisition lock, so a process that needs several slots is
+    not starved by processes that need one, and two processes never wait on each other's partial sets.
+
+    Parameters
+    ----------
+    directory: str, required
+        Node-local directory for the slot files (e.g., /tmp); must be the same for all processes sharing the limit.
+    n_slots: int, required
+        Maximum number of processes inside the context at once.
+    name: str, optional, default="slot"
+        Prefix of the slot files, so several independent limits can share a directory.
+    poll_interval: float, optional, default=5.0
+        Seconds between attempts when all slots are taken.
+    count: int, optional, default=1
+        Number of slots taken by this process (e.g., the number of cores a job uses); at most n_slots.
+
+    Examples
+    --------
+    >>> with NodeSemaphore("/tmp", 2, name="big_memory"):
+    >>>    run_xtb_calc(data_input)
+
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        n_slots: int,
+        name: str = "slot",
+        poll_interval: float = 5.0,
+        count: int = 1,
+    ):
+        self._directory = directory
+        self.n_slots = n_slots
+        self._name = name
+        self.poll_interval = poll_interval
+        self.count = min(count, n_slots)
+        self._file_handles = []
+        self.wait_time = 0.0
+
+    def __enter__(self):
+        import fcntl
+        import os
+        import time
+
+        os.makedirs(self._directory, exist_ok=True)
+        start = time.time()
+        logged = False
+        # held while waiting for slots, which can take as long as a job, so the default timeout
+        # of the campaign (lock_timeout_seconds) does not apply
+        with OpenWithLock(
+            os.path.join(self._directory, f"{self._name}_acquire.lock"),
+            "w",
+            timeout=float("inf"),
+        ):
+            while True:
+                for i in range(self.n_slots):
+                    if len(self._file_handles) == self.count:
+                        break
+                    file_handle = open(
+                        os.path.join(self._directory, f"{self._name}_{i}.lock"), "w"
+                    )
+                    try:
+                        # fails for slots already held by this process, as each open is a separate lock
+                        fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        file_handle.close()
+                        continue
+                    self._file_handles.append(file_handle)
+
+                if len(self._file_handles) == self.count:
+                    self.wait_time = time.time() - start
+                    return self
+
+                if not logged:
+                    logger.debug(
+                        f"{self.count} of {self.n_slots} {self._name} slots needed; waiting for free slots."
+                    )
+                    logged = True
+                time.sleep(self.poll_interval)
+
+    def __exit__(self, *args):
+        for file_handle in self._file_handles:
+            unlock_file(file_handle)
+            file_handle.close()
+        self._file_handles = []
 
-from openff.units import unit
 
 # Define a chemical context for unit transformations
 # This allows conversions between energy units like hartree and kJ/mol
-__all__ = ["chem_context"]
-chem_context = unit.Context("chem")
-
-# Add transformations to handle conversions between energy units per substance
-# (mole) and other forms
-chem_context.add_transformation(
-    "[force] * [length]",
-    "[force] * [length]/[substance]",
-    lambda unit, x: x * unit.avogadro_constant,
-)
-chem_context.add_transformation(
-    "[force] * [length]/[substance]",
-    "[force] * [length]",
-    lambda unit, x: x / unit.avogadro_constant,
-)
-chem_context.add_transformation(
-    "[force] * [length]/[length]",
-    "[force] * [length]/[substance]/[length]",
-    lambda unit, x: x * unit.avogadro_constant,
-)
-chem_context.add_transformation(
-    "[force] * [length]/[substance]/[length]",
-    "[force] * [length]/[length]",
-    lambda unit, x: x / unit.avogadro_constant,
-)
-
-chem_context.add_transformation(
-    "[force] * [length]/[length]/[length]",
-    "[force] * [length]/[substance]/[length]/[length]",
-    lambda unit, x: x * unit.avogadro_constant,
-)
-chem_context.add_transformation(
-    "[force] * [length]/[substance]/[length]/[length]",
-    "[force] * [length]/[length]/[length]",
-    lambda unit, x: x / unit.avogadro_constant,
-)
-
-# Register the custom chemical context for use with the unit system
-unit.add_context(chem_context)
+# The context is built on first use, since building the openff.units registry is slow
+# and most tools that import this module (e.g., for OpenWithLock) never convert units
+__all__ = ["chem_context", "get_chem_context"]
+_chem_context = None
+
+
+def get_chem_context():
+    """
+    Return the "chem" unit context, building it and registering it with openff.units on first use.
+    """
+    global _chem_context
+    if _chem_context is not None:
+        return _chem_context
+
+    from openff.units import unit
+
+    chem_context = unit.Context("chem")
+
+    # Add transformations to handle conversions between energy units per substance
+    # (mole) and other forms
+    chem_context.add_transformation(
+        "[force] * [length]",
+        "[force] * [length]/[substance]",
+        lambda unit, x: x * unit.avogadro_constant,
+    )
+    chem_context.add_transformation(
+        "[force] * [length]/[substance]",
+        "[force] * [length]",
+        lambda unit, x: x / unit.avogadro_constant,
+    )
+    chem_context.add_transformation(
+        "[force] * [length]/[length]",
+        "[force] * [length]/[substance]/[length]",
+        lambda unit, x: x * unit.avogadro_constant,
+    )
+    chem_context.add_transformation(
+        "[force] * [length]/[substance]/[length]",
+        "[force] * [length]/[length]",
+        lambda unit, x: x / unit.avogadro_constant,
+    )
+
+    chem_context.add_transformation(
+        "[force] * [length]/[length]/[length]",
+        "[force] * [length]/[substance]/[length]/[length]",
+        lambda unit, x: x * unit.avogadro_constant,
+    )
+    chem_context.add_transformation(
+        "[force] * [length]/[substance]/[length]/[length]",
+        "[force] * [length]/[length]/[length]",
+        lambda unit, x: x / unit.avogadro_constant,
+    )
+
+    # Register the custom chemical context for use with the unit system
+    unit.add_context(chem_context)
+    _chem_context = chem_context
+    return _chem_context
+
+
+def __getattr__(name):
+    # chem_context used to be built at import time; "from utils import chem_context" still works
+    if name == "chem_context":
+        return get_chem_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
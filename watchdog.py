@@ -0,0 +1,97 @@
+"""
+Per-job watchdog that aborts stragglers.
+
+A few records get stuck in very slow SCF convergence or pathological MD and would tie up a core
+for hours. With straggler_timeout_factor set, each job is given a time limit of that multiple of
+its predicted walltime (from the calibration run of the record when budget-driven sampling is used,
+otherwise from the cost model, i.e., the observed per-step cost of completed jobs or the prior from
+the atom count), but at least straggler_min_seconds. A job over its limit is aborted with JobTimeout;
+the worker then defers it (it is only claimed again once no other records are left, and is rerun
+with the straggler_fallback settings) or, once it has timed out max_job_timeouts times, marks it "timed_out".
+
+The limit is enforced with a SIGALRM timer, so the job is aborted when control returns to Python
+between calculator calls; a single SCF is bounded by its iteration limit.
+"""
+
+import signal
+import threading
+from time import time
+
+from loguru import logger
+
+
+class JobTimeout(Exception):
+    """
+    Raised when a job exceeds its time limit.
+    """
+
+    def __init__(self, name: str, limit_seconds: float, elapsed_seconds: float):
+        super().__init__(name, limit_seconds, elapsed_seconds)
+        self.name = name
+        self.limit_seconds = limit_seconds
+        self.elapsed_seconds = elapsed_seconds
+
+    def __str__(self):
+        return (
+            f"{self.name} exceeded its time limit of {self.limit_seconds:.1f} s "
+            f"({self.elapsed_seconds:.1f} s elapsed)"
+        )
+
+
+def time_limit_seconds(predicted_seconds: float, factor: float, min_seconds: float = 60.0):
+    """
+    Time limit of a job: factor times its predicted walltime, but at least min_seconds.
+    """
+    return max(min_seconds, factor * predicted_seconds)
+
+
+class Watchdog:
+    """
+    Context manager that raises JobTimeout in the main thread once limit_seconds have elapsed.
+
+    If limit_seconds is None, or the context is not entered in the main thread (signals can only be
+    handled there), no limit is applied.
+
+    Parameters
+    ----------
+    name: str, required
+        Name of the job, used in the JobTimeout.
+    limit_seconds: float, optional, default=None
+        Seconds after which the job is aborted.
+
+    Examples
+    --------
+    >>> with Watchdog(data_input.name, 600.0):
+    >>>    run_xtb_calc(data_input)
+    """
+
+    def __init__(self, name: str, limit_seconds: float = None):
+        self.name = name
+        self.limit_seconds = limit_seconds
+        self._start = None
+        self._previous_handler = None
+        self._armed = False
+
+    def _expire(self, signum, frame):
+        raise JobTimeout(self.name, self.limit_seconds, time() - self._start)
+
+    def __enter__(self):
+        self._start = time()
+        if self.limit_seconds is None:
+            return self
+        if threading.current_thread() is not threading.main_thread():
+            logger.warning(
+                f"the time limit of {self.name} is not applied outside the main thread"
+            )
+            return self
+
+        self._previous_handler = signal.signal(signal.SIGALRM, self._expire)
+        signal.setitimer(signal.ITIMER_REAL, self.limit_seconds)
+        self._armed = True
+        return self
+
+    def __exit__(self, *args):
+        if self._armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler)
+            self._armed = False
@@ -0,0 +1,196 @@
+import hashlib
+import pickle
+import sqlite3
+import time
+
+import numpy as np
+from loguru import logger
+
+
+def make_cache_key(
+    atomic_numbers: np.ndarray,
+    positions: np.ndarray,
+    charge: float,
+    multiplicity: float,
+    method: str,
+    accuracy: float,
+    decimals: int = 6,
+):
+    """
+    Generate a content-addressed key for an xtb single point calculation.
+
+    Parameters
+    ----------
+    atomic_numbers: np.ndarray, required
+        Atomic numbers of the molecule.
+    positions: np.ndarray, required
+        Positions of the atoms in angstrom.
+    charge: float, required
+        Total charge of the molecule.
+    multiplicity: float, required
+        Spin multiplicity of the molecule; None if not set.
+    method: str, required
+        Name of the xtb method, e.g., "GFN2-xTB".
+    accuracy: float, required
+        Numerical accuracy used by tblite.
+    decimals: int, optional, default=6
+        Number of decimals positions are rounded to before hashing.
+
+    Returns
+    -------
+    str
+        sha256 hex digest of the inputs.
+    """
+    h = hashlib.sha256()
+    h.update(np.asarray(atomic_numbers, dtype=np.int64).reshape(-1).tobytes())
+    # add 0.0 to map -0.0 to 0.0 so that rounding does not change the hash
+    rounded = np.round(np.asarray(positions, dtype=np.float64), decimals) + 0.0
+    h.update(rounded.reshape(-1).tobytes())
+    h.update(f"{charge}|{multiplicity}|{method}|{accuracy}|{decimals}".encode())
+    return h.hexdigest()
+
+
+class XTBCache:
+    """
+    Persistent, on-disk cache of xtb single point results.
+
+    Entries are stored in an sqlite database and are evicted in least recently used order
+    once the total size of the stored entries exceeds max_size_bytes.
+    The database can be shared between processes; sqlite handles the locking.
+
+    Parameters
+    ----------
+    file_path: str, required
+        Path to the sqlite database used to store the cache.
+    max_size_bytes: int, optional, default=1_000_000_000
+        Maximum total size of the cached entries; least recently used entries are evicted beyond this.
+    decimals: int, optional, default=6
+        Number of decimals positions (in angstrom) are rounded to when generating the key.
+
+    Examples
+    --------
+    >>> cache = XTBCache("xtb_cache.db")
+    >>> properties = get_xtb_properties(mol, cache=cache)
+    >>> cache.log_stats()
+
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        max_size_bytes: int = 1_000_000_000,
+        decimals: int = 6,
+    ):
+        self._file_path = file_path
+        self.max_size_bytes = max_size_bytes
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._connection = sqlite3.connect(file_path, timeout=60.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str):
+        """
+        Return the cached dictionary of properties for the key, or None if not present.
+        """
+        row = self._connection.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self._connection:
+            self._connection.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return pickle.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        """
+        Store a dictionary of properties under the key, evicting old entries if needed.
+        """
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+        self._evict()
+
+    def _evict(self):
+        total_size = self.size_bytes()
+        if total_size <= self.max_size_bytes:
+            return
+
+        with self._connection:
+            rows = self._connection.execute(
+                "SELECT key, size FROM entries ORDER BY last_access ASC"
+            ).fetchall()
+            to_delete = []
+            for key, size in rows:
+                if total_size <= self.max_size_bytes:
+                    break
+                to_delete.append((key,))
+                total_size -= size
+            self._connection.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def size_bytes(self):
+        """
+        Total size of the stored entries in bytes.
+        """
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        """
+        Return the hit/miss statistics of this cache instance.
+
+        Returns
+        -------
+        dict
+            Dictionary with the number of hits, misses, evictions, the hit rate, the number of entries and
+            total size of the entries in the store.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "entries": len(self),
+            "size_bytes": self.size_bytes(),
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"xtb cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.2%}), {stats['evictions']} evictions, "
+            f"{stats['entries']} entries, {stats['size_bytes'] / 1e6:.1f} MB"
+        )
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
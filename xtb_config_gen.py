@@ -1,11 +1,17 @@
+from __future__ import annotations
+
 from loguru import logger
 import numpy as np
-from typing import List
-import h5py
+from typing import TYPE_CHECKING, List
 from dataclasses import dataclass
-from openff.units import unit
 from utils import OpenWithLock
 
+# openff.units (whose unit registry is slow to build) and ase are imported where they are used,
+# so tools that only read the campaign database start quickly
+if TYPE_CHECKING:
+    from ase import Atoms
+    from openff.units import unit
+
 # from nist
 ev_to_joules = 1.602176634e-19
 
@@ -41,6 +47,11 @@ class DataPoint:
     partial_charges: unit.Quantity
     dipole_moment: unit.Quantity
     forces: unit.Quantity
+    # settings of the calculators used (see CalculatorFactory.settings); None for results of older versions
+    calculator_settings: dict = None
+    # set if the MD was stopped early by a check (see md_checks.py); the record then holds fewer configurations
+    md_abort_reason: str = None
+    md_abort_step: int = None
 
 
 def load_config(file_handle, key: str):
@@ -52,6 +63,8 @@ def load_config(file_handle, key: str):
     key: str, required
         The key to load from the HDF5 file.
     """
+    from openff.units import unit
+
     data_raw = file_handle[key]
 
     n_configs = data_raw["n_configs"][()]
@@ -74,7 +87,43 @@ def load_config(file_handle, key: str):
     )
 
 
-from ase import Atoms
+def select_conformer(data_input: DataPointFromHDF5, index: int, name: str = None):
+    """
+    Return a copy of a record holding only one of its starting conformers.
+
+    parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        Record with one or more conformers.
+    index: int, required
+        Index of the conformer to select.
+    name: str, optional, default=None
+        Name of the returned record; defaults to the name of data_input.
+    """
+    from dataclasses import replace
+    from openff.units import unit
+
+    def select(values):
+        values = np.asarray(values) if not isinstance(values, unit.Quantity) else values
+        return values[index : index + 1] if values.shape[0] > 1 else values
+
+    return replace(
+        data_input,
+        name=data_input.name if name is None else name,
+        n_configs=1,
+        geometry=data_input.geometry[index : index + 1],
+        spin_multiplicity=select(data_input.spin_multiplicity),
+        total_charge=select(data_input.total_charge),
+    )
+
+
+def _check_single_conformer(data_input: DataPointFromHDF5):
+    n_configs = data_input.geometry.shape[0]
+    if n_configs > 1:
+        raise ValueError(
+            f"{data_input.name} has {n_configs} starting conformers; select one with select_conformer "
+            "(or set fan_out_conformers in the campaign to run each as a separate job)"
+        )
 
 
 @dataclass
@@ -86,16 +135,165 @@ class XTBProperties:
     dipole_moment: unit.Quantity
 
 
-def get_xtb_properties(mol: Atoms):
+def get_xtb_properties(mol: Atoms, cache=None, backend=None):
+    """
+    Evaluate the xtb properties of the molecule using the attached calculator.
 
-    geometry = mol.get_positions() * unit("angstrom")
-    potential_energy = mol.get_potential_energy() * ev_to_joules * unit("joule")
-    forces = mol.get_forces() * ev_to_joules * unit("joule/angstrom")
-    partial_charges = mol.get_charges() * unit("e")
-    dipole_moment = mol.get_dipole_moment() * unit("e*angstrom")
+    parameters
+    ----------
+    mol: Atoms, required
+        Molecule with a TBLite calculator attached (not needed if backend is provided).
+    cache: XTBCache, optional, default=None
+        If provided, results are looked up in (and stored to) this cache.
+        The key is generated from the atomic numbers, positions and the charge, multiplicity,
+        method and accuracy of the attached calculator (or backend).
+    backend: XTBBackend, optional, default=None
+        If provided, the properties are evaluated by the backend (see backends.py) in a single call,
+        rather than through the calculator attached to mol.
+    """
+    from openff.units import unit
+
+    parameters = backend.parameters if backend is not None else mol.calc.parameters
+
+    key = None
+    if cache is not None:
+        from xtb_cache import make_cache_key
+
+        key = make_cache_key(
+            atomic_numbers=mol.get_atomic_numbers(),
+            positions=mol.get_positions(),
+            charge=parameters.get("charge"),
+            multiplicity=parameters.get("multiplicity"),
+            method=parameters.get("method"),
+            accuracy=parameters.get("accuracy"),
+            decimals=cache.decimals,
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            return XTBProperties(
+                cached["geometry"] * unit("angstrom"),
+                cached["potential_energy"] * unit("joule"),
+                cached["forces"] * unit("joule/angstrom"),
+                cached["partial_charges"] * unit("e"),
+                cached["dipole_moment"] * unit("e*angstrom"),
+            )
+
+    geometry = mol.get_positions()
+    if backend is not None:
+        result = backend.compute(geometry)
+        potential_energy = result.energy * ev_to_joules
+        forces = result.forces * ev_to_joules
+        partial_charges = result.charges
+        dipole_moment = result.dipole
+    else:
+        potential_energy = mol.get_potential_energy() * ev_to_joules
+        forces = mol.get_forces() * ev_to_joules
+        partial_charges = mol.get_charges()
+        dipole_moment = mol.get_dipole_moment()
+
+    if cache is not None:
+        cache.put(
+            key,
+            {
+                "geometry": geometry,
+                "potential_energy": potential_energy,
+                "forces": forces,
+                "partial_charges": partial_charges,
+                "dipole_moment": dipole_moment,
+            },
+        )
 
     return XTBProperties(
-        geometry, potential_energy, forces, partial_charges, dipole_moment
+        geometry * unit("angstrom"),
+        potential_energy * unit("joule"),
+        forces * unit("joule/angstrom"),
+        partial_charges * unit("e"),
+        dipole_moment * unit("e*angstrom"),
+    )
+
+
+class ConfigurationArrays:
+    """
+    Preallocated arrays that the properties of each configuration are written into as they are computed.
+
+    Magnitudes are stored in the units returned by get_xtb_properties (angstrom, joule, e);
+    to_datapoint converts them to the units of the output record.
+
+    parameters
+    ----------
+    n_configs: int, required
+        Number of configurations.
+    n_atoms: int, required
+        Number of atoms.
+    """
+
+    def __init__(self, n_configs: int, n_atoms: int):
+        self.n_configs = n_configs
+        self.geometry = np.zeros((n_configs, n_atoms, 3))
+        self.energy = np.zeros((n_configs, 1))
+        self.forces = np.zeros((n_configs, n_atoms, 3))
+        self.partial_charges = np.zeros((n_configs, n_atoms))
+        self.dipole_moment = np.zeros((n_configs, 3))
+
+    def set(self, index: int, data_point: XTBProperties):
+        self.geometry[index] = data_point.geometry.m_as("angstrom")
+        self.energy[index] = data_point.potential_energy.m_as("joule")
+        self.forces[index] = data_point.forces.m_as("joule/angstrom")
+        self.partial_charges[index] = data_point.partial_charges.m_as("e")
+        self.dipole_moment[index] = data_point.dipole_moment.m_as("e*angstrom")
+
+    def truncate(self, n_configs: int):
+        """
+        Keep only the first n_configs configurations.
+        """
+        self.n_configs = n_configs
+        self.geometry = self.geometry[:n_configs]
+        self.energy = self.energy[:n_configs]
+        self.forces = self.forces[:n_configs]
+        self.partial_charges = self.partial_charges[:n_configs]
+        self.dipole_moment = self.dipole_moment[:n_configs]
+
+    def to_datapoint(self, data_input: DataPointFromHDF5):
+        from openff.units import unit
+        from utils import get_chem_context
+
+        get_chem_context()  # registers the "chem" context used below
+
+        total_charge = (
+            np.vstack([data_input.total_charge.m] * self.n_configs)
+            * data_input.total_charge.u
+        )
+        spin_multiplicity = np.vstack(
+            [data_input.spin_multiplicity] * self.n_configs
+        )
+
+        return DataPoint(
+            name=data_input.name,
+            n_configs=self.n_configs,
+            stoichiometry=data_input.stoichiometry,
+            atomic_numbers=data_input.atomic_numbers,
+            geometry=(self.geometry * unit("angstrom")).to("nanometer"),
+            energy=(self.energy * unit("joule")).to("kilojoule_per_mole", "chem"),
+            partial_charges=self.partial_charges * unit("e"),
+            dipole_moment=(self.dipole_moment * unit("e*angstrom")).to(
+                "e*nanometer"
+            ),
+            forces=(self.forces * unit("joule/angstrom")).to(
+                "kilojoule_per_mole/nanometer", "chem"
+            ),
+            spin_multiplicity=spin_multiplicity,
+            total_charge=total_charge.to("e", "chem"),
+        )
+
+
+def _md_settings(temperature, friction, timestep):
+    # the defaults of run_xtb_calc and measure_step_cost, created on use rather than at import
+    from openff.units import unit
+
+    return (
+        unit.Quantity(400.0, "K") if temperature is None else temperature,
+        unit.Quantity(0.01, "1/fs") if friction is None else friction,
+        unit.Quantity(1.0, "fs") if timestep is None else timestep,
     )
 
 
@@ -103,45 +301,108 @@ def run_xtb_calc(
     data_input: DataPointFromHDF5,
     number_of_steps: int = 100,
     number_of_repeats: int = 10,
-    temperature: unit.Quantity = unit.Quantity(400.0, "K"),
-    friction: unit.Quantity = unit.Quantity(0.01, "1/fs"),
-    timestep: unit.Quantity = unit.Quantity(1.0, "fs"),
+    temperature: unit.Quantity = None,
+    friction: unit.Quantity = None,
+    timestep: unit.Quantity = None,
     output_trajectory: bool = False,
     output_log: bool = False,
+    cache=None,
+    method: str = "GFN2-xTB",
+    md_accuracy: float = 2.0,
+    property_accuracy: float = 1.0,
+    integrator: str = "ase",
+    log_interval: int = 1,
+    backend: str = "ase",
+    calculator_factory=None,
+    seed: int = None,
+    md_check_interval: int = None,
+    md_check_options: dict = None,
 ):
+    """
+    Run MD with gfn2-xtb and evaluate the properties of snapshots at higher accuracy.
+
+    parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        The configuration to start from.
+    number_of_steps: int, optional, default=100
+        Number of MD steps between snapshots.
+    number_of_repeats: int, optional, default=10
+        Number of snapshots to generate.
+    temperature: unit.Quantity, optional, default=400 K
+        Temperature of the Langevin thermostat.
+    friction: unit.Quantity, optional, default=0.01 1/fs
+        Friction coefficient of the Langevin thermostat.
+    timestep: unit.Quantity, optional, default=1 fs
+        MD timestep.
+    output_trajectory: bool, optional, default=False
+        If True, write the trajectory to {name}.traj and {name}.xyz.
+    output_log: bool, optional, default=False
+        If True, write the MD log to {name}_md.log.
+    cache: XTBCache, optional, default=None
+        Cache used for the accuracy = 1 single point calculations; hit/miss statistics are logged at the end.
+    method: str, optional, default="GFN2-xTB"
+        xtb method used by tblite.
+    md_accuracy: float, optional, default=2.0
+        tblite accuracy used to propagate the MD.
+    property_accuracy: float, optional, default=1.0
+        tblite accuracy used to evaluate the stored properties.
+    integrator: str, optional, default="ase"
+        "ase" uses ase.md.Langevin; "baoab" uses the lean BAOABLangevin integrator (see integrator.py),
+        which avoids the per-step overhead of ase.md.Langevin; it calls the tblite API directly only
+        with backend "tblite".
+    log_interval: int, optional, default=1
+        Number of steps between log/trajectory frames when using the "baoab" integrator.
+    backend: str, optional, default="ase"
+        "ase" evaluates energetics through the tblite ASE calculator; "tblite" drives the tblite API
+        directly (see backends.py), avoiding the ASE calculator bookkeeping.
+    calculator_factory: CalculatorFactory, optional, default=None
+        Factory used to create the calculators (see backends.py); defaults to the factory of this process
+        for backend and method, so calculators are reused between calls.
+        The settings used (charge, multiplicity, unpaired electrons, method, accuracies) are stored
+        in the calculator_settings of the returned DataPoint.
+    seed: int, optional, default=None
+        Seed of the random numbers of the Langevin thermostat. With a seed, a run is reproduced
+        bit-for-bit under the same thread settings (the calculators start from the default SCF guess
+        in every run, whichever record they were used for before); if None, the random numbers are not seeded.
+    md_check_interval: int, optional, default=None
+        If set, the MD is checked for fragmentation, overlapping atoms, large forces and temperature spikes
+        every md_check_interval steps (see md_checks.py). When a check fails, the MD stops and the record
+        is truncated to the snapshots taken before; the reason and step are stored in md_abort_reason
+        and md_abort_step of the returned DataPoint.
+    md_check_options: dict, optional, default=None
+        Keyword arguments of md_checks.MDCheck (e.g., bond_scale, max_force, max_temperature_factor).
+
+    Returns
+    -------
+    DataPoint
+        number_of_repeats + 1 configurations: the starting geometry followed by each snapshot (fewer
+        if an MD check stopped the run). Versions before the preallocated arrays of ConfigurationArrays
+        also reported n_configs = number_of_repeats + 1, but their arrays held only the first
+        number_of_repeats configurations, dropping the last snapshot.
+    """
+    if integrator not in ["ase", "baoab"]:
+        raise ValueError(f"integrator {integrator} not supported; options are ['ase', 'baoab']")
+
+    from backends import backend_names, get_calculator_factory
+
+    if backend not in backend_names:
+        raise ValueError(f"backend {backend} not supported; options are {backend_names}")
+
     from ase import Atoms
-    from tblite.ase import TBLite
     from ase.optimize import BFGS
     from ase.md import Langevin
     import ase.units as ase_units
     from ase.io.trajectory import Trajectory
 
-    datapoints = []
+    temperature, friction, timestep = _md_settings(temperature, friction, timestep)
 
     # For embedding in modelforge, total charge is initialized as a vector/tensor
     # but this expects a scalar, so we just need to reshape it and drop the units
     total_charge = float(data_input.total_charge.magnitude.reshape(-1)[0])
-    spin_multiplicity = float(data_input.spin_multiplicity.reshape(-1)[0])
+    spin_multiplicity = int(round(float(data_input.spin_multiplicity.reshape(-1)[0])))
 
-    # Create two calculators, using the GFN2-xTB method
-    # The first will have a higher accuracy; the second less as it will be cheaper for md
-    # We will only store properties that come from accuracy = 1
-    calc_a1 = TBLite(
-        method="GFN2-xTB",
-        max_iterations=250,
-        charge=total_charge,
-        accuracy=1,
-        verbosity=0,
-        # multiplicity=spin_multiplicity,
-    )
-    calc_a2 = TBLite(
-        method="GFN2-xTB",
-        max_iterations=250,
-        charge=total_charge,
-        accuracy=2,
-        verbosity=0,
-        # multiplicity=spin_multiplicity,
-    )
+    _check_single_conformer(data_input)
     n_atoms = data_input.geometry.shape[1]
 
     # Create the Atoms object to house the molecule
@@ -151,10 +412,40 @@ def run_xtb_calc(
         positions=data_input.geometry.to("angstrom").magnitude.reshape(n_atoms, 3),
     )
 
+    # Two calculators with the charge and multiplicity of the record, using the GFN2-xTB method by default
+    # The first will have a higher accuracy; the second less as it will be cheaper for md
+    # We will only store properties that come from accuracy = 1 (property_accuracy)
+    if calculator_factory is None:
+        calculator_factory = get_calculator_factory(backend, method)
+    property_backend = calculator_factory.create(
+        mol.get_atomic_numbers(),
+        mol.get_positions(),
+        total_charge,
+        spin_multiplicity,
+        property_accuracy,
+    )
+    md_backend = calculator_factory.create(
+        mol.get_atomic_numbers(),
+        mol.get_positions(),
+        total_charge,
+        spin_multiplicity,
+        md_accuracy,
+    )
+    # reused calculators would otherwise start from the wavefunction of their previous run
+    property_backend.reset_guess()
+    md_backend.reset_guess()
+    calc_a1 = property_backend.ase_calculator()
+    calc_a2 = md_backend.ase_calculator()
+    rng = np.random.default_rng(seed)
+
     mol.calc = calc_a1
 
-    data_point = get_xtb_properties(mol)
-    datapoints.append(data_point)
+    # properties are written into preallocated arrays as they are computed,
+    # rather than keeping every XTBProperties instance and stacking them at the end
+    configurations = ConfigurationArrays(number_of_repeats + 1, n_atoms)
+
+    data_point = get_xtb_properties(mol, cache=cache, backend=property_backend)
+    configurations.set(0, data_point)
 
     # Now we will set up an MD simulation using the Langevin integrator
     # note, since we are not using shake constraints, as is the default if running MD via the xtb software directly
@@ -166,94 +457,250 @@ def run_xtb_calc(
     if output_trajectory:
         traj = Trajectory(f"{data_input.name}.traj", "w", mol)
 
-    if output_log and output_trajectory:
+    from md_checks import MDCheck, UnphysicalMD
+
+    md_check = None
+    if md_check_interval is not None:
+        md_check = MDCheck(
+            mol.get_atomic_numbers(),
+            mol.get_positions(),
+            temperature.to("K").m,
+            **(md_check_options or {}),
+        )
+
+    if integrator == "baoab":
+        from integrator import BAOABLangevin, MDLogger
+
+        dyn = BAOABLangevin(
+            masses=mol.get_masses(),
+            positions=mol.get_positions(),
+            force_function=md_backend.energy_and_forces,
+            timestep=timestep.to("fs").m,
+            temperature=temperature.to("K").m,
+            friction=friction.to("1/fs").m,
+            rng=rng,
+        )
+        md_logger = MDLogger(f"{data_input.name}_md.log") if output_log else None
+
+        def callback(dyn):
+            # checks run on the positions and forces the integrator already holds
+            if md_check is not None and dyn.nsteps % md_check_interval == 0:
+                md_check(dyn.nsteps, dyn.positions, dyn.forces, dyn.temperature())
+            if dyn.nsteps % log_interval != 0:
+                return
+            if md_logger is not None:
+                md_logger(dyn)
+            if output_trajectory:
+                traj.write(
+                    Atoms(numbers=mol.get_atomic_numbers(), positions=dyn.positions)
+                )
+
+        md_callback = (
+            callback if (output_log or output_trajectory or md_check is not None) else None
+        )
+        callback_interval = log_interval
+        if md_check is not None:
+            from math import gcd
+
+            callback_interval = gcd(log_interval, md_check_interval)
+
+    if integrator == "ase" and output_log and output_trajectory:
         dyn = Langevin(
             mol,
             timestep=timestep.to("fs").m * ase_units.fs,
             temperature_K=temperature.to("K").m,  # temperature in K
             friction=friction.to("1/fs").m / ase_units.fs,
+            rng=rng,
             # trajectory=f"{data_input.name}.traj",
             trajectory=traj,
             logfile=f"{data_input.name}_md.log",
         )
-    if output_log and not output_trajectory:
+    if integrator == "ase" and output_log and not output_trajectory:
         dyn = Langevin(
             mol,
             timestep=timestep.to("fs").m * ase_units.fs,
             temperature_K=temperature.to("K").m,  # temperature in K
             friction=friction.to("1/fs").m / ase_units.fs,
+            rng=rng,
             logfile=f"{data_input.name}_md.log",
         )
-    if not output_log and output_trajectory:
+    if integrator == "ase" and not output_log and output_trajectory:
         dyn = Langevin(
             mol,
             timestep=timestep.to("fs").m * ase_units.fs,
             temperature_K=temperature.to("K").m,  # temperature in K
             friction=friction.to("1/fs").m / ase_units.fs,
+            rng=rng,
             trajectory=traj,
         )
-    if not output_log and not output_trajectory:
+    if integrator == "ase" and not output_log and not output_trajectory:
         dyn = Langevin(
             mol,
             timestep=timestep.to("fs").m * ase_units.fs,
             temperature_K=temperature.to("K").m,  # temperature in K
             friction=friction.to("1/fs").m / ase_units.fs,
+            rng=rng,
         )
 
+    if integrator == "ase" and md_check is not None:
+        # forces are cached by the calculator, so the check does not evaluate them again
+        dyn.attach(
+            lambda: md_check(
+                dyn.nsteps, mol.get_positions(), mol.get_forces(), mol.get_temperature()
+            ),
+            interval=md_check_interval,
+        )
+
+    md_abort = None
     for i in range(0, number_of_repeats):
-        dyn.run(number_of_steps)
+        try:
+            if integrator == "baoab":
+                dyn.run(number_of_steps, callback=md_callback, interval=callback_interval)
+                positions = dyn.positions
+            else:
+                dyn.run(number_of_steps)
+                positions = mol.get_positions()
+        except UnphysicalMD as e:
+            # the snapshot of this repeat would be discarded, so it is not evaluated
+            md_abort = e
+            configurations.truncate(i + 1)
+            logger.warning(
+                f"{data_input.name}: MD stopped, {e}; keeping {i + 1} configurations"
+            )
+            break
 
         # use the last snapshot to get the properties
         # run with accuracy = 1
         mol_for_prop = Atoms(
             numbers=mol.get_atomic_numbers(),
-            positions=mol.get_positions(),
+            positions=positions,
         )
         # We will only store properties that come from accuracy = 1
         mol_for_prop.calc = calc_a1
-        data_point = get_xtb_properties(mol_for_prop)
-        datapoints.append(data_point)
+        data_point = get_xtb_properties(
+            mol_for_prop, cache=cache, backend=property_backend
+        )
+        configurations.set(i + 1, data_point)
+        del data_point, mol_for_prop
         logger.info(f"Completed repeat {i} of {number_of_repeats}")
 
-    # process all the invididual data points into a single record
-    geometry = datapoints[0].geometry.reshape(1, n_atoms, 3)
-    energy = datapoints[0].potential_energy.reshape(1, 1)
-    forces = datapoints[0].forces.reshape(1, n_atoms, 3)
-    partial_charges = datapoints[0].partial_charges.reshape(1, n_atoms)
-    dipole_moment = datapoints[0].dipole_moment.reshape(1, 3)
-    total_charge = data_input.total_charge
-    spin_multiplicity = data_input.spin_multiplicity
-    for i in range(1, number_of_repeats):
-        geometry = np.vstack((geometry, datapoints[i].geometry.reshape(1, n_atoms, 3)))
-        energy = np.vstack((energy, datapoints[i].potential_energy.reshape(1, 1)))
-        forces = np.vstack((forces, datapoints[i].forces.reshape(1, n_atoms, 3)))
-        partial_charges = np.vstack(
-            (partial_charges, datapoints[i].partial_charges.reshape(1, n_atoms))
-        )
-        dipole_moment = np.vstack(
-            (dipole_moment, datapoints[i].dipole_moment.reshape(1, 3))
-        )
-        total_charge = np.vstack((total_charge, data_input.total_charge))
-        spin_multiplicity = np.vstack((spin_multiplicity, data_input.spin_multiplicity))
-
-    from utils import chem_context
-
-    data_output = DataPoint(
-        name=data_input.name,
-        n_configs=len(datapoints),
-        stoichiometry=data_input.stoichiometry,
-        atomic_numbers=data_input.atomic_numbers,
-        geometry=geometry.to("nanometer"),
-        energy=energy.to("kilojoule_per_mole", "chem"),
-        partial_charges=partial_charges.to("e"),
-        dipole_moment=dipole_moment.to("e*nanometer"),
-        forces=forces.to("kilojoule_per_mole/nanometer", "chem"),
-        spin_multiplicity=spin_multiplicity,
-        total_charge=total_charge.to("e", "chem"),
+    if cache is not None:
+        cache.log_stats()
+
+    if integrator == "baoab" and md_logger is not None:
+        md_logger.close()
+    if integrator == "baoab" and output_trajectory:
+        traj.close()
+
+    data_output = configurations.to_datapoint(data_input)
+    if md_abort is not None:
+        data_output.md_abort_reason = md_abort.reason
+        data_output.md_abort_step = md_abort.step
+    settings = calculator_factory.settings(
+        mol.get_atomic_numbers(), total_charge, spin_multiplicity, property_accuracy
     )
+    settings["property_accuracy"] = settings.pop("accuracy")
+    settings["md_accuracy"] = float(md_accuracy)
+    data_output.calculator_settings = settings
+
     if output_trajectory:
-        from ase.io import write, read
+        from ase.io import iread, write
 
-        traj = read(f"{data_input.name}.traj", ":")
-        write(f"{data_input.name}.xyz", traj, format="xyz")
+        # convert frame by frame, rather than reading the whole trajectory into memory
+        with open(f"{data_input.name}.xyz", "w") as xyz_file:
+            for frame in iread(f"{data_input.name}.traj", ":"):
+                write(xyz_file, frame, format="xyz")
     return data_output
+
+
+def measure_step_cost(
+    data_input: DataPointFromHDF5,
+    number_of_steps: int = 5,
+    temperature: unit.Quantity = None,
+    friction: unit.Quantity = None,
+    timestep: unit.Quantity = None,
+    cache=None,
+    method: str = "GFN2-xTB",
+    md_accuracy: float = 2.0,
+    property_accuracy: float = 1.0,
+    backend: str = "ase",
+    calculator_factory=None,
+):
+    """
+    Time a short MD run and a single point calculation to calibrate the cost of a record.
+
+    The single point is evaluated on the starting geometry; if a cache is provided,
+    the result is stored so the first point of the subsequent run_xtb_calc is not recomputed.
+
+    parameters
+    ----------
+    data_input: DataPointFromHDF5, required
+        The configuration to calibrate.
+    number_of_steps: int, optional, default=5
+        Number of MD steps to time.
+    backend: str, optional, default="ase"
+        Backend to calibrate, "ase" or "tblite" (see run_xtb_calc).
+    calculator_factory: CalculatorFactory, optional, default=None
+        Factory used to create the calculators (see run_xtb_calc); the calculators are then
+        reused by the subsequent run_xtb_calc of the record.
+
+    Returns
+    -------
+    tuple of float
+        (seconds per MD step, seconds per single point calculation)
+    """
+    from time import perf_counter
+    from ase import Atoms
+    from ase.md import Langevin
+    import ase.units as ase_units
+    from backends import get_calculator_factory
+
+    temperature, friction, timestep = _md_settings(temperature, friction, timestep)
+    total_charge = float(data_input.total_charge.magnitude.reshape(-1)[0])
+    spin_multiplicity = int(round(float(data_input.spin_multiplicity.reshape(-1)[0])))
+    _check_single_conformer(data_input)
+    n_atoms = data_input.geometry.shape[1]
+
+    mol = Atoms(
+        numbers=data_input.atomic_numbers.reshape(-1),
+        positions=data_input.geometry.to("angstrom").magnitude.reshape(n_atoms, 3),
+    )
+
+    if calculator_factory is None:
+        calculator_factory = get_calculator_factory(backend, method)
+    property_backend = calculator_factory.create(
+        mol.get_atomic_numbers(),
+        mol.get_positions(),
+        total_charge,
+        spin_multiplicity,
+        property_accuracy,
+    )
+    md_backend = calculator_factory.create(
+        mol.get_atomic_numbers(),
+        mol.get_positions(),
+        total_charge,
+        spin_multiplicity,
+        md_accuracy,
+    )
+
+    start = perf_counter()
+    get_xtb_properties(mol, cache=cache, backend=property_backend)
+    single_point_cost = perf_counter() - start
+
+    mol.calc = md_backend.ase_calculator()
+    dyn = Langevin(
+        mol,
+        timestep=timestep.to("fs").m * ase_units.fs,
+        temperature_K=temperature.to("K").m,
+        friction=friction.to("1/fs").m / ase_units.fs,
+    )
+    # the first force call includes setup of the calculator, so is not timed
+    dyn.run(1)
+    start = perf_counter()
+    dyn.run(number_of_steps)
+    step_cost = (perf_counter() - start) / number_of_steps
+
+    # a cache hit makes the single point look free; it is never cheaper than an md step at lower accuracy
+    single_point_cost = max(single_point_cost, step_cost)
+
+    return step_cost, single_point_cost